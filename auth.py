@@ -0,0 +1,155 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import jwt
+from sqlalchemy import select, update
+
+from caching import BoundedLRUCache
+from models.models import User as DBUser, AsyncSessionLocal, get_async_engine
+
+# JWT Define a secret key (change this to a secure random value in production)
+SECRET_KEY = os.getenv("RAYZE_KEY")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 300
+
+# Decoded tokens are reused for AUTH_CACHE_TTL seconds, and token versions are re-read
+# from the users table as often, which bounds how long a revoked token keeps working
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10000))
+
+
+class InvalidToken(Exception):
+    """The token is malformed, expired, revoked or belongs to a deleted user."""
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The user a token was issued to, as recorded in its claims."""
+    id: int
+    name: str
+    role: Optional[str]
+    client_id: Optional[int]
+    ver: int
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, name=user.name, role=user.role, client_id=user.client_id, ver=user.token_version or 0)
+
+    def claims(self) -> dict:
+        return {"sub": self.name, "id": self.id, "role": self.role, "client_id": self.client_id, "ver": self.ver}
+
+
+# token -> (Principal, expiry as a unix timestamp)
+principal_cache = BoundedLRUCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL)
+
+
+class TokenVersions:
+    """
+    Current token_version of every user, reloaded from the users table at
+    most once per `ttl` seconds, so checking a token for revocation is a dict
+    lookup. A user not seen since the last reload is looked up by id, and ids
+    with no user (deleted users, forged ids) are remembered as missing for
+    `ttl` seconds, so such tokens never trigger a full reload.
+    """
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL):
+        self.ttl = ttl
+        self._versions: Dict[int, int] = {}
+        self._missing = BoundedLRUCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=ttl)
+        self._loaded_at = None
+        self._lock = None
+
+    async def _reload(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._lock:
+            # Another request reloaded while this one waited
+            if self._loaded_at is not None and self._loaded_at >= started:
+                return
+            async with AsyncSessionLocal(bind=get_async_engine()) as db:
+                result = await db.execute(select(DBUser.id, DBUser.token_version))
+                self._versions = {row.id: row.token_version or 0 for row in result}
+            self._loaded_at = time.monotonic()
+
+    async def _lookup(self, user_id: int) -> None:
+        async with AsyncSessionLocal(bind=get_async_engine()) as db:
+            version = (await db.execute(select(DBUser.token_version).where(DBUser.id == user_id))).first()
+        if version is None:
+            self._missing.set(user_id, True)
+        else:
+            self._versions[user_id] = version.token_version or 0
+
+    async def current(self, user_id: int) -> Optional[int]:
+        """The user's token version, or None if the user no longer exists."""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            await self._reload()
+        elif user_id not in self._versions and not self._missing.get(user_id, False):
+            await self._lookup(user_id)
+        return self._versions.get(user_id)
+
+    def bump(self, user_id: int, version: int) -> None:
+        """Record a version this worker just wrote, ahead of the next reload."""
+        self._versions[user_id] = version
+
+
+token_versions = TokenVersions()
+
+
+# Function to generate access token
+def create_access_token(data: dict, expires_delta: timedelta):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + expires_delta
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+
+def issue_token(user) -> str:
+    """An access token carrying the user's id, role, client and token version."""
+    return create_access_token(Principal.from_user(user).claims(), timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+async def authenticate_token(token: str) -> Principal:
+    """
+    Resolve a bearer token to its Principal without querying the database:
+    the signature is checked once per AUTH_CACHE_TTL and revocation against
+    the in-memory token versions. Raises InvalidToken.
+    """
+    entry = principal_cache.get(token)
+    if entry is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+        if payload.get("sub") is None or payload.get("id") is None:
+            # Tokens issued before the id/role claims were added
+            raise InvalidToken("Token is missing claims")
+        principal = Principal(id=payload["id"], name=payload["sub"], role=payload.get("role"),
+                              client_id=payload.get("client_id"), ver=payload.get("ver", 0))
+        entry = (principal, payload["exp"])
+        principal_cache.set(token, entry)
+    principal, expires = entry
+    if expires <= time.time():
+        principal_cache.pop(token)
+        raise InvalidToken("Token has expired")
+    current = await token_versions.current(principal.id)
+    if current is None or principal.ver < current:
+        raise InvalidToken("Token has been revoked")
+    return principal
+
+
+async def revoke_tokens(user_id: int) -> Optional[int]:
+    """Invalidate every token issued to the user so far; returns the new version, or None if there is no such user."""
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        result = await db.execute(update(DBUser).where(DBUser.id == user_id)
+                                  .values(token_version=DBUser.token_version + 1).returning(DBUser.token_version))
+        version = result.scalar()
+        await db.commit()
+    if version is not None:
+        token_versions.bump(user_id, version)
+    return version
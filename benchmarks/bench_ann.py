@@ -0,0 +1,70 @@
+"""
+Recall and latency of the IVF candidate index against exact search.
+
+Builds a throwaway store of synthetic, clustered unit vectors (the shape of
+CV embeddings: many candidates around a smaller number of skill profiles),
+then compares top-k results and per-query latency for several nprobe values.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_ann --rows 50000 --dim 384 --queries 200 --top-k 10
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from evaluation.ann import IVFIndex
+from evaluation.embeddings import EmbeddingStore, normalize, top_k_similar
+
+
+def clustered_vectors(centres: np.ndarray, rows: int, noise: float, rng) -> np.ndarray:
+    labels = rng.integers(0, len(centres), rows)
+    return normalize(centres[labels] + noise * rng.standard_normal((rows, centres.shape[1])) / np.sqrt(centres.shape[1]))
+
+
+def timed(search, queries):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.8, help="spread of vectors around their cluster centre")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centres = normalize(rng.standard_normal((args.clusters, args.dim)))
+    vectors = clustered_vectors(centres, args.rows, args.noise, rng)
+    queries = clustered_vectors(centres, args.queries, args.noise, rng)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = EmbeddingStore("bench", directory)
+        store.upsert(list(range(args.rows)), vectors)
+        index = IVFIndex(store)
+        start = time.perf_counter()
+        index.train()
+        print(f"trained {index.stats()['lists']} lists over {args.rows} x {args.dim} in {time.perf_counter() - start:.2f}s")
+
+        _, matrix, _ = store.snapshot()
+        exact, exact_ms = timed(lambda q: set(top_k_similar(q, matrix, args.top_k)[0].tolist()), queries)
+        print(f"{'search':<14}{'recall@' + str(args.top_k):>12}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>10}")
+        exact_p50 = statistics.median(exact_ms)
+        print(f"{'exact':<14}{1.0:>12.3f}{exact_p50:>10.2f}{statistics.quantiles(exact_ms, n=20)[18]:>10.2f}{1.0:>10.1f}")
+        for nprobe in args.nprobe:
+            found, ann_ms = timed(lambda q: {i for i, _ in index.search(q, args.top_k, nprobe)}, queries)
+            recall = sum(len(a & e) for a, e in zip(found, exact)) / (args.top_k * len(queries))
+            p50 = statistics.median(ann_ms)
+            print(f"{'ivf nprobe=' + str(nprobe):<14}{recall:>12.3f}{p50:>10.2f}"
+                  f"{statistics.quantiles(ann_ms, n=20)[18]:>10.2f}{exact_p50 / p50:>10.1f}")
@@ -0,0 +1,80 @@
+"""
+Measure the /list_client_invoices payload size and latency with and without
+the summary projection that defers inv_html and explain_str.
+
+Usage (from the repo root):
+    DB_URL=postgresql://... python -m benchmarks.bench_client_invoices --seed 2000
+
+Without DB_URL a local SQLite file is used. Seeding only runs when the
+client_invoices table is empty, so point DB_URL at a scratch database.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+os.environ.setdefault("DB_URL", "sqlite:///bench_client_invoices.db")
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import defer
+from models.models import SessionLocal, ClientInvoice
+from models.migrations import migrate
+
+TEMPLATE = Path("content") / "invoice_template.html"
+
+
+def seed(db, rows):
+    if db.query(ClientInvoice.id).first():
+        return
+    html = TEMPLATE.read_text()
+    explain = "".join(
+        f"<tr><td>Engineer {n}</td><td>Technology Services</td><td>160</td><td>$100.00</td><td>$16,000.00</td></tr>"
+        for n in range(5)
+    )
+    db.add_all([
+        ClientInvoice(inv_date=f"2024-{i % 12 + 1:02d}-28", due_date="2024-12-31", period_start="2024-01-01",
+                      period_end="2024-01-31", client_id=i % 50, client_name=f"Client {i % 50}",
+                      client_contact="Contact", client_email="billing@example.com", client_addr="Address",
+                      client_phone="555-0100", explain_str=explain, inv_html=html.replace("invoice_table", explain),
+                      inv_hash=f"bench_{i}", inv_value=16000.0, inv_status="SENT")
+        for i in range(rows)
+    ])
+    db.commit()
+
+
+def list_payload(summary):
+    db = SessionLocal()
+    try:
+        query = db.query(ClientInvoice)
+        if summary:
+            query = query.options(defer(ClientInvoice.inv_html), defer(ClientInvoice.explain_str))
+        invoices = query.order_by(ClientInvoice.inv_date.desc()).all()
+        return json.dumps(jsonable_encoder(invoices)).encode('utf-8')
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=2000, help="client invoices to seed into an empty table")
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    migrate()
+    db = SessionLocal()
+    try:
+        seed(db, args.seed)
+    finally:
+        db.close()
+
+    print(f"{'mode':<10}{'payload KB':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, summary in (("full", False), ("summary", True)):
+        timings = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            payload = list_payload(summary)
+            timings.append((time.perf_counter() - start) * 1000)
+        p95 = statistics.quantiles(timings, n=20)[18]
+        print(f"{mode:<10}{len(payload) / 1024:>12.1f}{statistics.median(timings):>10.2f}{p95:>10.2f}")
@@ -0,0 +1,129 @@
+"""
+Compare the legacy eight-query /get_console_data implementation with the
+single-statement console snapshot.
+
+Usage (from the repo root):
+    DB_URL=postgresql://... python -m benchmarks.bench_console_data --seed 5000
+
+Without DB_URL a local SQLite file is used. Seeding only runs when the
+candidates table is empty, so point DB_URL at a scratch database.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DB_URL", "sqlite:///bench_console.db")
+
+from sqlalchemy import event, func
+from models.models import engine, SessionLocal, Candidate, Transaction, SubmitCVRole, OpenRoles, Invoice
+from models.migrations import migrate
+from models.console import console_snapshot
+
+
+def legacy_console_data(db, since):
+    payroll_candidates = db.query(func.count(Candidate.id)).filter(Candidate.status == 'Hired').scalar()
+    hired_last_month = db.query(func.count(Transaction.id)).filter(Transaction.start_date >= since).scalar()
+    submit_cvs = db.query(func.count(SubmitCVRole.id))\
+        .join(OpenRoles, SubmitCVRole.open_roles_id == OpenRoles.id)\
+        .filter(OpenRoles.status == 'Open').scalar()
+    submit_last_month = db.query(func.count(SubmitCVRole.id))\
+        .join(OpenRoles, SubmitCVRole.open_roles_id == OpenRoles.id)\
+        .filter(OpenRoles.status == 'Open')\
+        .filter(SubmitCVRole.submitted_on >= since).scalar()
+    active_roles = db.query(func.count(OpenRoles.id)).filter(OpenRoles.status == 'Open').scalar()
+    roles_last_month = db.query(func.count(OpenRoles.id))\
+        .filter(OpenRoles.status == 'Open')\
+        .filter(OpenRoles.posted_on >= since).scalar()
+    max_invoice_date = db.query(func.max(Invoice.inv_date)).scalar()
+    invoice_hours = 0
+    if max_invoice_date:
+        invoice_hours = db.query(func.sum(Invoice.hours_worked))\
+            .filter(Invoice.inv_date == max_invoice_date).scalar() or 0
+    return {
+        "payroll_candidates": payroll_candidates or 0,
+        "hired_last_month": hired_last_month or 0,
+        "submit_cvs": submit_cvs or 0,
+        "submit_last_month": submit_last_month or 0,
+        "active_roles": active_roles or 0,
+        "roles_last_month": roles_last_month or 0,
+        "max_invoice_date": max_invoice_date if max_invoice_date else None,
+        "invoice_hours": invoice_hours
+    }
+
+
+def seed(db, rows):
+    if db.query(Candidate.id).first():
+        return
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    db.add_all([
+        Candidate(name=f"bench_candidate_{i}", status=rng.choice(['Hired', 'Submitted', 'Rejected']))
+        for i in range(rows)
+    ])
+    db.add_all([
+        OpenRoles(role_desc=f"bench_role_{i}", status=rng.choice(['Open', 'Closed']),
+                  posted_on=now - timedelta(days=rng.randint(0, 365)))
+        for i in range(rows // 10)
+    ])
+    db.flush()
+    db.add_all([
+        Transaction(candidate_id=rng.randint(1, rows), start_date=now - timedelta(days=rng.randint(0, 365)))
+        for _ in range(rows)
+    ])
+    db.add_all([
+        SubmitCVRole(open_roles_id=rng.randint(1, rows // 10), candidates_id=rng.randint(1, rows),
+                     submitted_on=now - timedelta(days=rng.randint(0, 365)))
+        for _ in range(rows * 2)
+    ])
+    db.add_all([
+        Invoice(inv_date=f"2024-{rng.randint(1, 12):02d}-28", hours_worked=rng.choice([120, 160, 168]))
+        for _ in range(rows)
+    ])
+    db.commit()
+
+
+def measure(fn, db, since, iterations):
+    statements = []
+
+    def count_statement(*args):
+        statements.append(1)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    timings = []
+    try:
+        for _ in range(iterations):
+            statements.clear()
+            start = time.perf_counter()
+            result = fn(db, since)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    p95 = statistics.quantiles(timings, n=20)[18]
+    return result, len(statements), statistics.median(timings), p95
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=5000, help="rows to seed into an empty database")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    migrate()
+    db = SessionLocal()
+    try:
+        seed(db, args.seed)
+        since = datetime.utcnow() - timedelta(days=31)
+        legacy = measure(legacy_console_data, db, since, args.iterations)
+        snapshot = measure(console_snapshot, db, since, args.iterations)
+    finally:
+        db.close()
+
+    if legacy[0] != snapshot[0]:
+        raise SystemExit(f"Result mismatch:\n legacy   {legacy[0]}\n snapshot {snapshot[0]}")
+
+    print(f"{'implementation':<16}{'round trips':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, (_, trips, p50, p95) in (("legacy", legacy), ("snapshot", snapshot)):
+        print(f"{name:<16}{trips:>12}{p50:>10.2f}{p95:>10.2f}")
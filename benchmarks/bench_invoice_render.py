@@ -0,0 +1,56 @@
+"""
+Microbenchmark for invoice rendering: the compiled, cached template against
+the legacy read-the-file-and-replace-ten-times approach.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_invoice_render --count 5000
+"""
+import argparse
+import time
+from pathlib import Path
+
+from invoice_templates import load_template, INVOICE_PLACEHOLDERS
+
+TEMPLATE = Path("content") / "invoice_template.html"
+
+VALUES = {
+    "total_due": "$16,000.00",
+    "due_date": "2024-02-15",
+    "start_date": "2024-01-01",
+    "end_date": "2024-01-31",
+    "invoice_title": "Technology Services",
+    "invoice_num": "1042",
+    "invoice_date": "2024-01-31",
+    "client_name": "Example Client",
+    "invoice_table": "".join(
+        f"<tr><td>Engineer {n}</td><td>Technology Services</td><td>160</td><td>$100.00</td><td>$16,000.00</td></tr>"
+        for n in range(5)
+    ),
+    "rayze_logo": "content/rayze_logo.jpg",
+}
+
+
+def render_legacy(values):
+    with open(TEMPLATE, 'r') as file:
+        html_content = file.read()
+        for name in INVOICE_PLACEHOLDERS:
+            html_content = html_content.replace(name, values[name])
+    return html_content
+
+
+def render_compiled(values):
+    return load_template(TEMPLATE, INVOICE_PLACEHOLDERS).render(values)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=5000)
+    args = parser.parse_args()
+
+    for name, render in (("legacy", render_legacy), ("compiled", render_compiled)):
+        render(VALUES)
+        start = time.perf_counter()
+        for _ in range(args.count):
+            render(VALUES)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10}{args.count / elapsed:>12,.0f} invoices/sec")
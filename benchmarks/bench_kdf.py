@@ -0,0 +1,65 @@
+"""
+Size the scrypt cost factor for password hashing to a target login latency.
+
+Times one hash for each power-of-two N, picks the largest N whose median
+stays under --target-ms, then measures login throughput at that N with
+PASSWORD_HASH_WORKERS hashes in flight. Run it on the machine (dyno size)
+that serves logins and put the printed setting in the environment.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_kdf --target-ms 100 --runs 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passwords import PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P, PASSWORD_HASH_WORKERS, hash_password_sync
+
+
+def median_ms(n: int, r: int, p: int, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        hash_password_sync("correct horse battery staple", n, r, p)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def throughput(n: int, r: int, p: int, workers: int, logins: int) -> float:
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        await asyncio.gather(*[loop.run_in_executor(pool, hash_password_sync, "pw", n, r, p) for _ in range(logins)])
+        return logins / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target-ms", type=float, default=100, help="latency budget for one password hash")
+    parser.add_argument("--r", type=int, default=PASSWORD_SCRYPT_R)
+    parser.add_argument("--p", type=int, default=PASSWORD_SCRYPT_P)
+    parser.add_argument("--min-log2-n", type=int, default=10)
+    parser.add_argument("--max-log2-n", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS)
+    parser.add_argument("--logins", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"{'N':>10}{'memory MB':>12}{'p50 ms':>10}")
+    chosen = None
+    for log2_n in range(args.min_log2_n, args.max_log2_n + 1):
+        n = 2 ** log2_n
+        ms = median_ms(n, args.r, args.p, args.runs)
+        print(f"{n:>10}{128 * n * args.r / (1024 * 1024):>12.1f}{ms:>10.1f}")
+        if ms > args.target_ms:
+            break
+        chosen = n
+
+    if chosen is None:
+        print(f"even N={2 ** args.min_log2_n} exceeds {args.target_ms} ms; lower --min-log2-n or raise the target")
+    else:
+        rate = asyncio.run(throughput(chosen, args.r, args.p, args.workers, args.logins))
+        print(f"{rate:.1f} logins/s with {args.workers} hashing threads at N={chosen}")
+        print(f"PASSWORD_SCRYPT_N={chosen} PASSWORD_SCRYPT_R={args.r} PASSWORD_SCRYPT_P={args.p}")
@@ -0,0 +1,129 @@
+"""
+Cold-start cost of the app: `import main` time with a `python -X importtime`
+breakdown by module, and time from launching uvicorn to the first response.
+
+Each measurement runs in a fresh interpreter, as on a dyno boot. It exits
+non-zero when either median exceeds its budget (--import-budget-ms,
+--ttfr-budget-ms; 0 disables one) or when `import main` loads one of
+HEAVY_MODULES, which belong behind the handlers that use them. CI runs it
+on every push (.github/workflows/startup.yml).
+
+Usage (from the repo root):
+    python -m benchmarks.bench_startup --runs 5 --top 15
+    python -m benchmarks.bench_startup --import-budget-ms 1500 --ttfr-budget-ms 2500
+
+Without DB_URL a local SQLite file is named (startup never connects to it),
+and bucket storage defaults to the local backend, so no credentials are needed.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+os.environ.setdefault("DB_URL", "sqlite:///bench_startup.db")
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("RAYZE_KEY", "bench")
+
+# Medians measured on a small cloud VM are about 1.2 s for both; the budgets leave
+# room for slower CI runners but not for an eager torch or transformers import
+IMPORT_BUDGET_MS = 2000
+TTFR_BUDGET_MS = 3000
+# Modules only some endpoints need; importing any of them from main slows every worker boot
+HEAVY_MODULES = ("numpy", "torch", "transformers", "openai", "anthropic", "httpx", "PyPDF2")
+
+
+def import_breakdown():
+    """(total ms, [(cumulative ms, module)] for the modules main.py imports directly)."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        rows.append((len(name) - len(name.lstrip()), int(cumulative) / 1000, name.strip()))
+    main_depth, total = next((depth, ms) for depth, ms, name in rows if name == "main")
+    direct = [(ms, name) for depth, ms, name in rows if depth == main_depth + 2]
+    return total, sorted(direct, reverse=True)
+
+
+def heavy_imports() -> list:
+    """The HEAVY_MODULES that `import main` loads."""
+    check = f"import sys, main; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True).stdout.split()
+
+
+def import_ms() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], check=True, capture_output=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(path: str, timeout: float) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    response.read()
+                return (time.perf_counter() - start) * 1000
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+                time.sleep(0.01)
+        raise RuntimeError(f"no response from {path} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="modules to list in the import breakdown")
+    parser.add_argument("--path", default="/docs", help="endpoint for the first request; should not need the database")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS, help="0 disables the check")
+    parser.add_argument("--ttfr-budget-ms", type=float, default=TTFR_BUDGET_MS, help="0 disables the check")
+    args = parser.parse_args()
+
+    total, direct = import_breakdown()
+    print(f"import main: {total:.0f} ms (-X importtime, cumulative)")
+    for ms, name in direct[:args.top]:
+        print(f"  {ms:>8.1f} ms  {name}")
+
+    imports = [import_ms() for _ in range(args.runs)]
+    ttfr = [time_to_first_request(args.path, args.timeout) for _ in range(args.runs)]
+    import_p50, ttfr_p50 = statistics.median(imports), statistics.median(ttfr)
+    print(f"{'':<24}{'p50 ms':>10}{'max ms':>10}")
+    print(f"{'python -c import main':<24}{import_p50:>10.0f}{max(imports):>10.0f}")
+    print(f"{'first request ' + args.path:<24}{ttfr_p50:>10.0f}{max(ttfr):>10.0f}")
+
+    heavy = heavy_imports()
+    print(f"heavy modules loaded by import main: {', '.join(heavy) or 'none'}")
+
+    failed = []
+    if args.import_budget_ms and import_p50 > args.import_budget_ms:
+        failed.append(f"import {import_p50:.0f} ms > budget {args.import_budget_ms:.0f} ms")
+    if args.ttfr_budget_ms and ttfr_p50 > args.ttfr_budget_ms:
+        failed.append(f"first request {ttfr_p50:.0f} ms > budget {args.ttfr_budget_ms:.0f} ms")
+    if heavy:
+        failed.append(f"import main loads {', '.join(heavy)}")
+    if failed:
+        print("over budget: " + "; ".join(failed))
+        sys.exit(1)
@@ -0,0 +1,72 @@
+"""
+Fixed-concurrency load test for the running API.
+
+Keeps `--concurrency` requests in flight against each path for `--duration`
+seconds and reports requests/sec and latency percentiles, e.g.:
+
+    python -m benchmarks.load_test --base-url http://localhost:8000 \
+        --token "$RAYZE_TOKEN" --concurrency 32 \
+        /get_console_data /get_console_data_by_client/1 /list_clients
+
+Run it before and after a change against the same database to compare
+throughput at the same concurrency.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def run_path(client: httpx.AsyncClient, path: str, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98]
+    }
+
+
+async def main(args):
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=30) as client:
+        print(f"{'path':<40}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for path in args.paths:
+            result = await run_path(client, path, args.concurrency, args.duration)
+            print(f"{result['path']:<40}{result['requests']:>10}{result['errors']:>8}{result['rps']:>10.1f}"
+                  f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", default=None, help="bearer token for protected endpoints")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per path")
+    asyncio.run(main(parser.parse_args()))
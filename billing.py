@@ -0,0 +1,343 @@
+import calendar
+import hashlib
+import html
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Callable, Iterable, List, Optional
+from sqlalchemy import insert, select, update, or_, func
+from sqlalchemy.orm import Session
+from models.models import Transaction, Invoice, Candidate, Client, ClientInvoice, BillingJobStatus, SessionLocal
+
+# Hours billed per month when no timesheet has been recorded
+DEFAULT_HOURS_WORKED = 160
+DATE_FORMAT = '%Y-%m-%d'
+
+# Month-end billing: clients invoiced per database transaction, and render threads
+BILLING_BATCH_SIZE = int(os.getenv("BILLING_BATCH_SIZE", 50))
+BILLING_WORKERS = int(os.getenv("BILLING_WORKERS", 4))
+
+
+def _as_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value[:10], DATE_FORMAT).date()
+
+
+def month_periods(start: date, end: date) -> List[tuple]:
+    """
+    Split [start, end] into calendar months.
+
+    Returns (period_start, period_end, inv_date) per month, where the invoice
+    is dated on the last day of its month and the first and last periods are
+    clipped to the transaction dates.
+    """
+    periods = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        month_end = date(year, month, calendar.monthrange(year, month)[1])
+        periods.append((max(start, date(year, month, 1)), min(end, month_end), month_end))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+
+def invoice_rows(transaction: Transaction, invoiced=()) -> List[dict]:
+    """
+    Build the invoice rows for every month of a transaction that does not
+    overlap one of the already `invoiced` (period_start, period_end) ranges.
+    """
+    start = _as_date(transaction.start_date)
+    end = _as_date(transaction.end_date)
+    if not start or not end or end < start:
+        return []
+    rows = []
+    for period_start, period_end, inv_date in month_periods(start, end):
+        if any(invoiced_start <= period_end and invoiced_end >= period_start for invoiced_start, invoiced_end in invoiced):
+            continue
+        rows.append({
+            "inv_date": inv_date.strftime(DATE_FORMAT),
+            "candidate_id": transaction.candidate_id,
+            "period_start": period_start.strftime(DATE_FORMAT),
+            "period_end": period_end.strftime(DATE_FORMAT),
+            "txn_id": transaction.id,
+            "hours_worked": DEFAULT_HOURS_WORKED,
+            "inv_value": (transaction.client_price or 0) * DEFAULT_HOURS_WORKED,
+            "inv_status": "PRE"
+        })
+    return rows
+
+
+def active_transactions(db: Session, as_of: datetime = None) -> List[Transaction]:
+    """Transactions that have started and not yet ended as of `as_of`."""
+    as_of = as_of or datetime.utcnow()
+    return db.execute(
+        select(Transaction)
+        .where(Transaction.start_date <= as_of)
+        .where(or_(Transaction.end_date.is_(None), Transaction.end_date >= as_of))
+        .order_by(Transaction.id)
+    ).scalars().all()
+
+
+def generate_invoices(db: Session, transaction_ids: Optional[Iterable[int]] = None, all_active: bool = False) -> dict:
+    """
+    Write the monthly invoices for the given transactions (or every active one)
+    with a single multi-row INSERT in one transaction.
+
+    Months overlapping an existing invoice of the transaction are skipped, so a
+    run can be repeated safely at month end. Matching on overlap rather than
+    on period_start also recognises invoices from the old generator, whose
+    periods drifted by 32 days a month instead of starting on the 1st.
+    """
+    if all_active:
+        transactions = active_transactions(db)
+    else:
+        transaction_ids = sorted(set(transaction_ids or []))
+        transactions = db.execute(
+            select(Transaction).where(Transaction.id.in_(transaction_ids)).order_by(Transaction.id)
+        ).scalars().all() if transaction_ids else []
+
+    found_ids = [transaction.id for transaction in transactions]
+    existing = {}
+    if found_ids:
+        for txn_id, period_start, period_end in db.execute(
+            select(Invoice.txn_id, Invoice.period_start, Invoice.period_end).where(Invoice.txn_id.in_(found_ids))
+        ):
+            invoiced_start = _as_date(period_start)
+            if invoiced_start:
+                existing.setdefault(txn_id, []).append((invoiced_start, _as_date(period_end) or invoiced_start))
+
+    rows = []
+    for transaction in transactions:
+        rows.extend(invoice_rows(transaction, existing.get(transaction.id, ())))
+
+    if rows:
+        db.execute(insert(Invoice), rows)
+    db.commit()
+
+    missing = sorted(set(transaction_ids or []) - set(found_ids)) if not all_active else []
+    return {
+        "invoices_written": len(rows),
+        "transactions": len(transactions),
+        "missing_transaction_ids": missing
+    }
+
+
+def invoice_hash(inv_id: int, client_id: int, inv_date: str) -> str:
+    """The public, URL-safe identifier of a client invoice used by /get_invoice."""
+    return hashlib.sha256(f"{inv_id}_{client_id}_{inv_date}".encode('utf-8')).hexdigest()
+
+
+class BillingJob:
+    """
+    Progress of one month-end billing run. The worker thread updates it in
+    memory and saves it to billing_jobs after every batch, so the status
+    endpoint can answer from any worker.
+    """
+
+    def __init__(self, period_start: str, period_end: str, inv_date: str, due_date: str):
+        self.id = uuid.uuid4().hex
+        self.period_start = period_start
+        self.period_end = period_end
+        self.inv_date = inv_date
+        self.due_date = due_date
+        self.status = "queued"
+        self.total_clients = 0
+        self.completed_clients = 0
+        self.skipped_clients = 0
+        self.invoice_ids = []
+        self.errors = []
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "period_start": self.period_start,
+            "period_end": self.period_end,
+            "inv_date": self.inv_date,
+            "total_clients": self.total_clients,
+            "completed_clients": self.completed_clients,
+            "skipped_clients": self.skipped_clients,
+            "progress": round(self.completed_clients / self.total_clients, 4) if self.total_clients else (1.0 if self.status == "completed" else 0.0),
+            "invoice_ids": list(self.invoice_ids),
+            "errors": list(self.errors),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+    @classmethod
+    def from_record(cls, record: BillingJobStatus) -> "BillingJob":
+        job = cls(record.period_start, record.period_end, record.inv_date, record.due_date)
+        job.id = record.id
+        job.status = record.status
+        job.total_clients = record.total_clients
+        job.completed_clients = record.completed_clients
+        job.skipped_clients = record.skipped_clients
+        job.invoice_ids = list(record.invoice_ids or [])
+        job.errors = list(record.errors or [])
+        job.created_at = record.created_at
+        job.finished_at = record.finished_at
+        return job
+
+
+# Jobs running in this process; a job is dropped once its final status is saved,
+# after which get_billing_job reads it back from billing_jobs
+_running = {}
+_jobs_lock = threading.Lock()
+
+
+def save_billing_job(db: Session, job: BillingJob) -> None:
+    db.merge(BillingJobStatus(
+        id=job.id, status=job.status, period_start=job.period_start, period_end=job.period_end,
+        inv_date=job.inv_date, due_date=job.due_date, total_clients=job.total_clients,
+        completed_clients=job.completed_clients, skipped_clients=job.skipped_clients,
+        invoice_ids=list(job.invoice_ids), errors=list(job.errors),
+        created_at=job.created_at, finished_at=job.finished_at
+    ))
+    db.commit()
+
+
+def get_billing_job(job_id: str) -> Optional[BillingJob]:
+    with _jobs_lock:
+        job = _running.get(job_id)
+    if job:
+        return job
+    db = SessionLocal()
+    try:
+        record = db.get(BillingJobStatus, job_id)
+        return BillingJob.from_record(record) if record else None
+    finally:
+        db.close()
+
+
+def _client_invoice_rows(db: Session, job: BillingJob) -> List[dict]:
+    """
+    Build one client invoice row per client with transactions active during
+    the job's period, skipping clients already invoiced for that period.
+    """
+    transactions = db.execute(
+        select(Transaction, Candidate.name, Client)
+        .join(Candidate, Transaction.candidate_id == Candidate.id)
+        .join(Client, Transaction.client_id == Client.id)
+        .where(Transaction.start_date <= datetime.strptime(job.period_end, DATE_FORMAT))
+        .where(or_(Transaction.end_date.is_(None), Transaction.end_date >= datetime.strptime(job.period_start, DATE_FORMAT)))
+        .order_by(Client.id, Transaction.id)
+    ).all()
+
+    # Hours already recorded on the per-transaction invoices for this period
+    hours = dict(db.execute(
+        select(Invoice.txn_id, func.sum(Invoice.hours_worked))
+        .where(Invoice.inv_date >= job.period_start, Invoice.inv_date <= job.period_end)
+        .group_by(Invoice.txn_id)
+    ).all())
+
+    invoiced = set(db.execute(
+        select(ClientInvoice.client_id)
+        .where(ClientInvoice.period_start == job.period_start, ClientInvoice.period_end == job.period_end)
+    ).scalars())
+
+    by_client = {}
+    skipped = set()
+    for transaction, candidate_name, client in transactions:
+        if client.id in invoiced:
+            skipped.add(client.id)
+            continue
+        entry = by_client.setdefault(client.id, {"client": client, "lines": [], "total": 0.0})
+        hours_worked = hours.get(transaction.id) or DEFAULT_HOURS_WORKED
+        rate = transaction.client_price or 0
+        amount = rate * hours_worked
+        entry["total"] += amount
+        entry["lines"].append(
+            f"<tr><td>{html.escape(candidate_name or '')}</td><td>Technology Services</td><td>{hours_worked:g}</td>"
+            f"<td>${rate:,.2f}</td><td>${amount:,.2f}</td></tr>"
+        )
+    job.skipped_clients = len(skipped)
+
+    return [{
+        "inv_date": job.inv_date,
+        "due_date": job.due_date,
+        "period_start": job.period_start,
+        "period_end": job.period_end,
+        "client_id": client_id,
+        "client_name": entry["client"].name,
+        "client_contact": entry["client"].client_mgr,
+        "client_email": entry["client"].client_email,
+        "client_addr": entry["client"].client_addr,
+        "client_phone": entry["client"].client_phone,
+        "explain_str": "\n".join(entry["lines"]),
+        "inv_value": entry["total"],
+        "inv_status": "PRE"
+    } for client_id, entry in by_client.items()]
+
+
+def run_month_end_job(job: BillingJob, render: Callable[[int, ClientInvoice], str]) -> None:
+    """
+    Invoice every client with active transactions for the job's period.
+
+    Clients are processed in batches of BILLING_BATCH_SIZE: each batch is
+    inserted with one multi-row INSERT .. RETURNING, rendered across the
+    worker pool, and written back with one executemany UPDATE before commit.
+    The job's progress is saved after every batch.
+    """
+    job.status = "running"
+    db = SessionLocal()
+    try:
+        rows = _client_invoice_rows(db, job)
+        job.total_clients = len(rows)
+        save_billing_job(db, job)
+        with ThreadPoolExecutor(max_workers=BILLING_WORKERS) as pool:
+            for offset in range(0, len(rows), BILLING_BATCH_SIZE):
+                batch = rows[offset:offset + BILLING_BATCH_SIZE]
+                try:
+                    inv_ids = db.execute(
+                        insert(ClientInvoice).returning(ClientInvoice.id, sort_by_parameter_order=True), batch
+                    ).scalars().all()
+                    pages = list(pool.map(lambda args: render(args[0], ClientInvoice(**args[1])), zip(inv_ids, batch)))
+                    db.execute(update(ClientInvoice), [
+                        {"id": inv_id, "inv_html": page, "inv_hash": invoice_hash(inv_id, row["client_id"], row["inv_date"])}
+                        for inv_id, page, row in zip(inv_ids, pages, batch)
+                    ])
+                    db.commit()
+                    job.invoice_ids.extend(inv_ids)
+                except Exception as e:
+                    db.rollback()
+                    job.errors.append(f"clients {[row['client_id'] for row in batch]}: {str(e)}")
+                job.completed_clients += len(batch)
+                save_billing_job(db, job)
+        job.status = "completed" if not job.errors else "completed_with_errors"
+    except Exception as e:
+        db.rollback()
+        job.errors.append(str(e))
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.utcnow()
+        try:
+            save_billing_job(db, job)
+        except Exception as e:
+            db.rollback()
+            print(f"Error saving status of billing job {job.id}: {str(e)}")
+        db.close()
+        with _jobs_lock:
+            _running.pop(job.id, None)
+
+
+def start_month_end_job(period_start: str, period_end: str, inv_date: str, due_date: str,
+                        render: Callable[[int, ClientInvoice], str]) -> BillingJob:
+    """Save a month-end billing job as queued and run it on a background thread."""
+    job = BillingJob(period_start, period_end, inv_date, due_date)
+    db = SessionLocal()
+    try:
+        save_billing_job(db, job)
+    finally:
+        db.close()
+    with _jobs_lock:
+        _running[job.id] = job
+    threading.Thread(target=run_month_end_job, args=(job, render), daemon=True, name=f"billing-{job.id}").start()
+    return job
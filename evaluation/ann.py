@@ -0,0 +1,200 @@
+import math
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from evaluation.embeddings import (EmbeddingStore, candidate_store, role_store, file_lock, file_stamp, normalize,
+                                   replace_file, top_k_similar)
+
+# IVF settings: lists to partition vectors into (0 picks sqrt(N)) and lists scanned per query
+ANN_NLIST = int(os.getenv("ANN_NLIST", 0))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", 8))
+# Below this many vectors exact search is cheap enough and no index is trained
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", 2000))
+# Retrain the centroids once the store has grown this much since the last training
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", 2.0))
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLE_PER_LIST = 256
+ASSIGN_CHUNK = 8192
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of `vectors`; returns k unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(vectors if len(vectors) <= k * KMEANS_SAMPLE_PER_LIST
+                        else vectors[np.sort(rng.choice(len(vectors), k * KMEANS_SAMPLE_PER_LIST, replace=False))],
+                        dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        sums[filled] = np.add.reduceat(sample[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled])
+        # Reseed empty lists from random points so every list stays in use
+        if not filled.all():
+            sums[~filled] = sample[rng.choice(len(sample), int((~filled).sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid of each vector, computed in chunks to bound memory."""
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        out[start:start + ASSIGN_CHUNK] = np.argmax(np.asarray(vectors[start:start + ASSIGN_CHUNK]) @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over an EmbeddingStore.
+
+    Stored vectors are partitioned among k-means centroids; a query scores the
+    centroids, then scans only the rows in the `nprobe` closest lists. The
+    centroids and per-row list assignments live next to the store in
+    <kind>.ivf.npz. Rows the index has not seen yet (added by another worker
+    or straight to the store) are assigned on the next search. Small stores
+    are searched exactly.
+
+    Like the store, the index file is only rewritten under an exclusive flock
+    (<kind>.ivf.lock), re-read inside the lock, and swapped in with
+    os.replace; readers load it under a shared lock.
+    """
+
+    def __init__(self, store: EmbeddingStore, nprobe: int = ANN_NPROBE):
+        self.store = store
+        self.nprobe = nprobe
+        self.path = os.path.join(store.directory, f"{store.kind}.ivf.npz")
+        self.lock_path = os.path.join(store.directory, f"{store.kind}.ivf.lock")
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._order = None
+        self._offsets = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> None:
+        # The caller holds the index's file lock
+        self._stamp = file_stamp(self.path)
+        if self._stamp is None:
+            self.centroids, self.assignments, self.trained_rows = None, np.zeros(0, dtype=np.int32), 0
+        else:
+            with np.load(self.path) as saved:
+                self.centroids = saved["centroids"]
+                self.assignments = saved["assignments"]
+                self.trained_rows = int(saved["trained_rows"])
+        self._build_lists()
+
+    def _save(self) -> None:
+        # The caller holds the index's file lock exclusively
+        replace_file(self.path, lambda f: np.savez(f, centroids=self.centroids, assignments=self.assignments,
+                                                   trained_rows=self.trained_rows))
+        self._stamp = file_stamp(self.path)
+
+    def _build_lists(self) -> None:
+        # CSR layout: rows of list l are _order[_offsets[l]:_offsets[l + 1]]
+        if self.centroids is None:
+            self._order = self._offsets = None
+            return
+        self._order = np.argsort(self.assignments, kind="stable")
+        self._offsets = np.searchsorted(self.assignments[self._order], np.arange(len(self.centroids) + 1))
+
+    def _train(self, matrix: np.ndarray) -> None:
+        nlist = ANN_NLIST or max(1, int(math.sqrt(len(matrix))))
+        self.centroids = kmeans(matrix, min(nlist, len(matrix)))
+        self.assignments = assign(matrix, self.centroids)
+        self.trained_rows = len(matrix)
+        self._save()
+        self._build_lists()
+
+    def _pending(self, matrix: Optional[np.ndarray]) -> Optional[str]:
+        """"train" or "extend" when the assignments do not cover every stored row, else None."""
+        rows = 0 if matrix is None else len(matrix)
+        if rows < ANN_MIN_ROWS:
+            return None
+        if (self.centroids is None or self.centroids.shape[1] != matrix.shape[1]
+                or len(self.assignments) > rows or rows > self.trained_rows * ANN_RETRAIN_GROWTH):
+            return "train"
+        return "extend" if len(self.assignments) < rows else None
+
+    def _sync(self, matrix: Optional[np.ndarray]) -> None:
+        """Train, retrain or extend the assignments so they cover every stored row."""
+        pending = self._pending(matrix)
+        if pending == "train":
+            self._train(matrix)
+        elif pending == "extend":
+            self.assignments = np.concatenate([self.assignments, assign(matrix[len(self.assignments):], self.centroids)])
+            self._save()
+            self._build_lists()
+
+    def train(self) -> dict:
+        """Retrain the centroids from every stored vector."""
+        with self._lock:
+            with file_lock(self.lock_path, exclusive=True):
+                self._read()
+                _, matrix, _ = self.store.snapshot()
+                if matrix is not None and len(matrix):
+                    self._train(matrix)
+            return self.stats()
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        """Store (or replace) vectors and file them under their nearest lists."""
+        self.store.upsert(ids, vectors)
+        with self._lock, file_lock(self.lock_path, exclusive=True):
+            # Snapshot inside the lock so the index never runs ahead of the rows it was built from
+            self._read()
+            _, matrix, rows = self.store.snapshot()
+            if self.centroids is None or self.centroids.shape[1] != matrix.shape[1]:
+                self._sync(matrix)
+                return
+            previous = len(self.assignments)
+            if previous < len(matrix):
+                self.assignments = np.concatenate([self.assignments, np.zeros(len(matrix) - previous, dtype=np.int32)])
+            # The replaced rows plus any appended since the index last looked
+            changed = np.union1d(np.array([rows[int(i)] for i in ids], dtype=np.int64), np.arange(previous, len(matrix)))
+            self.assignments[changed] = assign(matrix[changed], self.centroids)
+            self._save()
+            self._build_lists()
+            self._sync(matrix)
+
+    def search(self, query: np.ndarray, top_k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(id, cosine similarity) of approximately the `top_k` stored vectors closest to `query`."""
+        if self.store.snapshot()[1] is None:
+            return []
+        with self._lock:
+            with file_lock(self.lock_path):
+                if file_stamp(self.path) != self._stamp:
+                    self._read()
+                ids, matrix, _ = self.store.snapshot()
+            if self._pending(matrix):
+                with file_lock(self.lock_path, exclusive=True):
+                    self._read()
+                    ids, matrix, _ = self.store.snapshot()
+                    self._sync(matrix)
+            if self.centroids is None or len(matrix) < ANN_MIN_ROWS:
+                rows = None
+            else:
+                probe, _ = top_k_similar(query, self.centroids, nprobe or self.nprobe)
+                # Sorted rows keep the gather from the memory-mapped matrix sequential
+                rows = np.sort(np.concatenate([self._order[self._offsets[l]:self._offsets[l + 1]] for l in probe]))
+        if rows is None:
+            indices, scores = top_k_similar(query, matrix, top_k)
+            return [(int(ids[i]), float(score)) for i, score in zip(indices, scores)]
+        indices, scores = top_k_similar(query, matrix[rows], top_k)
+        return [(int(ids[rows[i]]), float(score)) for i, score in zip(indices, scores)]
+
+    def stats(self) -> dict:
+        return {
+            "vectors": len(self.store),
+            "lists": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            "trained_rows": self.trained_rows,
+            "exact": self.centroids is None
+        }
+
+
+candidate_index = IVFIndex(candidate_store)
+role_index = IVFIndex(role_store)
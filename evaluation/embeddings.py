@@ -0,0 +1,227 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Local CPU encoder used to pre-rank candidates before the LLM match
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "embeddings")
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", 512))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 16))
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _load_encoder():
+    """Import torch and transformers and load the model on first use; both are too heavy for app startup."""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+            model = AutoModel.from_pretrained(EMBEDDING_MODEL)
+            model.eval()
+            _encoder = (torch, tokenizer, model)
+    return _encoder
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def embed_texts(texts: Sequence[str]) -> np.ndarray:
+    """
+    Embed texts into L2-normalised float32 rows (mean-pooled token states).
+    Text past EMBEDDING_MAX_TOKENS is truncated, which keeps the opening of a
+    CV or job description: the summary and most recent roles.
+    """
+    torch, tokenizer, model = _load_encoder()
+    rows = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        batch = [text or "" for text in texts[start:start + EMBEDDING_BATCH_SIZE]]
+        encoded = tokenizer(batch, padding=True, truncation=True, max_length=EMBEDDING_MAX_TOKENS, return_tensors="pt")
+        with torch.inference_mode():
+            hidden = model(**encoded).last_hidden_state
+        mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        rows.append(((hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)).numpy())
+    if not rows:
+        return np.zeros((0, model.config.hidden_size), dtype=np.float32)
+    return normalize(np.concatenate(rows))
+
+
+def top_k_similar(query: np.ndarray, matrix: np.ndarray, top_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Row indices of `matrix` most similar to `query` and their cosine scores,
+    best first. Rows and query are normalised, so this is one mat-vec product;
+    argpartition keeps the selection linear in the number of rows.
+    """
+    if len(matrix) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    scores = matrix @ np.asarray(query, dtype=np.float32).reshape(-1)
+    if top_k is not None and 0 < top_k < len(scores):
+        indices = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        indices = np.arange(len(scores))
+    indices = indices[np.argsort(-scores[indices], kind="stable")]
+    return indices, scores[indices]
+
+
+@contextmanager
+def file_lock(path: str, exclusive: bool = False):
+    """Hold an flock on `path` across processes: shared for readers, exclusive for writers."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def replace_file(path: str, write) -> None:
+    """Write `path` through a temp file and os.replace, so readers never open a half-written file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime, size) of `path`, which changes whenever it is replaced; None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class EmbeddingStore:
+    """
+    Embeddings for one kind of record ("candidates", "roles") kept on disk as
+    a float32 matrix (<kind>.f32, memory-mapped read-only for ranking) with
+    the record ids alongside (<kind>.ids.npy).
+
+    Re-embedding a record overwrites its row and new records are appended.
+    Writers hold an exclusive flock on <kind>.lock for the whole
+    read-modify-write and swap in complete files with os.replace; readers
+    take a shared lock while they map them, so other workers pick up changes
+    once the ids file is replaced. Switching EMBEDDING_MODEL discards the
+    stored vectors.
+    """
+
+    def __init__(self, kind: str, directory: str = EMBEDDING_DIR):
+        self.kind = kind
+        self.matrix_path = os.path.join(directory, f"{kind}.f32")
+        self.ids_path = os.path.join(directory, f"{kind}.ids.npy")
+        self.meta_path = os.path.join(directory, f"{kind}.json")
+        self.lock_path = os.path.join(directory, f"{kind}.lock")
+        self.directory = directory
+        self.dim = None
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._rows = {}
+        self._matrix = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        if file_stamp(self.ids_path) == self._stamp:
+            return
+        with file_lock(self.lock_path):
+            self._read()
+
+    def _read(self) -> None:
+        # The caller holds the store's file lock, so the ids, metadata and matrix agree
+        self._stamp = file_stamp(self.ids_path)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix = None
+        self.dim = None
+        if self._stamp is not None and os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta.get("model") == EMBEDDING_MODEL:
+                self.dim = meta["dim"]
+                self._ids = np.load(self.ids_path)
+                if len(self._ids):
+                    self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(len(self._ids), self.dim))
+        self._rows = {int(record_id): row for row, record_id in enumerate(self._ids)}
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._ids)
+
+    def __contains__(self, record_id: int) -> bool:
+        with self._lock:
+            self._load()
+            return record_id in self._rows
+
+    def upsert(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        vectors = normalize(vectors)
+        if not len(ids):
+            return
+        with self._lock, file_lock(self.lock_path, exclusive=True):
+            self._read()
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"{self.kind} embeddings have dimension {self.dim}, got {vectors.shape[1]}")
+            dim = vectors.shape[1]
+            replaced = [(self._rows[int(i)], vector) for i, vector in zip(ids, vectors) if int(i) in self._rows]
+            appended = {int(i): vector for i, vector in zip(ids, vectors) if int(i) not in self._rows}
+            matrix = self._matrix
+
+            def write_matrix(f):
+                # Copy the current rows, append the new ones, then overwrite the replaced rows in the copy
+                if matrix is not None:
+                    matrix.tofile(f)
+                for vector in appended.values():
+                    f.write(vector.tobytes())
+                for row, vector in replaced:
+                    f.seek(row * dim * 4)
+                    f.write(vector.tobytes())
+
+            # The ids file goes last: readers treat its replacement as the signal to remap
+            replace_file(self.matrix_path, write_matrix)
+            replace_file(self.meta_path, lambda f: f.write(json.dumps({"model": EMBEDDING_MODEL, "dim": dim}).encode()))
+            replace_file(self.ids_path, lambda f: np.save(f, np.concatenate([self._ids, np.array(list(appended), dtype=np.int64)])))
+            self._read()
+
+    def snapshot(self) -> Tuple[np.ndarray, Optional[np.ndarray], Dict[int, int]]:
+        """The current (ids, matrix, id -> row) triple; the matrix is None while the store is empty."""
+        with self._lock:
+            self._load()
+            return self._ids, self._matrix, self._rows
+
+    def vectors(self, ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Stored vectors for whichever of `ids` have been embedded."""
+        with self._lock:
+            self._load()
+            return {record_id: np.array(self._matrix[self._rows[record_id]]) for record_id in ids if record_id in self._rows}
+
+    def rank(self, query: np.ndarray, ids: Optional[Iterable[int]] = None, top_k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(id, cosine similarity) of the stored records closest to `query`, optionally limited to `ids`."""
+        with self._lock:
+            self._load()
+            if self._matrix is None:
+                return []
+            matrix, record_ids = self._matrix, self._ids
+            if ids is not None:
+                rows = np.array([self._rows[i] for i in ids if i in self._rows], dtype=np.int64)
+                matrix, record_ids = matrix[rows], record_ids[rows]
+        indices, scores = top_k_similar(query, matrix, top_k)
+        return [(int(record_ids[i]), float(score)) for i, score in zip(indices, scores)]
+
+
+candidate_store = EmbeddingStore("candidates")
+role_store = EmbeddingStore("roles")
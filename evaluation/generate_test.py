@@ -1,8 +1,10 @@
 import httpx
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator
 from dotenv import load_dotenv
+from evaluation.llm_limits import llm_slot, LLM_TIMEOUT
+from evaluation.llm_cache import cache_key, cached_response, store_response
 
 # Load environment variables
 load_dotenv()
@@ -11,63 +13,107 @@ load_dotenv()
 # client = OpenAI(
 #     api_key=os.getenv("OPEN_AI_KEY")
 # )
-class CustomHTTPClient(httpx.Client):
+class CustomHTTPClient(httpx.AsyncClient):
         def __init__(self, *args, **kwargs):
             kwargs.pop("proxies", None)  # Remove the 'proxies' argument if present
             super().__init__(*args, **kwargs)
 
-client = OpenAI(http_client=CustomHTTPClient())
+# Built on first use: creating the client loads certificates and sets up its connection pool
+client = None
 
 
-def generate_candidate_evaluation(job_description: str) -> Dict[str, Any]:
+def _client() -> AsyncOpenAI:
+    global client
+    if client is None:
+        client = AsyncOpenAI(http_client=CustomHTTPClient(timeout=LLM_TIMEOUT))
+    return client
+
+
+async def _complete(**kwargs) -> str:
+    """
+    Return the text of one chat completion, served from the LLM cache when the
+    same request has been made before, otherwise run under the shared LLM
+    concurrency limit.
+    """
+    key = cache_key("openai", kwargs)
+    cached = await cached_response(key)
+    if cached is not None:
+        return cached
+    async with llm_slot("openai"):
+        response = await _client().chat.completions.create(**kwargs)
+    content = response.choices[0].message.content
+    await store_response(key, "openai", kwargs.get("model"), content)
+    return content
+
+
+async def _stream(**kwargs) -> AsyncIterator[str]:
+    """
+    Yield the completion text as the model generates it. A cached response is
+    yielded whole; a fresh one is stored in the cache once the stream ends.
+    """
+    key = cache_key("openai", kwargs)
+    cached = await cached_response(key)
+    if cached is not None:
+        yield cached
+        return
+    chunks = []
+    async with llm_slot("openai"):
+        async with await _client().chat.completions.create(stream=True, **kwargs) as stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    yield chunks[-1]
+    await store_response(key, "openai", kwargs.get("model"), "".join(chunks))
+
+
+def _candidate_evaluation_request(job_description: str) -> Dict[str, Any]:
+    """Request arguments for a take home test tailored to the job description."""
+    # Construct the prompt
+    prompt = f"""We are a technology consulting shop run by software engineers.
+    We focus on selectivity of top talent in software engineering disciplines. 
+    I would like you to design a custom coding problems take home test
+    for the following job description provided.
+    For each question, the candidate will provide answers in a code-editor and the answers should be compilable or runnable.
+    The test should be able to be completed in 30 minutes.
+    
+    Job Description:
+    {job_description}
+    
+    Please create a coding problems take home test that includes:
+    1. Data Structures and Algorithms
+    2. Problem-solving scenarios
+    3. System design questions
+    4. Code refactoring exercises
+    5. Performance optimization challenges
+    
+    Make sure the questions are:
+    - Specific to the role requirements
+    - Require deep understanding rather than memorization
+    - Include real-world scenarios
+    - Test both theoretical knowledge and practical skills
+    - Are not easily searchable or AI-answerable
+    
+    Respond in the following HTML format string with appropriate formatting and sections for instructions, questions and answers
+    """
+
+    return dict(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are an expert software engineering team lead creating software engineering evaluation coding tests questions and answers. Always respond in valid HTML format."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=2000
+    )
+
+async def generate_candidate_evaluation(job_description: str) -> Dict[str, Any]:
     """
     Generate a candidate evaluation test based on the provided job description.
     """
     print('job_description is ', job_description);
     print('am here')
     try:
-        # Construct the prompt
-        prompt = f"""We are a technology consulting shop run by software engineers.
-        We focus on selectivity of top talent in software engineering disciplines. 
-        I would like you to design a custom coding problems take home test
-        for the following job description provided.
-        For each question, the candidate will provide answers in a code-editor and the answers should be compilable or runnable.
-        The test should be able to be completed in 30 minutes.
-        
-        Job Description:
-        {job_description}
-        
-        Please create a coding problems take home test that includes:
-        1. Data Structures and Algorithms
-        2. Problem-solving scenarios
-        3. System design questions
-        4. Code refactoring exercises
-        5. Performance optimization challenges
-        
-        Make sure the questions are:
-        - Specific to the role requirements
-        - Require deep understanding rather than memorization
-        - Include real-world scenarios
-        - Test both theoretical knowledge and practical skills
-        - Are not easily searchable or AI-answerable
-        
-        Respond in the following HTML format string with appropriate formatting and sections for instructions, questions and answers
-        """
-        
-        # Call OpenAI API with the new format
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert software engineering team lead creating software engineering evaluation coding tests questions and answers. Always respond in valid HTML format."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        # Extract the generated evaluation (updated for v1.12.0)
-        evaluation = response.choices[0].message.content
-        # evaluation = response.choices[0].message.content.replace('```json', '').replace('```', '').strip()
+        evaluation = await _complete(**_candidate_evaluation_request(job_description))
 
         #print(evaluation)
         
@@ -82,51 +128,57 @@ def generate_candidate_evaluation(job_description: str) -> Dict[str, Any]:
             "message": str(e)
         }
 
-def generate_candidate_match(job_description: str, candidate_cv: str) -> Dict[str, Any]:
-    """
-    Generate a candidate match evaluation based on the job description and candidate's CV.
-    Returns a detailed analysis with match score and recommendation.
-    """
-    try:
-        # Construct the prompt
-        prompt = f"""We are Rayze - a boutique technology company focused on finding the highest caliber technical talent for our clients.
+async def stream_candidate_evaluation(job_description: str) -> AsyncIterator[str]:
+    """Stream the candidate evaluation test as it is generated."""
+    async for text in _stream(**_candidate_evaluation_request(job_description)):
+        yield text
 
-        Please analyze the following job requirements and candidate CV to provide a detailed evaluation:
+def _candidate_match_request(job_description: str, candidate_cv: str) -> Dict[str, Any]:
+    """Request arguments for a match report of the candidate CV against the job description."""
+    # Construct the prompt
+    prompt = f"""We are Rayze - a boutique technology company focused on finding the highest caliber technical talent for our clients.
 
-        Job Description:
-        {job_description}
+    Please analyze the following job requirements and candidate CV to provide a detailed evaluation:
 
-        Candidate CV:
-        {candidate_cv}
+    Job Description:
+    {job_description}
 
-        Please provide a comprehensive evaluation that includes:
-        1. An overall match score (0-100)
-        2. A clear recommendation (RECOMMEND or DO NOT RECOMMEND)
-        3. Required skills analysis with individual ratings (0-100) for each skill
-        4. Strengths and skill gaps analysis
-        5. Notable achievements analysis
-        6. Average tenure calculation and role progression analysis
+    Candidate CV:
+    {candidate_cv}
 
-        Respond in a well-structured HTML format that includes:
-        - A parsable recommendation summary section with data-attributes for score and recommendation
-        - Detailed skills assessment
-        - Qualitative analysis sections
-        - Professional formatting and clear section hierarchy
-        """
-        #print(prompt);
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert technical recruiter with deep experience in evaluating software engineering talent. Always respond in valid HTML format with data attributes for parsing key metrics."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        # Extract the generated evaluation
-        evaluation = response.choices[0].message.content
+    Please provide a comprehensive evaluation that includes:
+    1. An overall match score (0-100)
+    2. A clear recommendation (RECOMMEND or DO NOT RECOMMEND)
+    3. Required skills analysis with individual ratings (0-100) for each skill
+    4. Strengths and skill gaps analysis
+    5. Notable achievements analysis
+    6. Average tenure calculation and role progression analysis
+
+    Respond in a well-structured HTML format that includes:
+    - A parsable recommendation summary section with data-attributes for score and recommendation
+    - Detailed skills assessment
+    - Qualitative analysis sections
+    - Professional formatting and clear section hierarchy
+    """
+    #print(prompt);
+
+    return dict(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are an expert technical recruiter with deep experience in evaluating software engineering talent. Always respond in valid HTML format with data attributes for parsing key metrics."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=2000
+    )
+
+async def generate_candidate_match(job_description: str, candidate_cv: str) -> Dict[str, Any]:
+    """
+    Generate a candidate match evaluation based on the job description and candidate's CV.
+    Returns a detailed analysis with match score and recommendation.
+    """
+    try:
+        evaluation = await _complete(**_candidate_match_request(job_description, candidate_cv))
         
         return {
             "status": "success",
@@ -139,7 +191,12 @@ def generate_candidate_match(job_description: str, candidate_cv: str) -> Dict[st
             "message": str(e)
         }
 
-def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, Any]:
+async def stream_candidate_match(job_description: str, candidate_cv: str) -> AsyncIterator[str]:
+    """Stream the candidate match report as it is generated."""
+    async for text in _stream(**_candidate_match_request(job_description, candidate_cv)):
+        yield text
+
+async def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, Any]:
     """
     Generate a score evaluation based on the candidate's test answers.
     Returns a detailed analysis with overall score and answer-specific feedback.
@@ -172,7 +229,7 @@ def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, An
         """
         
         # Call OpenAI API
-        response = client.chat.completions.create(
+        evaluation = await _complete(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are an expert technical interviewer with deep experience in evaluating software engineering candidates. Always respond in valid HTML format with data attributes for parsing key metrics."},
@@ -182,9 +239,6 @@ def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, An
             max_tokens=2000
         )
         
-        # Extract the generated evaluation
-        evaluation = response.choices[0].message.content
-        
         return {
             "status": "success",
             "evaluation": evaluation
@@ -196,7 +250,7 @@ def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, An
             "message": str(e)
         }
 
-def generate_candidate_cv(candidate_cv: str) -> Dict[str, Any]:
+async def generate_candidate_cv(candidate_cv: str) -> Dict[str, Any]:
     """
     Generate a structured JSON object from a candidate's CV containing key information.
     
@@ -228,7 +282,7 @@ def generate_candidate_cv(candidate_cv: str) -> Dict[str, Any]:
         Ensure the response is a valid JSON object with these exact field names.
         """
         
-        response = client.chat.completions.create(
+        parsed_cv = await _complete(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are an expert at parsing resumes and extracting structured information. Always respond with valid JSON only."},
@@ -238,9 +292,6 @@ def generate_candidate_cv(candidate_cv: str) -> Dict[str, Any]:
             max_tokens=1000
         )
         
-        # Extract the generated JSON
-        parsed_cv = response.choices[0].message.content
-        
         return {
             "status": "success",
             "candidate_info": parsed_cv
@@ -252,7 +303,7 @@ def generate_candidate_cv(candidate_cv: str) -> Dict[str, Any]:
             "message": str(e)
         }
 
-def generate_job_desc(job_desc: str) -> Dict[str, Any]:
+async def generate_job_desc(job_desc: str) -> Dict[str, Any]:
     """
     Generate a structured JSON object from a job description containing key information.
     
@@ -282,7 +333,7 @@ def generate_job_desc(job_desc: str) -> Dict[str, Any]:
         Ensure the response is a valid JSON object with these exact field names.
         """
         
-        response = client.chat.completions.create(
+        parsed_jd = await _complete(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are an expert at parsing job descriptions and extracting structured information. Always respond with valid JSON only."},
@@ -292,9 +343,6 @@ def generate_job_desc(job_desc: str) -> Dict[str, Any]:
             max_tokens=1000
         )
         
-        # Extract the generated JSON
-        parsed_jd = response.choices[0].message.content
-        
         return {
             "status": "success",
             "job_desc": parsed_jd
@@ -1,63 +1,112 @@
-import httpx
 import os
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator
 from dotenv import load_dotenv
 import anthropic
+from evaluation.llm_limits import llm_slot, LLM_TIMEOUT
+from evaluation.llm_cache import cache_key, cached_response, store_response
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Anthropic client
-client = anthropic.Anthropic(
-    api_key=os.getenv("ANTHROPIC_API_KEY")
-)
+# Anthropic client, built on first use
+client = None
 
-def generate_candidate_evaluation(job_description: str) -> Dict[str, Any]:
+
+def _client() -> anthropic.AsyncAnthropic:
+    global client
+    if client is None:
+        client = anthropic.AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            timeout=LLM_TIMEOUT
+        )
+    return client
+
+
+async def _complete(**kwargs) -> str:
+    """
+    Return the text of one message request, served from the LLM cache when the
+    same request has been made before, otherwise run under the shared LLM
+    concurrency limit.
+    """
+    key = cache_key("anthropic", kwargs)
+    cached = await cached_response(key)
+    if cached is not None:
+        return cached
+    async with llm_slot("anthropic"):
+        response = await _client().messages.create(**kwargs)
+    content = response.content[0].text
+    await store_response(key, "anthropic", kwargs.get("model"), content)
+    return content
+
+
+async def _stream(**kwargs) -> AsyncIterator[str]:
+    """
+    Yield the message text as the model generates it. A cached response is
+    yielded whole; a fresh one is stored in the cache once the stream ends.
+    """
+    key = cache_key("anthropic", kwargs)
+    cached = await cached_response(key)
+    if cached is not None:
+        yield cached
+        return
+    chunks = []
+    async with llm_slot("anthropic"):
+        # create(stream=True) yields raw server-sent events on the pinned anthropic==0.18.1;
+        # only text deltas carry .text, so other delta types are skipped
+        async with await _client().messages.create(stream=True, **kwargs) as stream:
+            async for event in stream:
+                if event.type == "content_block_delta" and event.delta.type == "text_delta" and event.delta.text:
+                    chunks.append(event.delta.text)
+                    yield chunks[-1]
+    await store_response(key, "anthropic", kwargs.get("model"), "".join(chunks))
+
+
+def _candidate_evaluation_request(job_description: str) -> Dict[str, Any]:
+    """Request arguments for a take home test tailored to the job description."""
+    # Construct the prompt
+    prompt = f"""We are a technology consulting shop run by software engineers.
+    We focus on selectivity of top talent in software engineering disciplines. 
+    I would like you to design a custom coding problems take home test
+    for the following job description provided.
+    For each question, the candidate will provide answers in a code-editor and the answers should be compilable or runnable.
+    The test should be able to be completed in 30 minutes.
+    
+    Job Description:
+    {job_description}
+    
+    Please create a coding problems take home test that includes:
+    1. Data Structures and Algorithms
+    2. Problem-solving scenarios
+    3. System design questions
+    4. Code refactoring exercises
+    5. Performance optimization challenges
+    
+    Make sure the questions are:
+    - Specific to the role requirements
+    - Require deep understanding rather than memorization
+    - Include real-world scenarios
+    - Test both theoretical knowledge and practical skills
+    - Are not easily searchable or AI-answerable
+    
+    Respond in the following HTML format string with appropriate formatting and sections for instructions, questions and answers
+    """
+
+    return dict(
+        model="claude-3-sonnet-20240229",
+        max_tokens=2000,
+        temperature=0.7,
+        system="You are an expert software engineering team lead creating software engineering evaluation coding tests questions and answers. Always respond in valid HTML format.",
+        messages=[
+            {"role": "user", "content": prompt}
+        ]
+    )
+
+async def generate_candidate_evaluation(job_description: str) -> Dict[str, Any]:
     """
     Generate a candidate evaluation test based on the provided job description.
     """
     try:
-        # Construct the prompt
-        prompt = f"""We are a technology consulting shop run by software engineers.
-        We focus on selectivity of top talent in software engineering disciplines. 
-        I would like you to design a custom coding problems take home test
-        for the following job description provided.
-        For each question, the candidate will provide answers in a code-editor and the answers should be compilable or runnable.
-        The test should be able to be completed in 30 minutes.
-        
-        Job Description:
-        {job_description}
-        
-        Please create a coding problems take home test that includes:
-        1. Data Structures and Algorithms
-        2. Problem-solving scenarios
-        3. System design questions
-        4. Code refactoring exercises
-        5. Performance optimization challenges
-        
-        Make sure the questions are:
-        - Specific to the role requirements
-        - Require deep understanding rather than memorization
-        - Include real-world scenarios
-        - Test both theoretical knowledge and practical skills
-        - Are not easily searchable or AI-answerable
-        
-        Respond in the following HTML format string with appropriate formatting and sections for instructions, questions and answers
-        """
-        
-        # Call Claude API
-        response = client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=2000,
-            temperature=0.7,
-            system="You are an expert software engineering team lead creating software engineering evaluation coding tests questions and answers. Always respond in valid HTML format.",
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        # Extract the generated evaluation
-        evaluation = response.content[0].text
+        evaluation = await _complete(**_candidate_evaluation_request(job_description))
         
         return {
             "status": "success",
@@ -70,51 +119,56 @@ def generate_candidate_evaluation(job_description: str) -> Dict[str, Any]:
             "message": str(e)
         }
 
-def generate_candidate_match(job_description: str, candidate_cv: str) -> Dict[str, Any]:
-    """
-    Generate a candidate match evaluation based on the job description and candidate's CV.
-    Returns a detailed analysis with match score and recommendation.
-    """
-    try:
-        # Construct the prompt
-        prompt = f"""We are Rayze - a boutique technology company focused on finding the highest caliber technical talent for our clients.
+async def stream_candidate_evaluation(job_description: str) -> AsyncIterator[str]:
+    """Stream the candidate evaluation test as it is generated."""
+    async for text in _stream(**_candidate_evaluation_request(job_description)):
+        yield text
 
-        Please analyze the following job requirements and candidate CV to provide a detailed evaluation:
+def _candidate_match_request(job_description: str, candidate_cv: str) -> Dict[str, Any]:
+    """Request arguments for a match report of the candidate CV against the job description."""
+    # Construct the prompt
+    prompt = f"""We are Rayze - a boutique technology company focused on finding the highest caliber technical talent for our clients.
 
-        Job Description:
-        {job_description}
+    Please analyze the following job requirements and candidate CV to provide a detailed evaluation:
 
-        Candidate CV:
-        {candidate_cv}
+    Job Description:
+    {job_description}
 
-        Please provide a comprehensive evaluation that includes:
-        1. An overall match score (0-100)
-        2. A clear recommendation (RECOMMEND or DO NOT RECOMMEND)
-        3. Required skills analysis with individual ratings (0-100) for each skill
-        4. Strengths and skill gaps analysis
-        5. Notable achievements analysis
-        6. Average tenure calculation and role progression analysis
+    Candidate CV:
+    {candidate_cv}
 
-        Respond in a well-structured HTML format that includes:
-        - A parsable recommendation summary section with data-attributes for score and recommendation
-        - Detailed skills assessment
-        - Qualitative analysis sections
-        - Professional formatting and clear section hierarchy
-        """
-        
-        # Call Claude API
-        response = client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=2000,
-            temperature=0.7,
-            system="You are an expert technical recruiter with deep experience in evaluating software engineering talent. Always respond in valid HTML format with data attributes for parsing key metrics.",
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        # Extract the generated evaluation
-        evaluation = response.content[0].text
+    Please provide a comprehensive evaluation that includes:
+    1. An overall match score (0-100)
+    2. A clear recommendation (RECOMMEND or DO NOT RECOMMEND)
+    3. Required skills analysis with individual ratings (0-100) for each skill
+    4. Strengths and skill gaps analysis
+    5. Notable achievements analysis
+    6. Average tenure calculation and role progression analysis
+
+    Respond in a well-structured HTML format that includes:
+    - A parsable recommendation summary section with data-attributes for score and recommendation
+    - Detailed skills assessment
+    - Qualitative analysis sections
+    - Professional formatting and clear section hierarchy
+    """
+
+    return dict(
+        model="claude-3-sonnet-20240229",
+        max_tokens=2000,
+        temperature=0.7,
+        system="You are an expert technical recruiter with deep experience in evaluating software engineering talent. Always respond in valid HTML format with data attributes for parsing key metrics.",
+        messages=[
+            {"role": "user", "content": prompt}
+        ]
+    )
+
+async def generate_candidate_match(job_description: str, candidate_cv: str) -> Dict[str, Any]:
+    """
+    Generate a candidate match evaluation based on the job description and candidate's CV.
+    Returns a detailed analysis with match score and recommendation.
+    """
+    try:
+        evaluation = await _complete(**_candidate_match_request(job_description, candidate_cv))
         
         return {
             "status": "success",
@@ -127,7 +181,12 @@ def generate_candidate_match(job_description: str, candidate_cv: str) -> Dict[st
             "message": str(e)
         }
 
-def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, Any]:
+async def stream_candidate_match(job_description: str, candidate_cv: str) -> AsyncIterator[str]:
+    """Stream the candidate match report as it is generated."""
+    async for text in _stream(**_candidate_match_request(job_description, candidate_cv)):
+        yield text
+
+async def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, Any]:
     """
     Generate a score evaluation based on the candidate's test answers.
     Returns a detailed analysis with overall score and answer-specific feedback.
@@ -158,7 +217,7 @@ def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, An
         """
         
         # Call Claude API
-        response = client.messages.create(
+        evaluation = await _complete(
             model="claude-3-sonnet-20240229",
             max_tokens=2000,
             temperature=0.7,
@@ -168,9 +227,6 @@ def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, An
             ]
         )
         
-        # Extract the generated evaluation
-        evaluation = response.content[0].text
-        
         return {
             "status": "success",
             "evaluation": evaluation
@@ -182,6 +238,109 @@ def generate_score(candidate_evaluation: str, test_answers: str) -> Dict[str, An
             "message": str(e)
         }
 
+async def generate_candidate_cv(candidate_cv: str) -> Dict[str, Any]:
+    """
+    Generate a structured JSON object from a candidate's CV containing key information.
+    
+    Args:
+        candidate_cv (str): The candidate's CV/resume text
+        
+    Returns:
+        Dict[str, Any]: JSON object containing parsed candidate information
+    """
+    try:
+        prompt = f"""Please analyze the following CV and extract key information into a structured JSON format.
+        
+        CV Content:
+        {candidate_cv}
+        
+        Extract and return ONLY a JSON object with the following fields:
+        - name: candidate's full name
+        - phone: phone number (if available)
+        - email: email address (if available)
+        - role: most current role
+        - location: city or country
+        - linkedin: LinkedIn URL (if available)
+        - key_skills: array of main technical and professional skills
+        - key_achievements: array of notable professional accomplishments
+        - strengths: array of candidate's core strengths
+        - gaps: array of potential skill or experience gaps
+        - cv_summary: summary of the candidate cv including the key_skills, key_achievements, gaps
+        
+        Ensure the response is a valid JSON object with these exact field names.
+        """
+        
+        parsed_cv = await _complete(
+            model="claude-3-sonnet-20240229",
+            max_tokens=1000,
+            temperature=0.3,
+            system="You are an expert at parsing resumes and extracting structured information. Always respond with valid JSON only.",
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+        
+        return {
+            "status": "success",
+            "candidate_info": parsed_cv
+        }
+        
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+async def generate_job_desc(job_desc: str) -> Dict[str, Any]:
+    """
+    Generate a structured JSON object from a job description containing key information.
+    
+    Args:
+        job_desc (str): The clients job description
+        
+    Returns:
+        Dict[str, Any]: JSON object containing parsed job description
+    """
+    try:
+        prompt = f"""Please analyze the following job description and extract key information into a structured JSON format.
+        
+        Job Description Content:
+        {job_desc}
+        
+        Extract and return ONLY a JSON object with the following fields:
+        - role_name: The Open Role name
+        - background: background information on the team, company, project if available
+        - role_desc: any role description on what the candidate will perform if available
+        - responsibilites: array of all the responsibilities of this role
+        - candidate_requirements: array of candidate requirements and skills required and technical competencies
+        - must_have: array of must have skills and technical competencises
+        - nice_to_have: array of nice to have skills and technical competencies
+        - technical_skills: array of technical skills and competencies
+        
+        Ensure the response is a valid JSON object with these exact field names.
+        """
+        
+        parsed_jd = await _complete(
+            model="claude-3-sonnet-20240229",
+            max_tokens=1000,
+            temperature=0.3,
+            system="You are an expert at parsing job descriptions and extracting structured information. Always respond with valid JSON only.",
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+        
+        return {
+            "status": "success",
+            "job_desc": parsed_jd
+        }
+        
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
 # if __name__ == "__main__":
 #     # Example usage
 #     job_desc = "Senior Software Engineer specializing in React and TypeScript, with experience in building scalable web applications."
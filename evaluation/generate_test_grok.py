@@ -1,12 +1,131 @@
-import requests
+import httpx
 import os
-from typing import Dict, Any
+import json
+from typing import Dict, Any, AsyncIterator
 from dotenv import load_dotenv
+from evaluation.llm_limits import llm_slot, LLM_TIMEOUT
+from evaluation.llm_cache import cache_key, cached_response, store_response
 
 # Load environment variables
 load_dotenv()
 
-def generate_candidate_evaluation(job_description: str, api_key: str, team_id: str = None) -> Dict[str, Any]:
+# xAI Grok API endpoint
+GROK_API_URL = "https://api.x.ai/v1/chat/completions"
+
+# Shared connection pool for every Grok request made by this worker, built on first use
+client = None
+
+
+def _client() -> httpx.AsyncClient:
+    global client
+    if client is None:
+        client = httpx.AsyncClient(timeout=LLM_TIMEOUT)
+    return client
+
+
+def _headers(api_key: str, team_id: str = None) -> Dict[str, str]:
+    """Headers for the API request, including the team ID if required."""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    if team_id:
+        headers["X-Team-ID"] = team_id
+    return headers
+
+
+async def _complete(url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> str:
+    """
+    Return the text of one chat completion, served from the LLM cache when the
+    same payload has been sent before, otherwise POSTed under the shared LLM
+    concurrency limit. Credentials in `headers` are not part of the cache key.
+    """
+    key = cache_key("grok", payload)
+    cached = await cached_response(key)
+    if cached is not None:
+        return cached
+    async with llm_slot("grok"):
+        response = await _client().post(url, headers=headers, json=payload)
+    response.raise_for_status()
+    content = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+    await store_response(key, "grok", payload.get("model"), content)
+    return content
+
+
+async def _stream(url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Yield the completion text from Grok's server-sent events as it is
+    generated. A cached response is yielded whole; a fresh one is stored in
+    the cache once the stream ends.
+    """
+    key = cache_key("grok", payload)
+    cached = await cached_response(key)
+    if cached is not None:
+        yield cached
+        return
+    chunks = []
+    async with llm_slot("grok"):
+        async with _client().stream("POST", url, headers=headers, json={**payload, "stream": True}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                text = choices[0].get("delta", {}).get("content")
+                if text:
+                    chunks.append(text)
+                    yield text
+    await store_response(key, "grok", payload.get("model"), "".join(chunks))
+
+
+def _candidate_evaluation_payload(job_description: str) -> Dict[str, Any]:
+    """Payload for a take home test tailored to the job description."""
+    # Construct the prompt
+    prompt = f"""Based on the following job description, create a relevant and comprehensive candidate take home coding test.
+    The test should be challenging but fair, and should not be easily answerable by AI tools. It should be a coding test that is relevant to the job description.
+    The test should take 30 minutes to complete at home.
+
+    Job Description:
+    {job_description}
+
+    Please create a test that includes:
+    1. Data Structures and Algorithms
+    2. Problem-solving coding questions
+    3. System design questions
+    4. Code refactoring challenges
+    5. Performance optimization challenges
+
+    Make sure the questions are:
+    - Specific & relevant to the role requirements
+    - Require deep understanding rather than memorization
+    - Include real-world scenarios
+    - Test both theoretical knowledge and practical skills
+    - Are not easily searchable or AI-answerable
+    - Are not easily googleable
+
+    Respond in a well-structured HTML format that includes:
+    - Instructions for the candidate and letting them know to please NOT use GPT as we use GPT detectors. Also please write concise human readable clean code
+    - Questions with boiler plate code for them to save time
+    - Submission with comments in 1 single .txt file. Do not provide instructions on emails or how to submit.
+    - Professional formatting and clear section for each question
+    """
+
+    # Payload for the API request
+    payload = {
+        "model": "grok-2-1212",  # Use Grok 3 model
+        "messages": [
+            {"role": "system", "content": "You are a development lead creating a take home exam for candidates. The test will evaluate their coding expertise which will help us determine if they are technically capable and a good fit for the role."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 2000
+    }
+    return payload
+
+async def generate_candidate_evaluation(job_description: str, api_key: str, team_id: str = None) -> Dict[str, Any]:
     """
     Generate a candidate evaluation test based on the provided job description using Grok 3.
     
@@ -19,67 +138,8 @@ def generate_candidate_evaluation(job_description: str, api_key: str, team_id: s
         Dict[str, Any]: Result containing status and evaluation or error message.
     """
     try:
-        # Construct the prompt
-        prompt = f"""Based on the following job description, create a relevant and comprehensive candidate take home coding test.
-        The test should be challenging but fair, and should not be easily answerable by AI tools. It should be a coding test that is relevant to the job description.
-        The test should take 30 minutes to complete at home.
-
-        Job Description:
-        {job_description}
-
-        Please create a test that includes:
-        1. Data Structures and Algorithms
-        2. Problem-solving coding questions
-        3. System design questions
-        4. Code refactoring challenges
-        5. Performance optimization challenges
-
-        Make sure the questions are:
-        - Specific & relevant to the role requirements
-        - Require deep understanding rather than memorization
-        - Include real-world scenarios
-        - Test both theoretical knowledge and practical skills
-        - Are not easily searchable or AI-answerable
-        - Are not easily googleable
-
-        Respond in a well-structured HTML format that includes:
-        - Instructions for the candidate and letting them know to please NOT use GPT as we use GPT detectors. Also please write concise human readable clean code
-        - Questions with boiler plate code for them to save time
-        - Submission with comments in 1 single .txt file. Do not provide instructions on emails or how to submit.
-        - Professional formatting and clear section for each question
-        """
-
-        # xAI Grok API endpoint
-        GROK_API_URL = "https://api.x.ai/v1/chat/completions"
-
-        # Headers for the API request
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        if team_id:
-            headers["X-Team-ID"] = team_id  # Include team ID if required
-
-        # Payload for the API request
-        payload = {
-            "model": "grok-2-1212",  # Use Grok 3 model
-            "messages": [
-                {"role": "system", "content": "You are a development lead creating a take home exam for candidates. The test will evaluate their coding expertise which will help us determine if they are technically capable and a good fit for the role."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2000
-        }
-
         # Make the API call to Grok
-        response = requests.post(GROK_API_URL, headers=headers, json=payload, timeout=30)
-
-        # Check if the request was successful
-        response.raise_for_status()
-
-        # Parse the response
-        response_data = response.json()
-        evaluation = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+        evaluation = await _complete(GROK_API_URL, _headers(api_key, team_id), _candidate_evaluation_payload(job_description))
 
         if not evaluation:
             raise ValueError("No evaluation generated from Grok API")
@@ -89,8 +149,8 @@ def generate_candidate_evaluation(job_description: str, api_key: str, team_id: s
             "evaluation": evaluation
         }
 
-    except requests.exceptions.HTTPError as e:
-        if response.status_code == 403:
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 403:
             return {
                 "status": "error",
                 "message": "Access denied. Check API key or team ID. Possible 'Access to team denied' error."
@@ -99,7 +159,7 @@ def generate_candidate_evaluation(job_description: str, api_key: str, team_id: s
             "status": "error",
             "message": f"HTTP error calling Grok API: {str(e)}"
         }
-    except requests.exceptions.RequestException as e:
+    except httpx.RequestError as e:
         return {
             "status": "error",
             "message": f"Network error calling Grok API: {str(e)}"
@@ -110,7 +170,52 @@ def generate_candidate_evaluation(job_description: str, api_key: str, team_id: s
             "message": f"Unexpected error: {str(e)}"
         }
 
-def generate_candidate_match(job_description: str, candidate_cv: str, api_key: str, team_id: str = None) -> Dict[str, Any]:
+async def stream_candidate_evaluation(job_description: str, api_key: str, team_id: str = None) -> AsyncIterator[str]:
+    """Stream the candidate evaluation test from Grok as it is generated."""
+    async for text in _stream(GROK_API_URL, _headers(api_key, team_id), _candidate_evaluation_payload(job_description)):
+        yield text
+
+def _candidate_match_payload(job_description: str, candidate_cv: str) -> Dict[str, Any]:
+    """Payload for a match report of the candidate CV against the job description."""
+    # Construct the prompt
+    prompt = f"""We are Rayze - a boutique technology company focused on finding the highest caliber technical talent for our clients.
+
+    Please analyze the following job requirements and candidate CV to provide a detailed evaluation:
+
+    Job Description:
+    {job_description}
+
+    Candidate CV:
+    {candidate_cv}
+
+    Please provide a comprehensive evaluation that includes:
+    1. An overall match score (0-100)
+    2. A clear recommendation (RECOMMEND or DO NOT RECOMMEND)
+    3. Required skills analysis with individual ratings (0-100) for each skill
+    4. Strengths and skill gaps analysis
+    5. Notable achievements analysis
+    6. Average tenure calculation and role progression analysis
+
+    Respond in a well-structured HTML format that includes:
+    - A parsable recommendation summary section with data-attributes for score and recommendation
+    - Detailed skills assessment
+    - Qualitative analysis sections
+    - Professional formatting and clear section hierarchy
+    """
+
+    # Payload for the API request
+    payload = {
+        "model": "grok-2-1212",
+        "messages": [
+            {"role": "system", "content": "You are an expert technical recruiter with deep experience in evaluating software engineering talent. Always respond in valid HTML format with data attributes for parsing key metrics."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 2000
+    }
+    return payload
+
+async def generate_candidate_match(job_description: str, candidate_cv: str, api_key: str, team_id: str = None) -> Dict[str, Any]:
     """
     Generate a candidate match evaluation based on the job description and candidate's CV using Grok 3.
     
@@ -124,61 +229,8 @@ def generate_candidate_match(job_description: str, candidate_cv: str, api_key: s
         Dict[str, Any]: Result containing status and evaluation or error message.
     """
     try:
-        # Construct the prompt
-        prompt = f"""We are Rayze - a boutique technology company focused on finding the highest caliber technical talent for our clients.
-
-        Please analyze the following job requirements and candidate CV to provide a detailed evaluation:
-
-        Job Description:
-        {job_description}
-
-        Candidate CV:
-        {candidate_cv}
-
-        Please provide a comprehensive evaluation that includes:
-        1. An overall match score (0-100)
-        2. A clear recommendation (RECOMMEND or DO NOT RECOMMEND)
-        3. Required skills analysis with individual ratings (0-100) for each skill
-        4. Strengths and skill gaps analysis
-        5. Notable achievements analysis
-        6. Average tenure calculation and role progression analysis
-
-        Respond in a well-structured HTML format that includes:
-        - A parsable recommendation summary section with data-attributes for score and recommendation
-        - Detailed skills assessment
-        - Qualitative analysis sections
-        - Professional formatting and clear section hierarchy
-        """
-
-        # xAI Grok API endpoint
-        GROK_API_URL = "https://api.x.ai/v1/chat/completions"
-
-        # Headers for the API request
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        if team_id:
-            headers["X-Team-ID"] = team_id
-
-        # Payload for the API request
-        payload = {
-            "model": "grok-2-1212",
-            "messages": [
-                {"role": "system", "content": "You are an expert technical recruiter with deep experience in evaluating software engineering talent. Always respond in valid HTML format with data attributes for parsing key metrics."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2000
-        }
-
         # Make the API call to Grok
-        response = requests.post(GROK_API_URL, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-
-        # Parse the response
-        response_data = response.json()
-        evaluation = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+        evaluation = await _complete(GROK_API_URL, _headers(api_key, team_id), _candidate_match_payload(job_description, candidate_cv))
 
         if not evaluation:
             raise ValueError("No evaluation generated from Grok API")
@@ -188,8 +240,8 @@ def generate_candidate_match(job_description: str, candidate_cv: str, api_key: s
             "evaluation": evaluation
         }
 
-    except requests.exceptions.HTTPError as e:
-        if response.status_code == 403:
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 403:
             return {
                 "status": "error",
                 "message": "Access denied. Check API key or team ID. Possible 'Access to team denied' error."
@@ -198,7 +250,7 @@ def generate_candidate_match(job_description: str, candidate_cv: str, api_key: s
             "status": "error",
             "message": f"HTTP error calling Grok API: {str(e)}"
         }
-    except requests.exceptions.RequestException as e:
+    except httpx.RequestError as e:
         return {
             "status": "error",
             "message": f"Network error calling Grok API: {str(e)}"
@@ -209,7 +261,12 @@ def generate_candidate_match(job_description: str, candidate_cv: str, api_key: s
             "message": f"Unexpected error: {str(e)}"
         }
 
-def generate_score(candidate_evaluation: str, test_answers: str, api_key: str, team_id: str = None) -> Dict[str, Any]:
+async def stream_candidate_match(job_description: str, candidate_cv: str, api_key: str, team_id: str = None) -> AsyncIterator[str]:
+    """Stream the candidate match report from Grok as it is generated."""
+    async for text in _stream(GROK_API_URL, _headers(api_key, team_id), _candidate_match_payload(job_description, candidate_cv)):
+        yield text
+
+async def generate_score(candidate_evaluation: str, test_answers: str, api_key: str, team_id: str = None) -> Dict[str, Any]:
     """
     Generate a score evaluation based on the candidate's test answers using Grok 3.
     
@@ -247,17 +304,6 @@ def generate_score(candidate_evaluation: str, test_answers: str, api_key: str, t
         - Professional formatting and clear section hierarchy
         """
 
-        # xAI Grok API endpoint
-        GROK_API_URL = "https://api.x.ai/v1/chat/completions"
-
-        # Headers for the API request
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        if team_id:
-            headers["X-Team-ID"] = team_id
-
         # Payload for the API request
         payload = {
             "model": "grok-2-1212",
@@ -270,12 +316,7 @@ def generate_score(candidate_evaluation: str, test_answers: str, api_key: str, t
         }
 
         # Make the API call to Grok
-        response = requests.post(GROK_API_URL, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-
-        # Parse the response
-        response_data = response.json()
-        evaluation = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+        evaluation = await _complete(GROK_API_URL, _headers(api_key, team_id), payload)
 
         if not evaluation:
             raise ValueError("No evaluation generated from Grok API")
@@ -285,8 +326,159 @@ def generate_score(candidate_evaluation: str, test_answers: str, api_key: str, t
             "evaluation": evaluation
         }
 
-    except requests.exceptions.HTTPError as e:
-        if response.status_code == 403:
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 403:
+            return {
+                "status": "error",
+                "message": "Access denied. Check API key or team ID. Possible 'Access to team denied' error."
+            }
+        return {
+            "status": "error",
+            "message": f"HTTP error calling Grok API: {str(e)}"
+        }
+    except httpx.RequestError as e:
+        return {
+            "status": "error",
+            "message": f"Network error calling Grok API: {str(e)}"
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Unexpected error: {str(e)}"
+        }
+
+async def generate_candidate_cv(candidate_cv: str, api_key: str, team_id: str = None) -> Dict[str, Any]:
+    """
+    Generate a structured JSON object from a candidate's CV containing key information using Grok.
+    
+    Args:
+        candidate_cv (str): The candidate's CV/resume text
+        api_key (str): xAI Grok API key.
+        team_id (str, optional): Team ID for API access, if required.
+    
+    Returns:
+        Dict[str, Any]: Result containing status and the parsed JSON or error message.
+    """
+    try:
+        prompt = f"""Please analyze the following CV and extract key information into a structured JSON format.
+        
+        CV Content:
+        {candidate_cv}
+        
+        Extract and return ONLY a JSON object with the following fields:
+        - name: candidate's full name
+        - phone: phone number (if available)
+        - email: email address (if available)
+        - role: most current role
+        - location: city or country
+        - linkedin: LinkedIn URL (if available)
+        - key_skills: array of main technical and professional skills
+        - key_achievements: array of notable professional accomplishments
+        - strengths: array of candidate's core strengths
+        - gaps: array of potential skill or experience gaps
+        - cv_summary: summary of the candidate cv including the key_skills, key_achievements, gaps
+        
+        Ensure the response is a valid JSON object with these exact field names.
+        """
+
+        # Payload for the API request
+        payload = {
+            "model": "grok-2-1212",
+            "messages": [
+                {"role": "system", "content": "You are an expert at parsing resumes and extracting structured information. Always respond with valid JSON only."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 1000
+        }
+
+        # Make the API call to Grok
+        parsed_cv = await _complete(GROK_API_URL, _headers(api_key, team_id), payload)
+
+        if not parsed_cv:
+            raise ValueError("No response generated from Grok API")
+
+        return {
+            "status": "success",
+            "candidate_info": parsed_cv
+        }
+
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 403:
+            return {
+                "status": "error",
+                "message": "Access denied. Check API key or team ID. Possible 'Access to team denied' error."
+            }
+        return {
+            "status": "error",
+            "message": f"HTTP error calling Grok API: {str(e)}"
+        }
+    except httpx.RequestError as e:
+        return {
+            "status": "error",
+            "message": f"Network error calling Grok API: {str(e)}"
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Unexpected error: {str(e)}"
+        }
+
+async def generate_job_desc(job_desc: str, api_key: str, team_id: str = None) -> Dict[str, Any]:
+    """
+    Generate a structured JSON object from a job description containing key information using Grok.
+    
+    Args:
+        job_desc (str): The clients job description
+        api_key (str): xAI Grok API key.
+        team_id (str, optional): Team ID for API access, if required.
+    
+    Returns:
+        Dict[str, Any]: Result containing status and the parsed JSON or error message.
+    """
+    try:
+        prompt = f"""Please analyze the following job description and extract key information into a structured JSON format.
+        
+        Job Description Content:
+        {job_desc}
+        
+        Extract and return ONLY a JSON object with the following fields:
+        - role_name: The Open Role name
+        - background: background information on the team, company, project if available
+        - role_desc: any role description on what the candidate will perform if available
+        - responsibilites: array of all the responsibilities of this role
+        - candidate_requirements: array of candidate requirements and skills required and technical competencies
+        - must_have: array of must have skills and technical competencises
+        - nice_to_have: array of nice to have skills and technical competencies
+        - technical_skills: array of technical skills and competencies
+        
+        Ensure the response is a valid JSON object with these exact field names.
+        """
+
+        # Payload for the API request
+        payload = {
+            "model": "grok-2-1212",
+            "messages": [
+                {"role": "system", "content": "You are an expert at parsing job descriptions and extracting structured information. Always respond with valid JSON only."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 1000
+        }
+
+        # Make the API call to Grok
+        parsed_jd = await _complete(GROK_API_URL, _headers(api_key, team_id), payload)
+
+        if not parsed_jd:
+            raise ValueError("No response generated from Grok API")
+
+        return {
+            "status": "success",
+            "job_desc": parsed_jd
+        }
+
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 403:
             return {
                 "status": "error",
                 "message": "Access denied. Check API key or team ID. Possible 'Access to team denied' error."
@@ -295,7 +487,7 @@ def generate_score(candidate_evaluation: str, test_answers: str, api_key: str, t
             "status": "error",
             "message": f"HTTP error calling Grok API: {str(e)}"
         }
-    except requests.exceptions.RequestException as e:
+    except httpx.RequestError as e:
         return {
             "status": "error",
             "message": f"Network error calling Grok API: {str(e)}"
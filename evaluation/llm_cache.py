@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Content-addressed cache of LLM responses, shared by every worker on the host
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    model TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+def cache_key(provider: str, request: Dict[str, Any]) -> str:
+    """
+    sha256 over the provider and the full request (model, messages/prompt and
+    sampling parameters), so any change to the prompt or settings is a miss.
+    """
+    body = json.dumps({"provider": provider, "request": request}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    SQLite-backed store of LLM responses with a TTL per entry and a total size
+    cap enforced by evicting the least recently used entries.
+    """
+
+    def __init__(self, path: str, ttl: int, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)")
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT response FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+                return row[0]
+            finally:
+                conn.close()
+
+    def set(self, key: str, provider: str, model: Optional[str], response: str) -> None:
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, provider, model, response, size, created_at, accessed_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, provider, model, response, size, now, now, now + self.ttl)
+                )
+                self.writes += 1
+                self._evict(conn, now)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        # Keep the most recently used entries whose running total fits in max_bytes
+        evicted = conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running FROM llm_cache)"
+            " WHERE running > ?)",
+            (self.max_bytes,)
+        ).rowcount
+        self.evictions += expired + evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM llm_cache")
+                conn.commit()
+            finally:
+                conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connect()
+            try:
+                entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            finally:
+                conn.close()
+            lookups = self.hits + self.misses
+            return {
+                "enabled": LLM_CACHE_ENABLED,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions
+            }
+
+
+llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES)
+
+
+async def cached_response(key: str) -> Optional[str]:
+    """Look a response up off the event loop; always a miss when the cache is disabled."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    return await asyncio.to_thread(llm_cache.get, key)
+
+
+async def store_response(key: str, provider: str, model: Optional[str], response: str) -> None:
+    if LLM_CACHE_ENABLED and response:
+        await asyncio.to_thread(llm_cache.set, key, provider, model, response)
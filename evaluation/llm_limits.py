@@ -0,0 +1,70 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+# Upper bound on LLM requests in flight per worker, shared by every provider
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+
+# Seconds before a single provider call is abandoned
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))
+
+# Requests per minute per provider, e.g. LLM_RPM_OPENAI=500; 0 disables the limit
+LLM_RPM = int(os.getenv("LLM_RPM", 60))
+
+_semaphore = None
+_rate_limiters = {}
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """
+    The semaphore every provider call acquires before going out to the network,
+    so a burst of scoring requests queues here instead of piling onto the
+    provider and the event loop.
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` requests, in bursts of up to `burst`."""
+
+    def __init__(self, per_minute: int, burst: int):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.per_minute <= 0:
+            return
+        # Callers wait in arrival order while the bucket refills
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def rate_limiter(provider: str) -> RateLimiter:
+    limiter = _rate_limiters.get(provider)
+    if limiter is None:
+        per_minute = int(os.getenv(f"LLM_RPM_{provider.upper()}", LLM_RPM))
+        limiter = _rate_limiters[provider] = RateLimiter(per_minute, min(per_minute, LLM_MAX_CONCURRENCY))
+    return limiter
+
+
+@asynccontextmanager
+async def llm_slot(provider: str):
+    """Hold one of the shared concurrency slots and one of the provider's rate-limit tokens."""
+    async with llm_semaphore():
+        await rate_limiter(provider).acquire()
+        yield
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+
+# Matches run at once for one batch request; the provider limits in llm_limits still apply
+MATCH_CONCURRENCY = int(os.getenv("MATCH_CONCURRENCY", 5))
+MATCH_CONCURRENCY_MAX = int(os.getenv("MATCH_CONCURRENCY_MAX", 20))
+
+_SCORE_ATTR = re.compile(r"data-[\w-]*score[\w-]*\s*=\s*[\"']?\s*(\d{1,3}(?:\.\d+)?)", re.IGNORECASE)
+_SCORE_TEXT = re.compile(r"match\s+score[^0-9]{0,40}(\d{1,3}(?:\.\d+)?)", re.IGNORECASE)
+_RECOMMENDATION = re.compile(r"\b(DO NOT RECOMMEND|RECOMMEND)\b")
+
+
+def parse_match_score(report: str) -> Optional[str]:
+    """
+    Pull the overall match score out of a match report, preferring the
+    data-attribute the prompt asks for and falling back to the visible text.
+    """
+    if not report:
+        return None
+    match = _SCORE_ATTR.search(report) or _SCORE_TEXT.search(report)
+    if not match:
+        return None
+    score = float(match.group(1))
+    return f"{score:g}" if 0 <= score <= 100 else None
+
+
+def parse_recommendation(report: str) -> Optional[str]:
+    match = _RECOMMENDATION.search(report or "")
+    return match.group(1) if match else None
+
+
+async def run_matches(items: Iterable[Dict[str, Any]],
+                      match: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                      concurrency: int = MATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run `match` for every item with at most `concurrency` in flight and yield
+    each result as soon as it finishes. Remaining matches are cancelled if the
+    consumer stops early (e.g. the client disconnects).
+    """
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, MATCH_CONCURRENCY_MAX)))
+
+    async def bounded(item):
+        async with semaphore:
+            try:
+                return await match(item)
+            except Exception as e:
+                return {**item, "status": "error", "message": str(e)}
+
+    tasks = [asyncio.create_task(bounded(item)) for item in items]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,75 @@
+import importlib
+import os
+import threading
+from typing import Any, AsyncIterator, Dict
+
+# RAYZE_MODEL -> (module implementing the generate_* functions, API key variable,
+# whether the functions take the API key as an argument)
+PROVIDERS = {
+    "OPENAI": ("evaluation.generate_test", "OPENAI_API_KEY", False),
+    "CLAUDE": ("evaluation.generate_test_claude", "ANTHROPIC_API_KEY", False),
+    "GROK": ("evaluation.generate_test_grok", "GROK_API_KEY", True),
+}
+DEFAULT_PROVIDER = "OPENAI"
+
+
+class LLMProvider:
+    """
+    One LLM backend behind a common interface. The backend module, with its
+    SDK and client, is imported on the first call rather than at app startup,
+    and the API key is passed through for backends that take it per call.
+    """
+
+    def __init__(self, name: str):
+        self.name = name if name in PROVIDERS else DEFAULT_PROVIDER
+        self.module_name, self.api_key_env, self._pass_key = PROVIDERS[self.name]
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def api_key(self):
+        return os.getenv(self.api_key_env)
+
+    @property
+    def module(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.module_name)
+        return self._module
+
+    def _function(self, name: str, *args):
+        function = getattr(self.module, name)
+        return function(*args, self.api_key) if self._pass_key else function(*args)
+
+    async def generate_candidate_evaluation(self, job_description: str) -> Dict[str, Any]:
+        return await self._function("generate_candidate_evaluation", job_description)
+
+    async def generate_candidate_match(self, job_description: str, candidate_cv: str) -> Dict[str, Any]:
+        return await self._function("generate_candidate_match", job_description, candidate_cv)
+
+    async def generate_score(self, candidate_evaluation: str, test_answers: str) -> Dict[str, Any]:
+        return await self._function("generate_score", candidate_evaluation, test_answers)
+
+    async def generate_candidate_cv(self, candidate_cv: str) -> Dict[str, Any]:
+        return await self._function("generate_candidate_cv", candidate_cv)
+
+    async def generate_job_desc(self, job_desc: str) -> Dict[str, Any]:
+        return await self._function("generate_job_desc", job_desc)
+
+    def stream_candidate_evaluation(self, job_description: str) -> AsyncIterator[str]:
+        return self._function("stream_candidate_evaluation", job_description)
+
+    def stream_candidate_match(self, job_description: str, candidate_cv: str) -> AsyncIterator[str]:
+        return self._function("stream_candidate_match", job_description, candidate_cv)
+
+
+_providers: Dict[str, LLMProvider] = {}
+
+
+def get_provider(name: str = None) -> LLMProvider:
+    """The provider for `name` (RAYZE_MODEL by default); unknown names fall back to OpenAI."""
+    name = name or os.getenv("RAYZE_MODEL", DEFAULT_PROVIDER)
+    if name not in _providers:
+        _providers[name] = LLMProvider(name)
+    return _providers[name]
@@ -0,0 +1,71 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable
+
+# Placeholder names used by content/invoice_template.html
+INVOICE_PLACEHOLDERS = (
+    "total_due", "due_date", "start_date", "end_date", "invoice_title",
+    "invoice_num", "invoice_date", "client_name", "invoice_table", "rayze_logo",
+)
+
+# Placeholder names used by content/client_work_order.html
+WORK_ORDER_PLACEHOLDERS = (
+    "client_name", "txn_date", "candidate_name", "start_date", "end_date",
+    "client_rate", "client_contact", "rayze_logo",
+)
+
+
+class CompiledTemplate:
+    """
+    A template split once into literal segments and placeholder slots.
+
+    Placeholders only match as whole words, so "start_date" inside
+    "txn_start_date" is left alone, and substituted values are never
+    rescanned. Rendering is a single join over the segments.
+    """
+
+    def __init__(self, text: str, placeholders: Iterable[str]):
+        names = sorted(set(placeholders), key=len, reverse=True)
+        pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in names) + r")\b")
+        # re.split with a capture group alternates literal, name, literal, ...
+        parts = pattern.split(text)
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+
+    def render(self, values: Dict[str, object]) -> str:
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            value = values.get(name)
+            out.append("" if value is None else str(value))
+            out.append(literal)
+        return "".join(out)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_template(path: Path, placeholders: Iterable[str]) -> CompiledTemplate:
+    """
+    Return the compiled template for `path`, reparsing only when the file's
+    mtime changes on disk.
+    """
+    path = os.fspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    key = (path, tuple(placeholders))
+    cached = _cache.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        template = CompiledTemplate(Path(path).read_text(), placeholders)
+        _cache[key] = (mtime, template)
+        return template
+
+
+def render_template(path: Path, placeholders: Iterable[str], values: Dict[str, object]) -> str:
+    return load_template(path, placeholders).render(values)
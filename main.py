@@ -1,45 +1,59 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Query, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import func
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError, NoResultFound
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError, NoResultFound
 from sqlalchemy.future import select
-import jwt
 import hashlib
-from typing import Optional, List  # Add this import at the top with other imports
+import json
+from typing import Optional, List, TYPE_CHECKING  # Add this import at the top with other imports
 
 #import pkg_resources
 #from pydantic import BaseModel
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
-import openai
 import os
-import PyPDF2
-import io
-from models.models import Candidate as DBCandidate, Client as DBClient, Transaction as DBTransaction, Cashflow as DBCashflow, Invoice as DBInvoice, ClientInvoice as DBClientInvoice, User as DBUser, OpenRoles as DBOpenRoles, SubmitCVRole as DBSubmitCVRole, get_db
+from models.models import Candidate as DBCandidate, Client as DBClient, Transaction as DBTransaction, Cashflow as DBCashflow, Invoice as DBInvoice, ClientInvoice as DBClientInvoice, User as DBUser, OpenRoles as DBOpenRoles, SubmitCVRole as DBSubmitCVRole, get_db, SessionLocal, get_engine, get_async_db, get_async_engine, AsyncSessionLocal
+from models.pool import pool_metrics
+from models.repository import repository
+from models.migrations import migrate
 from models.schemas import CandidateCreate, ClientCreate, TransactionCreate, CashflowCreate, InvoiceCreate, ClientInvoiceCreate, UserCreate, Candidate, Client, Transaction, Cashflow, Invoice, ClientInvoice, User
 from models.schemas import CandidateUpdate, ClientUpdate, TransactionUpdate, CashflowUpdate, InvoiceUpdate, ClientInvoiceUpdate, UserUpdate, OpenRoles, OpenRolesCreate, SubmitCVRole, SubmitCVRoleCreate, OpenRolesUpdate, SubmitCVRoleUpdate
-from save_bucket import upload_file, get_file
+from models.console import console_snapshot_async, client_kpis_async, refresh_client_kpis, affected_kpi_clients
+from models.paging import apply_filters, keyset_page, iter_ndjson, order_by_keys
+from save_bucket import storage, upload_file, upload_stream, get_file
+from billing import generate_invoices as generate_transaction_invoices, start_month_end_job, get_billing_job, invoice_hash
+from caching import BoundedLRUCache
+from passwords import hash_password, verify_password, shutdown_executor as shutdown_password_executor
+from auth import Principal, InvalidToken, issue_token, authenticate_token, revoke_tokens, token_versions, principal_cache
+from pdf_text import extract_pdf_file, document_text, document_file_text, shutdown_pool as shutdown_pdf_pool, PDFLimitError, PDF_MAX_BYTES
+from uploads import upload_chunks, spool_upload, spooled, UploadDigest, UploadTooLarge
+from invoice_templates import load_template, render_template, INVOICE_PLACEHOLDERS, WORK_ORDER_PLACEHOLDERS
+from evaluation.llm_cache import llm_cache
+from evaluation.providers import get_provider
+from evaluation.matching import run_matches, parse_match_score, parse_recommendation, MATCH_CONCURRENCY
+from evaluation.llm_limits import LLM_TIMEOUT
+# evaluation.embeddings / evaluation.ann (numpy) and httpx are imported inside the handlers
+# that use them, like the LLM SDKs behind evaluation.providers, so workers boot without them
+if TYPE_CHECKING:
+    import httpx
 import random
+import asyncio
 
 # Initialize
 load_dotenv()
 RAYZE_HOST = os.getenv('RAYZE_HOST')
 RAYZE_LOCALHOST = os.getenv('RAYZE_LOCALHOST')
 
-# Set API key based on model
+# LLM backend chosen by RAYZE_MODEL; its SDK is imported on the first LLM request
 model = os.getenv("RAYZE_MODEL", "OPENAI")
-if model == "CLAUDE":
-    llm_api_key = os.getenv("ANTHROPIC_API_KEY")
-    from evaluation.generate_test_claude import generate_candidate_evaluation, generate_candidate_match, generate_score, generate_candidate_cv, generate_job_desc
-elif model == "GROK":
-    llm_api_key = os.getenv("GROK_API_KEY")
-    from evaluation.generate_test_grok import generate_candidate_evaluation, generate_candidate_match, generate_score, generate_candidate_cv, generate_job_desc
-else:  # Default to OpenAI
-    llm_api_key = os.getenv("OPENAI_API_KEY")
-    from evaluation.generate_test import generate_candidate_evaluation, generate_candidate_match, generate_score, generate_candidate_cv, generate_job_desc
+llm = get_provider(model)
+llm_api_key = llm.api_key
 
 from pydantic import BaseModel
 
@@ -48,11 +62,29 @@ PATH_TO_BLOG = Path('.')
 PATH_TO_CONTENT = PATH_TO_BLOG/"content"
 PATH_TO_CONTENT.mkdir(exist_ok=True, parents=True)
 RAYZE_LOGO = PATH_TO_CONTENT/"rayze_logo.jpg"
-
-# JWT Define a secret key (change this to a secure random value in production)
-SECRET_KEY = os.getenv("RAYZE_KEY")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 300
+INVOICE_TEMPLATE = PATH_TO_CONTENT/"invoice_template.html"
+WORK_ORDER_TEMPLATE = PATH_TO_CONTENT/"client_work_order.html"
+
+# The schema is migrated by the release step (python -m models.migrations); set this to
+# also apply pending migrations when the app starts, e.g. against a local SQLite database
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# How often the client KPI rollup is rebuilt to age records out of the 30 day window (0 disables)
+CLIENT_KPI_REFRESH_SECONDS = int(os.getenv("CLIENT_KPI_REFRESH_SECONDS", 900))
+
+# Rendered public invoices: in-process cache budget and browser cache lifetime.
+# update_client_invoice only evicts from its own worker's cache, so entries expire
+# after INVOICE_CACHE_TTL seconds and every worker serves an edit within that window.
+INVOICE_CACHE_MAX_BYTES = int(os.getenv("INVOICE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+INVOICE_CACHE_MAX_ENTRIES = int(os.getenv("INVOICE_CACHE_MAX_ENTRIES", 1024))
+INVOICE_CACHE_TTL = int(os.getenv("INVOICE_CACHE_TTL", 60))
+INVOICE_CACHE_MAX_AGE = int(os.getenv("INVOICE_CACHE_MAX_AGE", INVOICE_CACHE_TTL))
+invoice_cache = BoundedLRUCache(max_entries=INVOICE_CACHE_MAX_ENTRIES, max_bytes=INVOICE_CACHE_MAX_BYTES,
+                                ttl=INVOICE_CACHE_TTL, sizeof=lambda entry: len(entry[0]))
+
+# Default and maximum page sizes for the /list_* endpoints
+PAGE_SIZE = 100
+PAGE_SIZE_MAX = 1000
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -81,48 +113,53 @@ app.add_middleware(
 # Function to generate access token route
 @app.post("/generate_token")
 async def generate_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user[1]}, expires_delta=access_token_expires
-    )
+    access_token = issue_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
+# Function to resolve the bearer token to its user from the token's claims, without a database lookup
+async def current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    try:
+        return await authenticate_token(token)
+    except InvalidToken as e:
+        print(f"Rejected token: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
 # Function to verify token route
 @app.post("/verify_token")
 async def verify_token(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    user_name: str = payload.get("sub")
-    if user_name is None:
-        raise credentials_exception
-    #token_data = TokenData(username=user_name)
+    await current_principal(token)
     return token
 
+# Function to sign the caller out everywhere by revoking every token issued to them
+@app.post("/revoke_tokens")
+async def revoke_my_tokens(principal: Principal = Depends(current_principal)):
+    version = await revoke_tokens(principal.id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"message": "Tokens revoked successfully"}
+
 # Authenticataion functions
 @app.post("/authenticate")
 async def authenticate(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.name}, expires_delta=access_token_expires
-    )
+    access_token = issue_token(user)
     # Add user info in a new field, but keep access_token and token_type as before
     user_info = {
         "id": user.id,
@@ -133,46 +170,31 @@ async def authenticate(form_data: OAuth2PasswordRequestForm = Depends()):
     }
     return {"access_token": access_token, "token_type": "bearer", "user": user_info}
 
-# Function to hash passwords
-def get_password_hash(password: str):
-    password_bytes = password.encode('utf-8')
-    hash_obj = hashlib.sha256()
-    hash_obj.update(password_bytes)
-    hashed_password = hash_obj.hexdigest()
-    return hashed_password
-
-# Function to verify passwords
-def verify_password(plain_password, hashed_password):
-    #     Verify if a plain text password matches the hashed password.
-    hashed_input_password = get_password_hash(plain_password)
-    print("plain pwd inp: ", plain_password, "hashed pwd inp: ", hashed_password, "hash(plain_pwd) :", hashed_input_password, "hashOfKey: ",get_password_hash(SECRET_KEY),"key: ", SECRET_KEY)
-    if hashed_input_password == hashed_password:
-        return True
-    else:
-        return False
-
-
-# Function to generate access token
-def create_access_token(data: dict, expires_delta: timedelta):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
 
 # Function to authenticate users
-def authenticate_user(username: str, password: str):
-    db = next(get_db())
-    try:
-        user_data = find_user_by_name(username, db)
-        print('verify ', user_data.name, password, user_data.password)
-        if user_data and verify_password(password, user_data.password):
-            return user_data  # Return the full user object
-    except HTTPException as e:
-        print(e.detail)
-    finally:
-        db.close()
-    return None
+async def authenticate_user(username: str, password: str):
+    # One indexed lookup (users.name is unique) on a pooled async connection
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        result = await db.execute(select(DBUser).where(DBUser.name == username))
+        user_data = result.scalars().first()
+    if user_data is None:
+        print(f"User {username} not found")
+        return None
+    # scrypt runs in the password hashing pool, off the event loop
+    matches, needs_rehash = await verify_password(password, user_data.password)
+    if not matches:
+        return None
+    if needs_rehash:
+        # Upgrade a legacy SHA-256 (or outdated scrypt) hash now that the password is known
+        try:
+            new_hash = await hash_password(password)
+            async with AsyncSessionLocal(bind=get_async_engine()) as db:
+                await db.execute(update(DBUser).where(DBUser.id == user_data.id, DBUser.password == user_data.password)
+                                 .values(password=new_hash))
+                await db.commit()
+        except SQLAlchemyError as e:
+            print(f"Error upgrading password hash for user {user_data.id}: {str(e)}")
+    return user_data  # Return the full user object
 
 # Function to save data to the database
 def save_data(db, model, data):
@@ -187,66 +209,38 @@ def save_data(db, model, data):
 
 # Function to get all records from a table
 def get_all_records(table_name):
-    session = SessionLocal()
     try:
-        table = Table(table_name, metadata, autoload_with=engine)
-        results = session.execute(table.select()).fetchall()
-        return results
-    except SQLAlchemyError as e:
+        return repository.all(table_name)
+    except (SQLAlchemyError, ValueError) as e:
         print(f"Error fetching records: {e}")
-    finally:
-        session.close()
 
 # Function to update data in the database
 def update_data(table_name, record_id, data):
-    session = SessionLocal()
     try:
-        table = Table(table_name, metadata, autoload_with=engine)
-        update_values = {key: value for key, value in data.items()}
-        session.execute(
-            table.update().where(table.c.id == record_id).values(update_values)
-        )
-        session.commit()
-    except SQLAlchemyError as e:
+        repository.update(table_name, record_id, data)
+    except (SQLAlchemyError, ValueError) as e:
         print(f"Error updating data: {e}")
-    finally:
-        session.close()
 
 # Function to find a record by ID
 def find_record_by_id(table_name, record_id):
-    session = SessionLocal()
     try:
-        table = Table(table_name, metadata, autoload_with=engine)
-        result = session.execute(table.select().where(table.c.id == record_id)).fetchone()
-        return result
-    except SQLAlchemyError as e:
+        return repository.find_by_id(table_name, record_id)
+    except (SQLAlchemyError, ValueError) as e:
         print(f"Error finding record by ID: {e}")
-    finally:
-        session.close()
 
 # Function to find a record by field
 def find_record_by_field(table_name, field_name, field_value):
-    session = SessionLocal()
     try:
-        table = Table(table_name, metadata, autoload_with=engine)
-        result = session.execute(table.select().where(table.c[field_name] == field_value)).fetchall()
-        return result
-    except SQLAlchemyError as e:
+        return repository.find_by_field(table_name, field_name, field_value)
+    except (SQLAlchemyError, ValueError) as e:
         print(f"Error finding record by field: {e}")
-    finally:
-        session.close()
 
 # Function to find a record by name
 def find_record_by_name(table_name, name):
-    session = SessionLocal()
     try:
-        table = Table(table_name, metadata, autoload_with=engine)
-        result = session.execute(table.select().where(table.c.name == name)).fetchone()
-        return result
-    except SQLAlchemyError as e:
+        return repository.find_by_name(table_name, name)
+    except (SQLAlchemyError, ValueError) as e:
         print(f"Error finding record by name: {e}")
-    finally:
-        session.close()
 
 @app.get("/get_client_transactions/{recruiter_id}")
 def get_client_transactions(recruiter_id: int, db: Session = Depends(get_db),
@@ -387,78 +381,13 @@ def get_console_activity(db: Session = Depends(get_db), user_name: str = Depends
         )
 
 @app.get("/get_console_data")
-def get_console_data(client_id: Optional[int] = None, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+async def get_console_data(client_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db), user_name: str = Depends(verify_token)):
     try:
-        # Base query for candidates on payroll (status = Hired)
-        payroll_query = db.query(func.count(DBCandidate.id))\
-            .filter(DBCandidate.status == 'Hired')
-                
-        payroll_candidates = payroll_query.scalar()
-
         # Calculate date 31 days ago
         thirty_one_days_ago = datetime.utcnow() - timedelta(days=31)
-        
-        # Base query for candidates hired in the last 31 days
-        hired_query = db.query(func.count(DBTransaction.id))\
-            .filter(DBTransaction.start_date >= thirty_one_days_ago)
-        
-        hired_last_month = hired_query.scalar()
-
-        # Base query for total submitted CVs for open roles
-        submit_query = db.query(func.count(DBSubmitCVRole.id))\
-            .join(DBOpenRoles, DBSubmitCVRole.open_roles_id == DBOpenRoles.id)\
-            .filter(DBOpenRoles.status == 'Open')
-        
-        submit_cvs = submit_query.scalar()
-
-        # Base query for submitted CVs in the last 31 days for open roles
-        submit_last_month_query = db.query(func.count(DBSubmitCVRole.id))\
-            .join(DBOpenRoles, DBSubmitCVRole.open_roles_id == DBOpenRoles.id)\
-            .filter(DBOpenRoles.status == 'Open')\
-            .filter(DBSubmitCVRole.submitted_on >= thirty_one_days_ago)
-        
-        submit_last_month = submit_last_month_query.scalar()
 
-        # Base query for total active open roles
-        active_roles_query = db.query(func.count(DBOpenRoles.id))\
-            .filter(DBOpenRoles.status == 'Open')
-        
-        
-        active_roles = active_roles_query.scalar()
-
-        # Base query for open roles created in the last 31 days
-        roles_last_month_query = db.query(func.count(DBOpenRoles.id))\
-            .filter(DBOpenRoles.status == 'Open')\
-            .filter(DBOpenRoles.posted_on >= thirty_one_days_ago)
-        
-        
-        roles_last_month = roles_last_month_query.scalar()
-
-        # Base query for most recent invoice date
-        max_invoice_query = db.query(func.max(DBInvoice.inv_date))
-        
-        
-        max_invoice_date = max_invoice_query.scalar()
-
-        # Base query for total hours in the most recent invoice month
-        invoice_hours = 0
-        if max_invoice_date:
-            invoice_hours_query = db.query(func.sum(DBInvoice.hours_worked))\
-                .filter(DBInvoice.inv_date == max_invoice_date)
-            
-        
-            invoice_hours = invoice_hours_query.scalar() or 0
-
-        return {
-            "payroll_candidates": payroll_candidates or 0,
-            "hired_last_month": hired_last_month or 0,
-            "submit_cvs": submit_cvs or 0,
-            "submit_last_month": submit_last_month or 0,
-            "active_roles": active_roles or 0,
-            "roles_last_month": roles_last_month or 0,
-            "max_invoice_date": max_invoice_date if max_invoice_date else None,
-            "invoice_hours": invoice_hours
-        }
+        # All dashboard counters come back from a single aggregate query
+        return await console_snapshot_async(db, thirty_one_days_ago)
     except Exception as e:
         print(f"Error in get_console_data: {str(e)}")
         raise HTTPException(
@@ -467,102 +396,10 @@ def get_console_data(client_id: Optional[int] = None, db: Session = Depends(get_
         )
 
 @app.get("/get_console_data_by_client/{client_id}")
-def get_console_data_by_client(client_id: int, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+async def get_console_data_by_client(client_id: int, db: AsyncSession = Depends(get_async_db), user_name: str = Depends(verify_token)):
     try:
-        # Base query for candidates on payroll (status = Hired)
-        total_client_hires_query = db.query(func.count(DBCandidate.id))\
-            .filter(DBCandidate.status == 'Hired')\
-            .filter(DBCandidate.client_id == client_id)
-                
-        total_active_eng = total_client_hires_query.scalar() #return this
-        # Calculate date 31 days ago
-        thirty_one_days_ago = datetime.utcnow() - timedelta(days=31)
-
-        # Base query for candidates on payroll (status = Hired)
-        total_client_hires_query = db.query(func.count(DBCandidate.id))\
-            .filter(DBCandidate.status == 'Hired')\
-            .filter(DBTransaction.start_date >= thirty_one_days_ago)\
-            .filter(DBCandidate.id == DBTransaction.candidate_id)\
-            .filter(DBCandidate.client_id == client_id)
-        
-        total_active_eng_last30 = total_client_hires_query.scalar() #return this
-
-
-        # Base query for candidates  in the last 31 days
-        hired_query = db.query(func.count(DBTransaction.id))\
-            .filter(DBTransaction.start_date >= thirty_one_days_ago)\
-            .filter(DBTransaction.candidate_id.in_(
-                db.query(DBCandidate.id).filter(DBCandidate.client_id == client_id)
-            ))
-        
-        hired_last30 = hired_query.scalar()
-
-        # Base query for total submitted CVs for open roles
-        submit_query = db.query(func.count(DBSubmitCVRole.id))\
-            .join(DBOpenRoles, DBSubmitCVRole.open_roles_id == DBOpenRoles.id)\
-            .filter(DBOpenRoles.status == 'Open')\
-            .filter(DBOpenRoles.client_id == client_id)
-        
-        submit_client_cvs = submit_query.scalar()
-
-        # Base query for submitted CVs in the last 31 days for open roles
-        submit_last_month_query = db.query(func.count(DBSubmitCVRole.id))\
-            .join(DBOpenRoles, DBSubmitCVRole.open_roles_id == DBOpenRoles.id)\
-            .filter(DBOpenRoles.status == 'Open')\
-            .filter(DBSubmitCVRole.submitted_on >= thirty_one_days_ago)\
-            .filter(DBSubmitCVRole.candidates_id.in_(
-                db.query(DBCandidate.id).filter(DBCandidate.client_id == client_id)
-            ))
-        
-        submit_client_cvs_last30 = submit_last_month_query.scalar() #return this
-
-        # Base query for total active open roles
-        active_roles_query = db.query(func.count(DBOpenRoles.id))\
-            .filter(DBOpenRoles.status == 'Open')\
-            .filter(DBOpenRoles.client_id == client_id)
-        
-        
-        active_client_roles = active_roles_query.scalar()
-
-        # Base query for open roles created in the last 31 days
-        roles_last_month_query = db.query(func.count(DBOpenRoles.id))\
-            .filter(DBOpenRoles.status == 'Open')\
-            .filter(DBOpenRoles.posted_on >= thirty_one_days_ago)\
-            .filter(DBOpenRoles.client_id == client_id)
-        
-        
-        active_client_roles_last30 = roles_last_month_query.scalar() #return this
-
-        # Base query for total submitted CVs for open roles
-        submit_query = db.query(func.count(DBSubmitCVRole.id))\
-            .join(DBOpenRoles, DBSubmitCVRole.open_roles_id == DBOpenRoles.id)\
-            .filter(DBOpenRoles.status == 'Hired')\
-            .filter(DBOpenRoles.client_id == client_id)
-        
-        hired_client_cvs = submit_query.scalar() #return this
-
-        # Base query for submitted CVs in the last 31 days for open roles
-        submit_last_month_query = db.query(func.count(DBSubmitCVRole.id))\
-            .join(DBOpenRoles, DBSubmitCVRole.open_roles_id == DBOpenRoles.id)\
-            .filter(DBOpenRoles.status == 'Hired')\
-            .filter(DBSubmitCVRole.submitted_on >= thirty_one_days_ago)\
-            .filter(DBSubmitCVRole.candidates_id.in_(
-                db.query(DBCandidate.id).filter(DBCandidate.client_id == client_id)
-            ))
-        
-        hired_client_cvs_last30 = submit_last_month_query.scalar() #return this
-
-
-        return {
-            "total_active_eng": total_active_eng or 0,
-            "total_active_eng_last30": total_active_eng_last30 or 0,
-            "submit_client_cvs": submit_client_cvs or 0,
-            "submit_client_cvs_last30": submit_client_cvs_last30 or 0,
-            "active_client_roles": active_client_roles or 0,
-            "active_client_roles_last30": active_client_roles_last30 or 0,
-            "hired_client_cvs": hired_client_cvs or 0,
-            "hired_client_cvs_last30": hired_client_cvs_last30 or 0,
-        }
+        # Counters are maintained in the client_kpis rollup, so this is a single row read
+        return await client_kpis_async(db, client_id)
     except Exception as e:
         print(f"Error in get_console_data: {str(e)}")
         raise HTTPException(
@@ -570,16 +407,79 @@ def get_console_data_by_client(client_id: int, db: Session = Depends(get_db), us
             detail=f"Error retrieving console data: {str(e)}"
         )
 
+# Keep the client_kpis rollup in step with writes to its source tables
+def refresh_kpis_after_write(db: Session, client_ids=(), candidate_ids=(), role_ids=()):
+    try:
+        refresh_client_kpis(db, affected_kpi_clients(db, client_ids, candidate_ids, role_ids))
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"Error refreshing client KPIs: {str(e)}")
+
+# Periodically rebuild every client's KPI row so the rolling 30 day counters age out
+async def refresh_client_kpis_periodically():
+    while True:
+        await asyncio.sleep(CLIENT_KPI_REFRESH_SECONDS)
+        db = SessionLocal()
+        try:
+            await run_in_threadpool(refresh_client_kpis, db)
+        except Exception as e:
+            db.rollback()
+            print(f"Error in scheduled client KPI refresh: {str(e)}")
+        finally:
+            db.close()
+
+@app.on_event("startup")
+async def migrate_schema():
+    if DB_MIGRATE_ON_STARTUP:
+        await run_in_threadpool(migrate)
+
+@app.on_event("startup")
+def preload_templates():
+    # Parse the invoice and work order templates once, before the first request
+    load_template(INVOICE_TEMPLATE, INVOICE_PLACEHOLDERS)
+    load_template(WORK_ORDER_TEMPLATE, WORK_ORDER_PLACEHOLDERS)
+
+@app.on_event("startup")
+async def schedule_client_kpi_refresh():
+    if CLIENT_KPI_REFRESH_SECONDS > 0:
+        asyncio.create_task(refresh_client_kpis_periodically())
+
+@app.on_event("shutdown")
+def stop_pdf_workers():
+    shutdown_pdf_pool()
+
+@app.on_event("shutdown")
+def stop_password_hash_workers():
+    shutdown_password_executor()
+
+@app.on_event("shutdown")
+async def close_storage_client():
+    await storage.aclose()
+
+
+# Connection pool metrics (checked out, idle and overflow connections, checkout wait time), LLM and auth cache counters
+@app.get("/metrics")
+def metrics():
+    return {
+        "db_pool": pool_metrics(get_engine()),
+        "async_db_pool": pool_metrics(get_async_engine().sync_engine),
+        "llm_cache": llm_cache.stats(),
+        "auth_cache": principal_cache.stats()
+    }
+
 
 # Function to handle new candidate creation
 @app.post("/new_candidate", response_model=Candidate)
-def create_candidate(candidate: CandidateCreate, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+def create_candidate(candidate: CandidateCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
     
     candidate_data = DBCandidate(**candidate.dict())
     print(candidate_data)
     db.add(candidate_data)
     db.commit()
     db.refresh(candidate_data)
+    refresh_kpis_after_write(db, client_ids=[candidate_data.client_id])
+    if candidate_data.cv_link:
+        background_tasks.add_task(index_candidate_cv, candidate_data.id, candidate_data.cv_link)
     return candidate_data
 
 
@@ -599,6 +499,7 @@ def create_transaction(transaction: TransactionCreate, db: Session = Depends(get
     db.add(transaction_data)
     db.commit()
     db.refresh(transaction_data)
+    refresh_kpis_after_write(db, candidate_ids=[transaction_data.candidate_id])
     return transaction_data
 
 # Function to handle new cashflow creation
@@ -621,11 +522,21 @@ def create_invoice(invoice: InvoiceCreate, db: Session = Depends(get_db),
     return invoice_data
 
 # Function to handle new client invoice creation
+# inv_hash is derived from the new id, as in submit_client_invoice, rather than taken from the caller
 @app.post("/new_client_invoice", response_model=ClientInvoice)
 def create_client_invoice(invoice: ClientInvoiceCreate, db: Session = Depends(get_db)):
-    client_invoice_data = DBClientInvoice(**invoice.dict())
-    db.add(client_invoice_data)
-    db.commit()
+    try:
+        client_invoice_data = DBClientInvoice(**invoice.dict(exclude={"inv_hash"}))
+        db.add(client_invoice_data)
+        db.flush()
+        client_invoice_data.inv_hash = invoice_hash(client_invoice_data.id, invoice.client_id, invoice.inv_date)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail=f"Client {invoice.client_id} is already invoiced for {invoice.period_start} to {invoice.period_end}"
+        )
     db.refresh(client_invoice_data)
     return client_invoice_data
 
@@ -640,7 +551,7 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
 
 # Function to handle new open role creation
 @app.post("/new_open_role", response_model=OpenRoles)
-def create_open_role(open_role: OpenRolesCreate, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+def create_open_role(open_role: OpenRolesCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
     # Convert posted_on string to datetime
     open_role_dict = open_role.dict()
     #open_role_dict['posted_on'] = datetime.strptime(open_role_dict['posted_on'], '%Y-%m-%dT%H:%M:%S.%fZ')
@@ -649,71 +560,116 @@ def create_open_role(open_role: OpenRolesCreate, db: Session = Depends(get_db),
     db.add(open_role_data)
     db.commit()
     db.refresh(open_role_data)
+    refresh_kpis_after_write(db, client_ids=[open_role_data.client_id])
+    if open_role_data.jd_doc or open_role_data.role_desc:
+        background_tasks.add_task(index_role_text, open_role_data.id, open_role_data.jd_doc or open_role_data.role_desc)
     return open_role_data
 
 # Function to handle new CV role submission
 @app.post("/new_submit_cvrole",response_model=SubmitCVRole)
 async def create_submit_cvrole(
     submit_cvrole: SubmitCVRoleCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_name: str = Depends(verify_token)
 ):
     """Create a new CV role submission"""
     try:
         submit_cvrole_data = DBSubmitCVRole(**submit_cvrole.dict())
         db.add(submit_cvrole_data)
-        db.commit()
-        db.refresh(submit_cvrole_data)
-        return {
+        await db.commit()
+        await db.refresh(submit_cvrole_data)
+        submitted = {
             key: value 
             for key, value in submit_cvrole_data.__dict__.items() 
             if not key.startswith('_')
         }
+        await db.run_sync(refresh_kpis_after_write, candidate_ids=[submit_cvrole_data.candidates_id], role_ids=[submit_cvrole_data.open_roles_id])
+        return submitted
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error creating submit_cvrole: {str(e)}")
         raise HTTPException(
             status_code=400,
             detail=f"Error creating submission: {str(e)}"
         )
 
+# Shared implementation of the /list_* endpoints.
+# With no paging arguments the full list is returned as before; `limit`/`cursor`
+# return one keyset page and `stream=true` streams every row as NDJSON.
+def list_records(db: Session, model, filters: dict, cursor: Optional[str] = None, limit: Optional[int] = None,
+                 stream: bool = False, keys=None, descending: bool = False, options=()):
+    sorted_listing = keys is not None
+    keys = keys or [model.id]
+    if stream:
+        def stream_rows():
+            # The request session is closed before a streamed body is sent, so use our own
+            stream_db = SessionLocal()
+            try:
+                stream_query = apply_filters(stream_db.query(model).options(*options), model, filters)
+                yield from iter_ndjson(stream_query, keys, descending)
+            finally:
+                stream_db.close()
+        return StreamingResponse(stream_rows(), media_type="application/x-ndjson")
+
+    query = apply_filters(db.query(model).options(*options), model, filters)
+    if cursor or limit:
+        return keyset_page(query, keys, cursor, limit or PAGE_SIZE, descending)
+    if sorted_listing:
+        query = order_by_keys(query, keys, descending)
+    return query.all()
+
 # Function to list all candidates
 @app.get("/list_candidates")
-def list_candidates(db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
-    candidates = db.query(DBCandidate).all()
-    return candidates
+def list_candidates(status: Optional[str] = None, client_id: Optional[int] = None, role: Optional[str] = None,
+                    cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+                    stream: bool = False, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+    filters = {"status": status, "client_id": client_id, "role": role}
+    return list_records(db, DBCandidate, filters, cursor, limit, stream)
 
 # Function to list all clients
 @app.get("/list_clients")
-def list_clients(db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
-    clients = db.query(DBClient).all()
-    return clients
+def list_clients(client_type: Optional[str] = None, payment_freq: Optional[str] = None,
+                 cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+                 stream: bool = False, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+    filters = {"client_type": client_type, "payment_freq": payment_freq}
+    return list_records(db, DBClient, filters, cursor, limit, stream)
 
 # Function to list all transactions
 @app.get("/list_transactions")
-def list_transactions(db: Session = Depends(get_db)):
-    transactions = db.query(DBTransaction).all()
-    return transactions
+def list_transactions(client_id: Optional[int] = None, candidate_id: Optional[int] = None, recruiter_id: Optional[int] = None,
+                      cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+                      stream: bool = False, db: Session = Depends(get_db)):
+    filters = {"client_id": client_id, "candidate_id": candidate_id, "recruiter_id": recruiter_id}
+    return list_records(db, DBTransaction, filters, cursor, limit, stream)
 
 # Function to list all cashflows
 @app.get("/list_cashflows")
-def list_cashflows(db: Session = Depends(get_db)):
-    cashflows = db.query(DBCashflow).all()
-    return cashflows
+def list_cashflows(txn_id: Optional[int] = None, pay_from_id: Optional[int] = None, pay_to_id: Optional[int] = None,
+                   cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+                   stream: bool = False, db: Session = Depends(get_db)):
+    filters = {"txn_id": txn_id, "pay_from_id": pay_from_id, "pay_to_id": pay_to_id}
+    return list_records(db, DBCashflow, filters, cursor, limit, stream)
 
 # Function to list all invoices
 @app.get("/list_invoices")
-def list_invoices(db: Session = Depends(get_db)):
-    invoices = db.query(DBInvoice).all()
-    return invoices
-
-# Function to list all client invoices
+def list_invoices(txn_id: Optional[int] = None, candidate_id: Optional[int] = None, inv_status: Optional[str] = None,
+                  cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+                  stream: bool = False, db: Session = Depends(get_db)):
+    filters = {"txn_id": txn_id, "candidate_id": candidate_id, "inv_status": inv_status}
+    return list_records(db, DBInvoice, filters, cursor, limit, stream)
+
+# Function to list all client invoices, newest first.
+# summary=true leaves out the rendered inv_html and explain_str bodies; fetch
+# those per invoice through /find_client_invoice or /get_invoice.
 @app.get("/list_client_invoices")
-def list_client_invoices(db: Session = Depends(get_db),
-    user_name: str = Depends(verify_token)):
-    ##client_invoices = db.query(DBClientInvoice).all()
-    client_invoices = db.query(DBClientInvoice).order_by(DBClientInvoice.inv_date.desc()).all()
-    return client_invoices
+def list_client_invoices(client_id: Optional[int] = None, inv_status: Optional[str] = None, summary: bool = False,
+                         cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+                         stream: bool = False, db: Session = Depends(get_db),
+                         user_name: str = Depends(verify_token)):
+    filters = {"client_id": client_id, "inv_status": inv_status}
+    options = [defer(DBClientInvoice.inv_html), defer(DBClientInvoice.explain_str)] if summary else []
+    return list_records(db, DBClientInvoice, filters, cursor, limit, stream,
+                        keys=[DBClientInvoice.inv_date, DBClientInvoice.id], descending=True, options=options)
 
 # Function to list all users
 @app.get("/list_users")
@@ -722,28 +678,38 @@ def list_users(db: Session = Depends(get_db)):
     return users
 
 @app.get("/list_open_roles")
-def list_open_roles(db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
-    open_roles = db.query(DBOpenRoles).all()
-    return open_roles
+def list_open_roles(client_id: Optional[int] = None, status: Optional[str] = None,
+                    cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+                    stream: bool = False, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+    filters = {"client_id": client_id, "status": status}
+    return list_records(db, DBOpenRoles, filters, cursor, limit, stream)
 
 # Function to list all CV role submissions
 @app.get("/list_submit_cvroles")
-def list_submit_cvroles(db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
-    submit_cvroles = db.query(DBSubmitCVRole).all()
-    return submit_cvroles
+def list_submit_cvroles(client_id: Optional[int] = None, open_roles_id: Optional[int] = None,
+                        candidates_id: Optional[int] = None, status: Optional[str] = None,
+                        cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+                        stream: bool = False, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+    filters = {"client_id": client_id, "open_roles_id": open_roles_id, "candidates_id": candidates_id, "status": status}
+    return list_records(db, DBSubmitCVRole, filters, cursor, limit, stream)
 
 # Function to update a candidate
 @app.put("/update_candidate/{candidate_id}")
-def update_candidate(candidate_id: int, candidate: CandidateUpdate, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
+def update_candidate(candidate_id: int, candidate: CandidateUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), user_name: str = Depends(verify_token)):
     candidate_to_update = db.query(DBCandidate).filter(DBCandidate.id == candidate_id).first()
     if not candidate_to_update:
         raise HTTPException(status_code=404, detail="Candidate not found")
 
+    previous_client_id = candidate_to_update.client_id
+    previous_cv_link = candidate_to_update.cv_link
     for key, value in candidate.dict(exclude_unset=True).items():
         setattr(candidate_to_update, key, value)
     
     db.commit()
     db.refresh(candidate_to_update)
+    refresh_kpis_after_write(db, client_ids=[previous_client_id, candidate_to_update.client_id])
+    if candidate_to_update.cv_link and candidate_to_update.cv_link != previous_cv_link:
+        background_tasks.add_task(index_candidate_cv, candidate_id, candidate_to_update.cv_link)
     return {"message": "Candidate updated successfully"}
 
 # Function to update a client
@@ -767,11 +733,13 @@ def update_transaction(transaction_id: int, transaction: TransactionUpdate, db:
     if not transaction_to_update:
         raise HTTPException(status_code=404, detail="Transaction not found")
 
+    previous_candidate_id = transaction_to_update.candidate_id
     for key, value in transaction.dict(exclude_unset=True).items():
         setattr(transaction_to_update, key, value)
     
     db.commit()
     db.refresh(transaction_to_update)
+    refresh_kpis_after_write(db, candidate_ids=[previous_candidate_id, transaction_to_update.candidate_id])
     return {"message": "Transaction updated successfully"}
 
 # Function to update a cashflow
@@ -809,11 +777,19 @@ def update_client_invoice(invoice_id: int, invoice: ClientInvoiceUpdate, db: Ses
     if not client_invoice_to_update:
         raise HTTPException(status_code=404, detail="Client Invoice not found")
 
+    previous_hash = client_invoice_to_update.inv_hash
     for key, value in invoice.dict(exclude_unset=True).items():
         setattr(client_invoice_to_update, key, value)
     
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another invoice already has this inv_hash, or this client and period
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Another client invoice has the same inv_hash or client and period")
     db.refresh(client_invoice_to_update)
+    invoice_cache.pop(previous_hash)
+    invoice_cache.pop(client_invoice_to_update.inv_hash)
     return {"message": "Client Invoice updated successfully"}
 
 # Function to update a user
@@ -823,17 +799,23 @@ def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_db)):
     if not user_to_update:
         raise HTTPException(status_code=404, detail="User not found")
 
-    for key, value in user.dict(exclude_unset=True).items():
+    changes = user.dict(exclude_unset=True)
+    for key, value in changes.items():
         setattr(user_to_update, key, value)
+    # Tokens already issued carry the old name, role and client, so revoke them
+    if changes.keys() & {"name", "password", "role", "client_id"}:
+        user_to_update.token_version = (user_to_update.token_version or 0) + 1
     
     db.commit()
     db.refresh(user_to_update)
+    token_versions.bump(user_to_update.id, user_to_update.token_version)
     return {"message": "User updated successfully"}
 
 @app.put("/update_open_role/{role_id}", response_model=OpenRoles)
 def update_open_role(
     role_id: int, 
     role_update: OpenRolesUpdate, 
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user_name: str = Depends(verify_token)
 ):
@@ -843,6 +825,8 @@ def update_open_role(
         raise HTTPException(status_code=404, detail="Open role not found")
 
     # Update the role's attributes
+    previous_client_id = db_role.client_id
+    previous_text = db_role.jd_doc or db_role.role_desc
     update_data = role_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_role, key, value)
@@ -850,6 +834,10 @@ def update_open_role(
     try:
         db.commit()
         db.refresh(db_role)
+        refresh_kpis_after_write(db, client_ids=[previous_client_id], role_ids=[db_role.id])
+        role_text = db_role.jd_doc or db_role.role_desc
+        if role_text and role_text != previous_text:
+            background_tasks.add_task(index_role_text, db_role.id, role_text)
         return db_role
     except SQLAlchemyError as e:
         db.rollback()
@@ -1082,94 +1070,125 @@ def generate_client_work_order(transaction: TransactionCreate, db: Session = Dep
 @app.post("/submit_client_invoice")
 def submit_client_invoice(invoice: ClientInvoiceCreate, db: Session = Depends(get_db),
     user_name: str = Depends(verify_token)):
-    invoice_data = DBClientInvoice(**invoice.dict())    
-    db.add(invoice_data)
-    db.commit()
-    db.refresh(invoice_data)
-
-    # Extract the client invoice id
-    inv_id = db.query(func.max(DBClientInvoice.id))\
-               .filter(DBClientInvoice.inv_date == invoice.inv_date,
-                       DBClientInvoice.client_id == invoice.client_id)\
-               .scalar()
-
-    if inv_id:
-        # Update invoice HTML and hash
-        invoice.inv_html = create_html_invoice(inv_id, invoice, db)
-        invoice.inv_hash = get_password_hash(f"{inv_id}_{invoice.client_id}_{invoice.inv_date}")
-
-        db.query(DBClientInvoice)\
-          .filter(DBClientInvoice.id == inv_id)\
-          .update({"inv_html": invoice.inv_html, "inv_hash": invoice.inv_hash})
+    try:
+        invoice_data = DBClientInvoice(**invoice.dict(exclude={"inv_html", "inv_hash"}))
+        db.add(invoice_data)
+        # Flush to get the primary key from the INSERT, then render and commit once
+        db.flush()
+        inv_id = invoice_data.id
+
+        inv_html = create_html_invoice(inv_id, invoice, db)
+        invoice_data.inv_html = inv_html
+        invoice_data.inv_hash = invoice_hash(inv_id, invoice.client_id, invoice.inv_date)
         db.commit()
 
-        return {"inv_html": invoice.inv_html}
-    else:
-        raise HTTPException(status_code=404, detail="Invoice not found")
+        return {"inv_html": inv_html}
+    except IntegrityError:
+        # The unique (client_id, period_start, period_end) index rejects a second invoice for the period
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail=f"Client {invoice.client_id} is already invoiced for {invoice.period_start} to {invoice.period_end}"
+        )
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error submitting invoice: {str(e)}")
 
+class GenerateInvoicesRequest(BaseModel):
+    transaction_ids: Optional[List[int]] = None
+    all_active: bool = False
+
+# Generate the monthly invoices for one transaction
 @app.post("/generate_invoices/{transaction_id}")
 def generate_invoices(transaction_id: int, db: Session = Depends(get_db)):
-    transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
-    if not transaction:
+    result = generate_transaction_invoices(db, [transaction_id])
+    if result["missing_transaction_ids"]:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    return {"invoices_written": result["invoices_written"]}
 
-    start_date = datetime.strptime(transaction.start_date, '%Y-%m-%d')
-    end_date = datetime.strptime(transaction.end_date, '%Y-%m-%d')
-    num_months = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
-
-    invoices_written = 0
-    for i in range(num_months):
-        inv_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)  # Last day of the month
-        period_start = start_date
-        period_end = inv_date
-        hours_worked = 160  # Default hours worked
-        inv_value = transaction.client_price * hours_worked
-        inv_status = "PRE"
-
-        invoice_data = {
-            "inv_date": inv_date.strftime('%Y-%m-%d'),
-            "candidate_id": transaction.candidate_id,
-            "period_start": period_start.strftime('%Y-%m-%d'),
-            "period_end": period_end.strftime('%Y-%m-%d'),
-            "txn_id": transaction.id,
-            "hours_worked": hours_worked,
-            "inv_value": inv_value,
-            "inv_status": inv_status
-        }
+# Generate the monthly invoices for a list of transactions, or every active one, in one batch
+@app.post("/generate_invoices")
+def generate_invoices_batch(request: GenerateInvoicesRequest, db: Session = Depends(get_db),
+    user_name: str = Depends(verify_token)):
+    if not request.all_active and not request.transaction_ids:
+        raise HTTPException(status_code=400, detail="Provide transaction_ids or set all_active")
+    try:
+        return generate_transaction_invoices(db, request.transaction_ids, request.all_active)
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error generating invoices: {str(e)}")
 
-        new_invoice = Invoice(**invoice_data)
-        db.add(new_invoice)
-        db.commit()
-        invoices_written += 1
 
-        # Move start_date to the next month
-        start_date = start_date + timedelta(days=32)
+class MonthEndBillingRequest(BaseModel):
+    period_start: str
+    period_end: str
+    due_date: str
+    inv_date: Optional[str] = None
+
+# Start a background job that invoices every client with active transactions for the period
+@app.post("/month_end_billing")
+def month_end_billing(request: MonthEndBillingRequest, user_name: str = Depends(verify_token)):
+    inv_date = request.inv_date or request.period_end
+    try:
+        for value in (request.period_start, request.period_end, inv_date, request.due_date):
+            datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be formatted YYYY-MM-DD")
+    try:
+        job = start_month_end_job(request.period_start, request.period_end, inv_date, request.due_date, create_html_invoice)
+    except SQLAlchemyError as e:
+        print(f"Error starting month-end billing: {str(e)}")
+        raise HTTPException(status_code=500, detail="Could not start month-end billing")
+    return job.to_dict()
 
-    return {"invoices_written": invoices_written}
+# Status and progress of a month-end billing job
+@app.get("/month_end_billing/{job_id}")
+def month_end_billing_status(job_id: str, user_name: str = Depends(verify_token)):
+    try:
+        job = get_billing_job(job_id)
+    except SQLAlchemyError as e:
+        print(f"Error reading billing job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Could not read billing job status")
+    if not job:
+        raise HTTPException(status_code=404, detail="Billing job not found")
+    return job.to_dict()
 
 
  #Register
 @app.post("/register")
-async def register(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def register(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     user_data = {
         "name": form_data.username,
         "email": form_data.username,
         "role": "CLIENT",
-        "password": get_password_hash(form_data.password),
+        "password": await hash_password(form_data.password),
         "client_id": 0
     }
-    db.add(User(**user_data))
-    db.commit()
+    db.add(DBUser(**user_data))
+    await db.commit()
     return {"message": "User registered successfully"}
 
 # Get Invoice
+# Public invoice links are reloaded often, so the serialized response is kept in a
+# bounded LRU cache keyed by inv_hash and served with a strong ETag.
 @app.get("/get_invoice/{id_str}")
-def get_invoice(id_str: str, db: Session = Depends(get_db)):
-    try:
-        invoice = db.execute(select(DBClientInvoice.inv_html).filter(DBClientInvoice.inv_hash == id_str)).scalars().one()
-        return {"html": invoice}
-    except NoResultFound:
-        raise HTTPException(status_code=404, detail="Invoice not found")
+async def get_invoice(id_str: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    cached = invoice_cache.get(id_str)
+    if cached is None:
+        try:
+            invoice = (await db.execute(select(DBClientInvoice.inv_html).filter(DBClientInvoice.inv_hash == id_str))).scalars().one()
+        except NoResultFound:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+        body = json.dumps({"html": invoice}).encode('utf-8')
+        cached = (body, f'"{hashlib.sha256(body).hexdigest()}"')
+        invoice_cache.set(id_str, cached)
+
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={INVOICE_CACHE_MAX_AGE}"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 # @app.get("/get_invoice/{id_str}")
 # def get_invoice(id_str: str, db: Session = Depends(get_db),
@@ -1204,24 +1223,19 @@ def create_html_invoice(inv_id: int, invoice: ClientInvoice, db: Session = Depen
     if not invoice:
         raise ValueError("Invoice not found")
 
-    # Prepare the HTML content
-    path_to_template = PATH_TO_CONTENT / "invoice_template.html"
-    
-    # Read the template
-    with open(path_to_template, 'r') as file:
-        html_content = file.read()
-        
-        html_content = html_content.replace("total_due", f"${invoice.inv_value:,.2f}")
-        html_content = html_content.replace("due_date", invoice.due_date)
-        html_content = html_content.replace("start_date", invoice.period_start)
-        html_content = html_content.replace("end_date", invoice.period_end)
-        html_content = html_content.replace("invoice_title", "Technology Services")
-        html_content = html_content.replace("invoice_num", str(inv_id))
-        html_content = html_content.replace("invoice_date", invoice.inv_date)
-        html_content = html_content.replace("client_name", invoice.client_name)
-        # html_content = html_content.replace("client_contact", invoice.client_contact)
-        html_content = html_content.replace("invoice_table", invoice.explain_str)
-        html_content = html_content.replace("rayze_logo", RAYZE_LOGO.as_posix())
+    # Render the cached, pre-parsed template in a single pass
+    html_content = render_template(INVOICE_TEMPLATE, INVOICE_PLACEHOLDERS, {
+        "total_due": f"${invoice.inv_value:,.2f}",
+        "due_date": invoice.due_date,
+        "start_date": invoice.period_start,
+        "end_date": invoice.period_end,
+        "invoice_title": "Technology Services",
+        "invoice_num": inv_id,
+        "invoice_date": invoice.inv_date,
+        "client_name": invoice.client_name,
+        "invoice_table": invoice.explain_str,
+        "rayze_logo": RAYZE_LOGO.as_posix(),
+    })
     
     # Paths for new content
     new_title = f"Inv_{invoice.client_name}_{inv_id}.html"
@@ -1244,37 +1258,32 @@ def create_html_work_order(transaction: Transaction, db: Session = Depends(get_d
     if not transaction:
         raise ValueError("Transaction not found")
 
-    # Prepare the HTML content
-    path_to_template = PATH_TO_CONTENT / "client_work_order.html"
-    
-    # Read the template
-    with open(path_to_template, 'r') as file:
-        html_content = file.read()
+    # Get candidate name from database
+    candidate = db.query(DBCandidate).filter(DBCandidate.id == transaction.candidate_id).first()
+    if not candidate:
+        raise ValueError("Candidate not found")
         
-        # Get candidate name from database
-        candidate = db.query(DBCandidate).filter(DBCandidate.id == transaction.candidate_id).first()
-        if not candidate:
-            raise ValueError("Candidate not found")
-            
-        # Get client details from database
-        client = db.query(DBClient).filter(DBClient.id == transaction.client_id).first()
-        if not client:
-            raise ValueError("Client not found")
-        
-        # Format dates as strings
-        txn_date = transaction.txn_date.strftime('%Y-%m-%d') if transaction.txn_date else ''
-        start_date = transaction.start_date.strftime('%Y-%m-%d') if transaction.start_date else ''
-        end_date = transaction.end_date.strftime('%Y-%m-%d') if transaction.end_date else ''
-        
-        # Replace placeholders with actual data
-        html_content = html_content.replace("client_name", client.name)
-        html_content = html_content.replace("txn_date", txn_date)
-        html_content = html_content.replace("candidate_name", candidate.name)
-        html_content = html_content.replace("start_date", start_date)
-        html_content = html_content.replace("end_date", end_date)
-        html_content = html_content.replace("client_rate", f"${transaction.client_price:,.2f}")
-        html_content = html_content.replace("client_contact", client.client_mgr)
-        html_content = html_content.replace("rayze_logo", RAYZE_LOGO.as_posix())
+    # Get client details from database
+    client = db.query(DBClient).filter(DBClient.id == transaction.client_id).first()
+    if not client:
+        raise ValueError("Client not found")
+    
+    # Format dates as strings
+    txn_date = transaction.txn_date.strftime('%Y-%m-%d') if transaction.txn_date else ''
+    start_date = transaction.start_date.strftime('%Y-%m-%d') if transaction.start_date else ''
+    end_date = transaction.end_date.strftime('%Y-%m-%d') if transaction.end_date else ''
+    
+    # Render the cached, pre-parsed template in a single pass
+    html_content = render_template(WORK_ORDER_TEMPLATE, WORK_ORDER_PLACEHOLDERS, {
+        "client_name": client.name,
+        "txn_date": txn_date,
+        "candidate_name": candidate.name,
+        "start_date": start_date,
+        "end_date": end_date,
+        "client_rate": f"${transaction.client_price:,.2f}",
+        "client_contact": client.client_mgr,
+        "rayze_logo": RAYZE_LOGO.as_posix(),
+    })
     
     # Paths for new content
 
@@ -1313,6 +1322,11 @@ class TestScoreRequest(BaseModel):
     test_doc: str
     test_answers: str
 
+# Function to read an uploaded CV or job description as text
+async def read_upload_text(upload: UploadFile) -> str:
+    async with spooled(upload, PDF_MAX_BYTES) as spooled_file:
+        return await document_file_text(spooled_file.path, spooled_file.sha256)
+
 @app.post("/generate_candidate_evaluation")
 async def create_candidate_evaluation(
     job_description: JobDescription,
@@ -1327,10 +1341,7 @@ async def create_candidate_evaluation(
             raise ValueError(f"{model} API key is not set")
         print(job_description.content)
 
-        if model == "grok":
-            result = generate_candidate_evaluation(job_description.content, llm_api_key)
-        else:
-            result = generate_candidate_evaluation(job_description.content)
+        result = await llm.generate_candidate_evaluation(job_description.content)
 
         if result["status"] == "success":
             return result
@@ -1357,10 +1368,7 @@ async def create_test_score(
         if not llm_api_key:
             raise ValueError(f"{model} API key is not set")
 
-        if model == "grok":
-            result = generate_score(score_request.test_doc, score_request.test_answers, llm_api_key)
-        else:
-            result = generate_score(score_request.test_doc, score_request.test_answers)
+        result = await llm.generate_score(score_request.test_doc, score_request.test_answers)
 
         if result["status"] == "success":
             return result
@@ -1389,21 +1397,9 @@ async def create_candidate_match(
             raise ValueError(f"{model} API key is not set")
 
         # Read the CV file content
-        cv_content = await cv.read()
-        try:
-            cv_text = cv_content.decode('utf-8')
-        except UnicodeDecodeError:
-            # If UTF-8 fails, try to read as binary and extract text
-            pdf_file = io.BytesIO(cv_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            cv_text = ""
-            for page in pdf_reader.pages:
-                cv_text += page.extract_text() + "\n"
-
-        if model == "grok":
-            result = generate_candidate_match(job_desc, cv_text, llm_api_key)
-        else:
-            result = generate_candidate_match(job_desc, cv_text)
+        cv_text = await read_upload_text(cv)
+
+        result = await llm.generate_candidate_match(job_desc, cv_text)
 
         if result["status"] == "success":
             return result
@@ -1418,6 +1414,357 @@ async def create_candidate_match(
             detail=f"Error processing request: {str(e)}"
         )
 
+# Function to stream LLM output to the client as server-sent events
+def sse_response(chunks) -> StreamingResponse:
+    async def events():
+        try:
+            async for text in chunks:
+                yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            print(f"Error streaming LLM response: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/generate_candidate_evaluation/stream")
+async def stream_candidate_evaluation_events(
+    job_description: JobDescription,
+    user_name: str = Depends(oauth2_scheme)
+):
+    """
+    Stream the candidate evaluation test as it is generated: `token` events
+    carry {"text": ...} chunks, followed by `done` or `error`.
+    """
+    if not llm_api_key:
+        raise HTTPException(status_code=500, detail=f"{model} API key is not set")
+    chunks = llm.stream_candidate_evaluation(job_description.content)
+    return sse_response(chunks)
+
+@app.post("/generate_candidate_match/stream")
+async def stream_candidate_match_events(
+    cv: UploadFile = File(...),
+    job_desc: str = Form(...),
+    user_name: str = Depends(oauth2_scheme)
+):
+    """Stream the candidate match report as server-sent events, like /generate_candidate_evaluation/stream."""
+    if not llm_api_key:
+        raise HTTPException(status_code=500, detail=f"{model} API key is not set")
+    try:
+        cv_text = await read_upload_text(cv)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error reading CV: {str(e)}")
+    chunks = llm.stream_candidate_match(job_desc, cv_text)
+    return sse_response(chunks)
+
+# Function to fetch the text of a CV stored in the bucket, by public URL or filename
+async def fetch_document_text(http: "httpx.AsyncClient", link: str) -> str:
+    if not link.startswith("http"):
+        # A bucket filename: fetch it over the storage client's pooled connections
+        return await document_text(await storage.download(link))
+    response = await http.get(link)
+    response.raise_for_status()
+    return await document_text(response.content)
+
+# Function to resolve the CV text of a batch match item from its upload or stored link
+async def batch_item_text(http: "httpx.AsyncClient", item: dict) -> str:
+    if item.get("cv_text") is None:
+        if item.get("upload") is not None:
+            item["cv_text"] = await document_file_text(item["upload"].path, item["upload"].sha256)
+        elif item.get("cv_link"):
+            item["cv_text"] = await fetch_document_text(http, item["cv_link"])
+        else:
+            raise ValueError("Candidate has no CV on file")
+    return item["cv_text"]
+
+# Function to keep the top_k batch items closest to the role by embedding similarity
+async def prerank_batch(http: "httpx.AsyncClient", role_id: int, job_description: str, items: List[dict], top_k: int):
+    """
+    Rank items against the role's embedding, reusing stored candidate vectors
+    and embedding (and storing) the rest. Returns (selected, skipped); items
+    whose CV cannot be read stay selected so the match reports the error.
+    """
+    import numpy as np
+    from evaluation.embeddings import embed_texts, top_k_similar, candidate_store
+    from evaluation.ann import candidate_index, role_index
+    role_vector = (await run_in_threadpool(embed_texts, [job_description]))[0]
+    await run_in_threadpool(role_index.add, [role_id], role_vector[None, :])
+    stored = candidate_store.vectors([item["candidate_id"] for item in items
+                                      if item.get("upload") is None and item["candidate_id"] is not None])
+    fresh = [item for item in items if item.get("upload") is not None or item["candidate_id"] not in stored]
+    texts = await asyncio.gather(*[batch_item_text(http, item) for item in fresh], return_exceptions=True)
+    unreadable = [item for item, text in zip(fresh, texts) if isinstance(text, Exception)]
+    readable = [(item, text) for item, text in zip(fresh, texts) if not isinstance(text, Exception)]
+    vectors = await run_in_threadpool(embed_texts, [text for _, text in readable]) if readable else None
+    if readable:
+        indexed = [(item["candidate_id"], vector) for (item, _), vector in zip(readable, vectors) if item["candidate_id"] is not None]
+        if indexed:
+            await run_in_threadpool(candidate_index.add, [i for i, _ in indexed], [v for _, v in indexed])
+
+    ranked = [item for item in items if item.get("upload") is None and item["candidate_id"] in stored] + [item for item, _ in readable]
+    rows = [stored[item["candidate_id"]] for item in ranked if item.get("upload") is None and item["candidate_id"] in stored]
+    matrix = np.vstack(rows + ([vectors] if readable else [])) if ranked else np.zeros((0, len(role_vector)), dtype=np.float32)
+    indices, scores = top_k_similar(role_vector, matrix, None)
+    for index, score in zip(indices, scores):
+        ranked[index]["similarity"] = round(float(score), 4)
+    order = [ranked[index] for index in indices]
+    return unreadable + order[:top_k], order[top_k:]
+
+# Function to score many candidates against one open role
+@app.post("/batch_candidate_match/{role_id}")
+async def batch_candidate_match(
+    role_id: int,
+    candidate_ids: List[int] = Form([]),
+    cvs: List[UploadFile] = File([]),
+    cv_candidate_ids: List[int] = Form([]),
+    concurrency: int = Form(MATCH_CONCURRENCY),
+    top_k: Optional[int] = Form(None),
+    db: AsyncSession = Depends(get_async_db),
+    user_name: str = Depends(verify_token)
+):
+    """
+    Match stored candidates (`candidate_ids`, using their CV links) and/or
+    uploaded `cvs` against the role's job description, `concurrency` at a
+    time. `cv_candidate_ids[i]` names the candidate for `cvs[i]`.
+
+    With `top_k`, candidates are first pre-ranked by local embedding
+    similarity and only the closest `top_k` go to the LLM; the rest are
+    reported as "skipped" with their similarity.
+
+    Streams one NDJSON line per candidate as its match finishes, then writes
+    every match_score back to the candidates' SubmitCVRole rows for the role
+    in one bulk UPDATE and ends with a summary line.
+    """
+    if not llm_api_key:
+        raise HTTPException(status_code=500, detail=f"{model} API key is not set")
+    role = await db.get(DBOpenRoles, role_id)
+    if not role:
+        raise HTTPException(status_code=404, detail="Open role not found")
+    job_description = role.jd_doc or role.role_desc
+    if not job_description:
+        raise HTTPException(status_code=400, detail="Open role has no job description")
+    if not candidate_ids and not cvs:
+        raise HTTPException(status_code=400, detail="Provide candidate_ids or cvs")
+
+    ids = set(candidate_ids) | set(cv_candidate_ids)
+    submissions = {}
+    candidates = {}
+    if ids:
+        result = await db.execute(
+            select(DBSubmitCVRole.candidates_id, DBSubmitCVRole.id, DBSubmitCVRole.cv_link)
+            .where(DBSubmitCVRole.open_roles_id == role_id, DBSubmitCVRole.candidates_id.in_(ids))
+            .order_by(DBSubmitCVRole.id)
+        )
+        submissions = {row.candidates_id: row for row in result}
+        result = await db.execute(select(DBCandidate.id, DBCandidate.cv_link).where(DBCandidate.id.in_(ids)))
+        candidates = {row.id: row for row in result}
+
+    items = []
+    for candidate_id in dict.fromkeys(candidate_ids):
+        submission = submissions.get(candidate_id)
+        candidate = candidates.get(candidate_id)
+        cv_link = (submission.cv_link if submission else None) or (candidate.cv_link if candidate else None)
+        items.append({"candidate_id": candidate_id, "submission_id": submission.id if submission else None,
+                      "cv_link": cv_link, "found": candidate is not None})
+    # Uploads are spooled to disk before streaming starts, while the request is still open
+    spooled_cvs = []
+    try:
+        for index, cv in enumerate(cvs):
+            candidate_id = cv_candidate_ids[index] if index < len(cv_candidate_ids) else None
+            submission = submissions.get(candidate_id)
+            spooled_cvs.append(await spool_upload(cv, PDF_MAX_BYTES))
+            items.append({"candidate_id": candidate_id, "submission_id": submission.id if submission else None,
+                          "filename": cv.filename, "upload": spooled_cvs[-1], "found": True})
+    except UploadTooLarge as e:
+        for spooled_file in spooled_cvs:
+            spooled_file.remove()
+        raise HTTPException(status_code=413, detail=str(e))
+
+    async def results():
+        try:
+            async for line in match_lines():
+                yield line
+        finally:
+            for spooled_file in spooled_cvs:
+                spooled_file.remove()
+
+    async def match_lines():
+        import httpx
+        updates = []
+        summary = {"total": len(items), "scored": 0, "failed": 0}
+        async with httpx.AsyncClient(timeout=LLM_TIMEOUT, follow_redirects=True) as http:
+
+            async def match(item):
+                base = {key: item.get(key) for key in ("candidate_id", "submission_id", "filename", "similarity") if key in item}
+                if not item["found"]:
+                    return {**base, "status": "error", "message": "Candidate not found"}
+                cv_text = await batch_item_text(http, item)
+                result = await llm.generate_candidate_match(job_description, cv_text)
+                if result["status"] != "success":
+                    return {**base, "status": "error", "message": result["message"]}
+                return {**base, "status": "success", "match_score": parse_match_score(result["evaluation"]),
+                        "recommendation": parse_recommendation(result["evaluation"]), "evaluation": result["evaluation"]}
+
+            selected = items
+            if top_k is not None and top_k < len(items):
+                found = [item for item in items if item["found"]]
+                try:
+                    ranked, skipped = await prerank_batch(http, role_id, job_description, found, top_k)
+                except Exception as e:
+                    # Without embeddings every candidate still gets its LLM match
+                    print(f"Error pre-ranking candidates: {str(e)}")
+                    ranked, skipped = found, []
+                selected = [item for item in items if not item["found"]] + ranked
+                summary["skipped"] = len(skipped)
+                for item in skipped:
+                    yield json.dumps({key: item.get(key) for key in ("candidate_id", "submission_id", "filename", "similarity") if key in item}
+                                     | {"status": "skipped"}) + "\n"
+
+            async for result in run_matches(selected, match, concurrency):
+                for key in ("upload", "cv_link", "cv_text", "found"):
+                    result.pop(key, None)
+                if result["status"] == "success":
+                    summary["scored"] += 1
+                    if result.get("submission_id") and result.get("match_score") is not None:
+                        updates.append({"id": result["submission_id"], "match_score": result["match_score"]})
+                else:
+                    summary["failed"] += 1
+                yield json.dumps(result) + "\n"
+
+        summary["updated"] = len(updates)
+        if updates:
+            try:
+                async with AsyncSessionLocal(bind=get_async_engine()) as session:
+                    await session.execute(update(DBSubmitCVRole), updates)
+                    await session.commit()
+            except SQLAlchemyError as e:
+                print(f"Error saving match scores: {str(e)}")
+                summary["updated"] = 0
+                summary["error"] = str(e)
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+class IndexCandidatesRequest(BaseModel):
+    candidate_ids: Optional[List[int]] = None
+
+# Function to embed candidate CVs for pre-ranking; every candidate with a CV when no ids are given
+@app.post("/index_candidates")
+async def index_candidates(request: IndexCandidatesRequest, db: AsyncSession = Depends(get_async_db), user_name: str = Depends(verify_token)):
+    query = select(DBCandidate.id, DBCandidate.cv_link).where(DBCandidate.cv_link.isnot(None), DBCandidate.cv_link != "")
+    if request.candidate_ids is not None:
+        query = query.where(DBCandidate.id.in_(request.candidate_ids))
+    items = [{"candidate_id": row.id, "cv_link": row.cv_link} for row in await db.execute(query)]
+
+    import httpx
+    from evaluation.embeddings import embed_texts, candidate_store
+    from evaluation.ann import candidate_index
+    texts = {}
+    failed = []
+    async with httpx.AsyncClient(timeout=LLM_TIMEOUT, follow_redirects=True) as http:
+        async def fetch(item):
+            return {**item, "cv_text": await fetch_document_text(http, item["cv_link"])}
+
+        async for result in run_matches(items, fetch, MATCH_CONCURRENCY):
+            if "cv_text" in result:
+                texts[result["candidate_id"]] = result["cv_text"]
+            else:
+                failed.append({"candidate_id": result["candidate_id"], "message": result["message"]})
+    try:
+        if texts:
+            vectors = await run_in_threadpool(embed_texts, list(texts.values()))
+            await run_in_threadpool(candidate_index.add, list(texts), vectors)
+    except Exception as e:
+        print(f"Error embedding candidates: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error embedding candidates: {str(e)}")
+    return {"indexed": len(texts), "failed": failed, "total_indexed": len(candidate_store)}
+
+# Function to rank every indexed candidate against an open role by embedding similarity
+@app.get("/rank_candidates/{role_id}")
+async def rank_candidates(role_id: int, top_k: int = Query(20, ge=1, le=PAGE_SIZE_MAX), db: AsyncSession = Depends(get_async_db), user_name: str = Depends(verify_token)):
+    role = await db.get(DBOpenRoles, role_id)
+    if not role:
+        raise HTTPException(status_code=404, detail="Open role not found")
+    job_description = role.jd_doc or role.role_desc
+    if not job_description:
+        raise HTTPException(status_code=400, detail="Open role has no job description")
+    from evaluation.embeddings import embed_texts, candidate_store
+    from evaluation.ann import role_index
+    try:
+        role_vector = (await run_in_threadpool(embed_texts, [job_description]))[0]
+        await run_in_threadpool(role_index.add, [role_id], role_vector[None, :])
+    except Exception as e:
+        print(f"Error embedding role: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error embedding role: {str(e)}")
+    ranked = candidate_store.rank(role_vector, top_k=top_k)
+    names = dict((await db.execute(select(DBCandidate.id, DBCandidate.name).where(DBCandidate.id.in_([i for i, _ in ranked])))).all()) if ranked else {}
+    return [{"candidate_id": candidate_id, "name": names.get(candidate_id), "similarity": round(score, 4)} for candidate_id, score in ranked]
+
+# Function to embed a candidate's CV into the similarity index after it is created or its CV changes
+async def index_candidate_cv(candidate_id: int, cv_link: str):
+    import httpx
+    from evaluation.embeddings import embed_texts
+    from evaluation.ann import candidate_index
+    try:
+        async with httpx.AsyncClient(timeout=LLM_TIMEOUT, follow_redirects=True) as http:
+            cv_text = await fetch_document_text(http, cv_link)
+        vectors = await run_in_threadpool(embed_texts, [cv_text])
+        await run_in_threadpool(candidate_index.add, [candidate_id], vectors)
+    except Exception as e:
+        print(f"Error indexing candidate {candidate_id}: {str(e)}")
+
+# Function to embed a role's job description into the similarity index
+async def index_role_text(role_id: int, job_description: str):
+    from evaluation.embeddings import embed_texts
+    from evaluation.ann import role_index
+    try:
+        vectors = await run_in_threadpool(embed_texts, [job_description])
+        await run_in_threadpool(role_index.add, [role_id], vectors)
+    except Exception as e:
+        print(f"Error indexing role {role_id}: {str(e)}")
+
+# Function to find the indexed candidates closest to an open role (approximate, via the IVF index)
+@app.get("/similar_candidates/{role_id}")
+async def similar_candidates(role_id: int, top_k: int = Query(20, ge=1, le=PAGE_SIZE_MAX), nprobe: Optional[int] = Query(None, ge=1),
+                             db: AsyncSession = Depends(get_async_db), user_name: str = Depends(verify_token)):
+    from evaluation.embeddings import embed_texts, role_store
+    from evaluation.ann import candidate_index, role_index
+    role_vector = role_store.vectors([role_id]).get(role_id)
+    if role_vector is None:
+        role = await db.get(DBOpenRoles, role_id)
+        if not role:
+            raise HTTPException(status_code=404, detail="Open role not found")
+        if not (role.jd_doc or role.role_desc):
+            raise HTTPException(status_code=400, detail="Open role has no job description")
+        try:
+            role_vector = (await run_in_threadpool(embed_texts, [role.jd_doc or role.role_desc]))[0]
+            await run_in_threadpool(role_index.add, [role_id], role_vector[None, :])
+        except Exception as e:
+            print(f"Error embedding role: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error embedding role: {str(e)}")
+    ranked = await run_in_threadpool(candidate_index.search, role_vector, top_k, nprobe)
+    names = dict((await db.execute(select(DBCandidate.id, DBCandidate.name).where(DBCandidate.id.in_([i for i, _ in ranked])))).all()) if ranked else {}
+    return [{"candidate_id": candidate_id, "name": names.get(candidate_id), "similarity": round(score, 4)} for candidate_id, score in ranked]
+
+# Function to find the open roles closest to an indexed candidate
+@app.get("/similar_roles/{candidate_id}")
+async def similar_roles(candidate_id: int, top_k: int = Query(20, ge=1, le=PAGE_SIZE_MAX), nprobe: Optional[int] = Query(None, ge=1),
+                        db: AsyncSession = Depends(get_async_db), user_name: str = Depends(verify_token)):
+    from evaluation.embeddings import candidate_store
+    from evaluation.ann import role_index
+    candidate_vector = candidate_store.vectors([candidate_id]).get(candidate_id)
+    if candidate_vector is None:
+        raise HTTPException(status_code=404, detail="Candidate CV has not been indexed")
+    ranked = await run_in_threadpool(role_index.search, candidate_vector, top_k, nprobe)
+    roles = {row.id: row for row in await db.execute(
+        select(DBOpenRoles.id, DBOpenRoles.role_desc, DBOpenRoles.client_id, DBOpenRoles.status).where(DBOpenRoles.id.in_([i for i, _ in ranked]))
+    )} if ranked else {}
+    return [{"role_id": role_id, "role_desc": roles[role_id].role_desc, "client_id": roles[role_id].client_id,
+             "status": roles[role_id].status, "similarity": round(score, 4)}
+            for role_id, score in ranked if role_id in roles]
+
 @app.post("/extract_pdf_text")
 async def extract_pdf_text(
     file: UploadFile = File(...),
@@ -1429,23 +1776,26 @@ async def extract_pdf_text(
             detail="File must be a PDF"
         )
     
+    if file.size and file.size > PDF_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File is larger than {PDF_MAX_BYTES // (1024 * 1024)} MB"
+        )
+
     try:
-        # Read the uploaded file
-        contents = await file.read()
-        
-        # Create a PDF reader object
-        pdf_file = io.BytesIO(contents)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        # Extract text from all pages
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        
+        # Spool the upload to disk, hashing it on the way, and extract in the PDF worker pool
+        async with spooled(file, PDF_MAX_BYTES) as spooled_file:
+            text = await extract_pdf_file(spooled_file.path, spooled_file.sha256)
+
         return {
             "status": "success",
             "text": text
         }
+    except (PDFLimitError, UploadTooLarge) as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1459,11 +1809,14 @@ def update_submit_cvrole(cvrole_id: int, cvrole: SubmitCVRoleUpdate, db: Session
     if not cvrole_to_update:
         raise HTTPException(status_code=404, detail="Submit CV Role not found")
 
+    previous_candidate_id = cvrole_to_update.candidates_id
+    previous_role_id = cvrole_to_update.open_roles_id
     for key, value in cvrole.dict(exclude_unset=True).items():
         setattr(cvrole_to_update, key, value)
     
     db.commit()
     db.refresh(cvrole_to_update)
+    refresh_kpis_after_write(db, candidate_ids=[previous_candidate_id, cvrole_to_update.candidates_id], role_ids=[previous_role_id, cvrole_to_update.open_roles_id])
     return {"message": "Submit CV Role updated successfully"}
 
 @app.post("/generate_candidate")
@@ -1477,21 +1830,9 @@ async def generate_candidate(
     try:
 
         # Read the CV file content
-        cv_content = await cv.read()
-        try:
-            cv_text = cv_content.decode('utf-8')
-        except UnicodeDecodeError:
-            # If UTF-8 fails, try to read as binary and extract text
-            pdf_file = io.BytesIO(cv_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            cv_text = ""
-            for page in pdf_reader.pages:
-                cv_text += page.extract_text() + "\n"
+        cv_text = await read_upload_text(cv)
   
-        if model == "grok":
-            result = generate_candidate_cv(cv_text, llm_api_key)
-        else:   
-            result = generate_candidate_cv(cv_text)
+        result = await llm.generate_candidate_cv(cv_text)
 
         if result["status"] == "success":
             return result
@@ -1514,21 +1855,9 @@ async def generate_job_description(
     try:
 
         # Read the jd file content
-        jd_content = await job_desc.read()
-        try:
-            jd_text = jd_content.decode('utf-8')
-        except UnicodeDecodeError:
-            # If UTF-8 fails, try to read as binary and extract text
-            pdf_file = io.BytesIO(jd_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            jd_text = ""
-            for page in pdf_reader.pages:
-                jd_text += page.extract_text() + "\n"
+        jd_text = await read_upload_text(job_desc)
         print(jd_text)
-        if model == "grok":
-            result = generate_job_desc(jd_text, llm_api_key)
-        else:   
-            result = generate_job_desc(jd_text)
+        result = await llm.generate_job_desc(jd_text)
 
         if result["status"] == "success":
             return result
@@ -1564,9 +1893,8 @@ async def store_bucket(
         dict: A dictionary containing the status and the uploaded filename
     """
     try:
-        # Read the file content
-        content = await file.read()
-        if not content:
+        # multipart parsing has already spooled the upload, so its size is known up front
+        if not file.size:
             raise HTTPException(status_code=400, detail="File is empty")
 
         # Get the filename
@@ -1575,18 +1903,22 @@ async def store_bucket(
             raise HTTPException(status_code=400, detail="Filename is required")
 
         # Debug logging
-        print(f"File type: {type(content)}")
-        print(f"Content length: {len(content)}")
+        print(f"Content length: {file.size}")
         print(f"Filename: {filename}")
 
-        # Upload the file to Supabase
-        uploaded_filename = upload_file(content, filename)
+        # Stream the file to Supabase, hashing the content on the way
+        digest = UploadDigest()
+        # A callable body lets the storage client retry; upload_chunks rewinds the file each time
+        uploaded_filename = await upload_stream(lambda: upload_chunks(file, digest), filename,
+                                                file.content_type or "application/pdf")
 
         if uploaded_filename:
             return {
                 "status": "success",
                 "message": "File uploaded successfully to bucket",
-                "filename": uploaded_filename
+                "filename": uploaded_filename,
+                "size": digest.size,
+                "sha256": digest.sha256
             }
         else:
             raise HTTPException(status_code=500, detail="Failed to upload file to bucket")
@@ -1618,7 +1950,7 @@ async def read_bucket(
                 detail="Filename is required"
             )
             
-        file_content = get_file(filename)
+        file_content = await get_file(filename)
         
         if file_content:
             # Return the binary content directly
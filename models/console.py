@@ -0,0 +1,257 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, true, delete, insert, union, literal, DateTime
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.models import Candidate, Client, Transaction, SubmitCVRole, OpenRoles, Invoice, ClientKPI
+
+# Width of the rolling "last 30" window used by the client KPI counters
+CLIENT_KPI_WINDOW_DAYS = 31
+
+CLIENT_KPI_FIELDS = [
+    "total_active_eng",
+    "total_active_eng_last30",
+    "submit_client_cvs",
+    "submit_client_cvs_last30",
+    "active_client_roles",
+    "active_client_roles_last30",
+    "hired_client_cvs",
+    "hired_client_cvs_last30",
+]
+
+
+def console_snapshot_query(since: datetime):
+    """
+    Build a single SELECT returning every /get_console_data counter in one row.
+
+    Each table is aggregated once in its own CTE (using FILTER aggregates where a
+    table feeds two counters) and the one-row CTEs are cross joined together.
+    """
+    payroll = select(
+        func.count(Candidate.id).filter(Candidate.status == 'Hired').label('payroll_candidates')
+    ).cte('payroll')
+
+    hires = select(
+        func.count(Transaction.id).filter(Transaction.start_date >= since).label('hired_last_month')
+    ).cte('hires')
+
+    submits = select(
+        func.count(SubmitCVRole.id).label('submit_cvs'),
+        func.count(SubmitCVRole.id).filter(SubmitCVRole.submitted_on >= since).label('submit_last_month')
+    ).join(OpenRoles, SubmitCVRole.open_roles_id == OpenRoles.id)\
+     .where(OpenRoles.status == 'Open')\
+     .cte('submits')
+
+    roles = select(
+        func.count(OpenRoles.id).label('active_roles'),
+        func.count(OpenRoles.id).filter(OpenRoles.posted_on >= since).label('roles_last_month')
+    ).where(OpenRoles.status == 'Open')\
+     .cte('roles')
+
+    latest_invoice = select(
+        func.max(Invoice.inv_date).label('max_invoice_date')
+    ).cte('latest_invoice')
+
+    invoice_hours = select(
+        func.coalesce(func.sum(Invoice.hours_worked), 0).label('invoice_hours')
+    ).where(Invoice.inv_date == select(latest_invoice.c.max_invoice_date).scalar_subquery())\
+     .cte('invoice_hours')
+
+    return select(
+        payroll.c.payroll_candidates,
+        hires.c.hired_last_month,
+        submits.c.submit_cvs,
+        submits.c.submit_last_month,
+        roles.c.active_roles,
+        roles.c.roles_last_month,
+        latest_invoice.c.max_invoice_date,
+        invoice_hours.c.invoice_hours
+    ).select_from(payroll)\
+     .join(hires, true())\
+     .join(submits, true())\
+     .join(roles, true())\
+     .join(latest_invoice, true())\
+     .join(invoice_hours, true())
+
+
+def console_snapshot(db: Session, since: datetime) -> dict:
+    """Return the /get_console_data payload using one database round trip."""
+    return _console_snapshot_payload(db.execute(console_snapshot_query(since)).mappings().one())
+
+
+async def console_snapshot_async(db: AsyncSession, since: datetime) -> dict:
+    """console_snapshot() for an AsyncSession."""
+    return _console_snapshot_payload((await db.execute(console_snapshot_query(since))).mappings().one())
+
+
+def _console_snapshot_payload(row) -> dict:
+    return {
+        "payroll_candidates": row["payroll_candidates"] or 0,
+        "hired_last_month": row["hired_last_month"] or 0,
+        "submit_cvs": row["submit_cvs"] or 0,
+        "submit_last_month": row["submit_last_month"] or 0,
+        "active_roles": row["active_roles"] or 0,
+        "roles_last_month": row["roles_last_month"] or 0,
+        "max_invoice_date": row["max_invoice_date"] if row["max_invoice_date"] else None,
+        "invoice_hours": row["invoice_hours"] or 0
+    }
+
+
+def _client_kpi_query(since: datetime, client_ids=None):
+    """
+    Build a SELECT producing one client_kpis row per client.
+
+    Every source table is grouped by client once, so refreshing all clients
+    costs the same handful of scans as refreshing one.
+    """
+    def scoped(stmt, client_column):
+        if client_ids is not None:
+            stmt = stmt.where(client_column.in_(client_ids))
+        return stmt.group_by(client_column)
+
+    engineers = scoped(select(
+        Candidate.client_id.label('client_id'),
+        func.count(Candidate.id).filter(Candidate.status == 'Hired').label('total_active_eng')
+    ), Candidate.client_id).cte('kpi_engineers')
+
+    new_engineers = scoped(select(
+        Candidate.client_id.label('client_id'),
+        func.count(Candidate.id).label('total_active_eng_last30')
+    ).join(Transaction, Candidate.id == Transaction.candidate_id)
+     .where(Candidate.status == 'Hired', Transaction.start_date >= since), Candidate.client_id).cte('kpi_new_engineers')
+
+    roles = scoped(select(
+        OpenRoles.client_id.label('client_id'),
+        func.count(OpenRoles.id).filter(OpenRoles.status == 'Open').label('active_client_roles'),
+        func.count(OpenRoles.id).filter(OpenRoles.status == 'Open', OpenRoles.posted_on >= since).label('active_client_roles_last30')
+    ), OpenRoles.client_id).cte('kpi_roles')
+
+    # Submission totals roll up to the client that owns the role ...
+    role_submits = scoped(select(
+        OpenRoles.client_id.label('client_id'),
+        func.count(SubmitCVRole.id).filter(OpenRoles.status == 'Open').label('submit_client_cvs'),
+        func.count(SubmitCVRole.id).filter(OpenRoles.status == 'Hired').label('hired_client_cvs')
+    ).select_from(SubmitCVRole)
+     .join(OpenRoles, SubmitCVRole.open_roles_id == OpenRoles.id), OpenRoles.client_id).cte('kpi_role_submits')
+
+    # ... while the rolling submission counters roll up to the candidate's client
+    candidate_submits = scoped(select(
+        Candidate.client_id.label('client_id'),
+        func.count(SubmitCVRole.id).filter(OpenRoles.status == 'Open').label('submit_client_cvs_last30'),
+        func.count(SubmitCVRole.id).filter(OpenRoles.status == 'Hired').label('hired_client_cvs_last30')
+    ).select_from(SubmitCVRole)
+     .join(OpenRoles, SubmitCVRole.open_roles_id == OpenRoles.id)
+     .join(Candidate, SubmitCVRole.candidates_id == Candidate.id)
+     .where(SubmitCVRole.submitted_on >= since), Candidate.client_id).cte('kpi_candidate_submits')
+
+    sources = {
+        'total_active_eng': engineers,
+        'total_active_eng_last30': new_engineers,
+        'submit_client_cvs': role_submits,
+        'submit_client_cvs_last30': candidate_submits,
+        'active_client_roles': roles,
+        'active_client_roles_last30': roles,
+        'hired_client_cvs': role_submits,
+        'hired_client_cvs_last30': candidate_submits,
+    }
+
+    stmt = select(
+        Client.id.label('client_id'),
+        *[func.coalesce(sources[field].c[field], 0).label(field) for field in CLIENT_KPI_FIELDS]
+    )
+    for cte in (engineers, new_engineers, roles, role_submits, candidate_submits):
+        stmt = stmt.outerjoin(cte, cte.c.client_id == Client.id)
+    if client_ids is not None:
+        stmt = stmt.where(Client.id.in_(client_ids))
+    return stmt
+
+
+def refresh_client_kpis(db: Session, client_ids=None, now: datetime = None) -> None:
+    """
+    Recompute the client_kpis rows for the given clients (all clients when None).
+
+    The rows are upserted inside the caller's transaction and committed here,
+    so two refreshes of the same client (a write and a lazy fill, or two
+    workers) both succeed and the last one wins.
+    """
+    if client_ids is not None:
+        client_ids = sorted({client_id for client_id in client_ids if client_id is not None})
+        if not client_ids:
+            return
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=CLIENT_KPI_WINDOW_DAYS)
+
+    columns = ['client_id', *CLIENT_KPI_FIELDS, 'window_start', 'refreshed_at']
+    # The WHERE keeps SQLite from reading ON CONFLICT as part of the join; the
+    # ORDER BY locks rows in the same order in every transaction
+    rows = _client_kpi_query(since, client_ids).add_columns(
+        literal(since, DateTime).label('window_start'),
+        literal(now, DateTime).label('refreshed_at')
+    ).where(true()).order_by(Client.id)
+
+    # Imported here rather than at module load: the dialect packages are slow to import at startup
+    from sqlalchemy.dialects import postgresql, sqlite
+    upsert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(db.get_bind().dialect.name)
+    clear = delete(ClientKPI)
+    if client_ids is not None:
+        clear = clear.where(ClientKPI.client_id.in_(client_ids))
+    if upsert is None:
+        db.execute(clear)
+        db.execute(insert(ClientKPI).from_select(columns, rows))
+    else:
+        # Upserted rows replace their predecessors; only rows of clients that no longer exist are deleted
+        db.execute(clear.where(ClientKPI.client_id.not_in(select(Client.id))))
+        stmt = upsert(ClientKPI).from_select(columns, rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[ClientKPI.client_id],
+            set_={column: stmt.excluded[column] for column in columns[1:]}
+        ))
+    db.commit()
+
+
+def affected_kpi_clients(db: Session, client_ids=(), candidate_ids=(), role_ids=()) -> set:
+    """
+    Resolve the clients whose KPI rows depend on the given candidates and roles.
+
+    A role contributes to its own client and, through its submissions, to the
+    clients of every candidate submitted to it.
+    """
+    affected = {client_id for client_id in client_ids if client_id is not None}
+    candidate_ids = [candidate_id for candidate_id in candidate_ids if candidate_id is not None]
+    role_ids = [role_id for role_id in role_ids if role_id is not None]
+
+    lookups = []
+    if candidate_ids:
+        lookups.append(select(Candidate.client_id).where(Candidate.id.in_(candidate_ids)))
+    if role_ids:
+        lookups.append(select(OpenRoles.client_id).where(OpenRoles.id.in_(role_ids)))
+        lookups.append(select(Candidate.client_id)
+                       .join(SubmitCVRole, SubmitCVRole.candidates_id == Candidate.id)
+                       .where(SubmitCVRole.open_roles_id.in_(role_ids)))
+    if lookups:
+        stmt = lookups[0] if len(lookups) == 1 else union(*lookups)
+        affected.update(client_id for client_id in db.execute(stmt).scalars() if client_id is not None)
+    return affected
+
+
+def client_kpis(db: Session, client_id: int) -> dict:
+    """Return the /get_console_data_by_client payload from the client_kpis rollup."""
+    kpis = db.get(ClientKPI, client_id)
+    if kpis is None:
+        refresh_client_kpis(db, [client_id])
+        kpis = db.get(ClientKPI, client_id)
+    return _client_kpis_payload(kpis)
+
+
+async def client_kpis_async(db: AsyncSession, client_id: int) -> dict:
+    """client_kpis() for an AsyncSession."""
+    kpis = await db.get(ClientKPI, client_id)
+    if kpis is None:
+        await db.run_sync(refresh_client_kpis, [client_id])
+        kpis = await db.get(ClientKPI, client_id, populate_existing=True)
+    return _client_kpis_payload(kpis)
+
+
+def _client_kpis_payload(kpis) -> dict:
+    if kpis is None:
+        return {field: 0 for field in CLIENT_KPI_FIELDS}
+    return {field: getattr(kpis, field) or 0 for field in CLIENT_KPI_FIELDS}
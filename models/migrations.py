@@ -0,0 +1,155 @@
+"""
+Schema migrations, applied by a release step rather than on app import.
+
+Each migration runs once, in order, in its own transaction and is recorded
+in the schema_migrations table. Migrations are written to be idempotent so
+they also bring databases created by the old import-time create_all() up to
+date. On PostgreSQL an advisory lock keeps concurrent runs (several dynos
+releasing at once) from racing.
+
+Usage (from the repo root):
+    python -m models.migrations            # apply pending migrations
+    python -m models.migrations --status   # list applied and pending migrations
+"""
+import argparse
+import sys
+from datetime import datetime
+from sqlalchemy import Column, DateTime, MetaData, String, Table, bindparam, func, inspect, or_, select, text
+from sqlalchemy.exc import IntegrityError
+from models.models import Base, BillingJobStatus, ClientInvoice, get_engine
+from billing import invoice_hash
+
+# Arbitrary key for pg_advisory_xact_lock, shared by every migration run
+MIGRATION_LOCK_ID = 7345119
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def create_tables(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+def client_invoice_index(name: str):
+    return next(index for index in ClientInvoice.__table__.indexes if index.name == name)
+
+
+def create_client_invoice_indexes(conn):
+    # create_all skips tables that already exist, so add indexes introduced since.
+    # inv_hash becomes unique: rows sharing a hash (whose links could not resolve to
+    # one invoice anyway) or holding an empty placeholder get the hash derived from
+    # their id, as submit_client_invoice assigns it.
+    table = ClientInvoice.__table__
+    shared = select(table.c.inv_hash).group_by(table.c.inv_hash).having(func.count() > 1)
+    colliding = conn.execute(
+        select(table.c.id, table.c.client_id, table.c.inv_date)
+        .where(or_(table.c.inv_hash == "", table.c.inv_hash.in_(shared)))
+    ).all()
+    if colliding:
+        print(f"Re-deriving inv_hash for {len(colliding)} client invoice(s) with a duplicate or empty hash")
+        conn.execute(
+            table.update().where(table.c.id == bindparam("_id")).values(inv_hash=bindparam("hash")),
+            [{"_id": row.id, "hash": invoice_hash(row.id, row.client_id, row.inv_date)} for row in colliding]
+        )
+    try:
+        client_invoice_index("ix_client_invoices_inv_hash").create(bind=conn, checkfirst=True)
+    except IntegrityError as e:
+        raise RuntimeError(f"Cannot create the unique index on client_invoices.inv_hash: {str(e.orig)}")
+
+
+def add_users_token_version(conn):
+    if "token_version" not in {column["name"] for column in inspect(conn).get_columns("users")}:
+        conn.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"))
+
+
+def add_client_invoice_period_unique(conn):
+    # Invoices are never deleted here; duplicates have to be voided or merged by hand first
+    duplicates = conn.execute(
+        select(ClientInvoice.client_id, ClientInvoice.period_start, ClientInvoice.period_end, func.count())
+        .group_by(ClientInvoice.client_id, ClientInvoice.period_start, ClientInvoice.period_end)
+        .having(func.count() > 1)
+    ).all()
+    if duplicates:
+        listed = ", ".join(f"client {client_id} {start}..{end} ({count} invoices)"
+                           for client_id, start, end, count in duplicates[:20])
+        raise RuntimeError(f"Cannot make client invoices unique per client and period; {len(duplicates)} "
+                           f"period(s) are invoiced more than once: {listed}")
+    client_invoice_index("uq_client_invoices_client_period").create(bind=conn, checkfirst=True)
+
+
+def create_billing_jobs(conn):
+    BillingJobStatus.__table__.create(bind=conn, checkfirst=True)
+
+
+def add_client_invoice_paging_index(conn):
+    # /list_client_invoices pages on inv_date DESC NULLS LAST, id DESC. PostgreSQL only
+    # walks an index in that order if it is declared that way; SQLite rejects NULLS LAST
+    # in an index but serves the same order from a plain (inv_date, id) index.
+    if conn.dialect.name == "postgresql":
+        columns = "inv_date DESC NULLS LAST, id DESC"
+    else:
+        columns = "inv_date, id"
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_client_invoices_inv_date_id ON client_invoices ({columns})"))
+
+
+# (version, migration) in the order they are applied; append, never reorder
+MIGRATIONS = [
+    ("0001_create_tables", create_tables),
+    ("0002_client_invoice_indexes", create_client_invoice_indexes),
+    ("0003_users_token_version", add_users_token_version),
+    ("0004_client_invoice_period_unique", add_client_invoice_period_unique),
+    ("0005_billing_jobs", create_billing_jobs),
+    ("0006_client_invoice_paging_index", add_client_invoice_paging_index),
+]
+
+
+def applied_versions(conn) -> set:
+    if not inspect(conn).has_table(schema_migrations.name):
+        return set()
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def migrate(engine=None) -> list:
+    """Apply pending migrations; returns the versions applied by this run."""
+    engine = engine or get_engine()
+    applied = []
+    with engine.begin() as conn:
+        schema_migrations.create(bind=conn, checkfirst=True)
+    for version, migration in MIGRATIONS:
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            if version in applied_versions(conn):
+                continue
+            print(f"Applying migration {version}")
+            migration(conn)
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.utcnow()))
+            applied.append(version)
+    return applied
+
+
+def pending(engine=None) -> list:
+    engine = engine or get_engine()
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+    return [version for version, _ in MIGRATIONS if version not in done]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args()
+
+    if args.status:
+        waiting = pending()
+        for version, _ in MIGRATIONS:
+            print(f"{'pending' if version in waiting else 'applied'}  {version}")
+    else:
+        try:
+            applied = migrate()
+        except RuntimeError as e:
+            sys.exit(f"Migration failed: {str(e)}")
+        print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, LargeBinary, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, String, Float, DateTime, LargeBinary, ForeignKey, Index, JSON, create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from models.pool import engine_options, async_engine_options, DB_PGBOUNCER
 import os
+import threading
 from urllib.parse import quote_plus
 
 Base = declarative_base()
@@ -90,6 +94,8 @@ class User(Base):
     role = Column(String)
     password = Column(String)
     client_id = Column(Integer)
+    # Bumped to revoke every token issued to the user so far
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
 class Cashflow(Base):
     __tablename__ = 'cashflows'
@@ -128,18 +134,85 @@ class ClientInvoice(Base):
     client_phone = Column(String)
     explain_str = Column(String)
     inv_html = Column(String)
-    inv_hash = Column(String)
+    inv_hash = Column(String, unique=True, index=True)
     inv_value = Column(Float)
     inv_status = Column(String)
 
-# Database setup
-DATABASE_URL = os.getenv("DB_URL") + "?sslmode=require&gssencmode=disable"
+    # One invoice per client and billing period, so parallel submissions cannot double-bill
+    __table_args__ = (
+        Index('uq_client_invoices_client_period', 'client_id', 'period_start', 'period_end', unique=True),
+    )
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class ClientKPI(Base):
+    __tablename__ = 'client_kpis'
+    client_id = Column(Integer, ForeignKey('clients.id'), primary_key=True)
+    total_active_eng = Column(Integer, default=0)
+    total_active_eng_last30 = Column(Integer, default=0)
+    submit_client_cvs = Column(Integer, default=0)
+    submit_client_cvs_last30 = Column(Integer, default=0)
+    active_client_roles = Column(Integer, default=0)
+    active_client_roles_last30 = Column(Integer, default=0)
+    hired_client_cvs = Column(Integer, default=0)
+    hired_client_cvs_last30 = Column(Integer, default=0)
+    window_start = Column(DateTime)
+    refreshed_at = Column(DateTime)
+
+# Status of month-end billing jobs, so any worker can answer the status endpoint
+class BillingJobStatus(Base):
+    __tablename__ = 'billing_jobs'
+    id = Column(String, primary_key=True)
+    status = Column(String)
+    period_start = Column(String)
+    period_end = Column(String)
+    inv_date = Column(String)
+    due_date = Column(String)
+    total_clients = Column(Integer, default=0)
+    completed_clients = Column(Integer, default=0)
+    skipped_clients = Column(Integer, default=0)
+    invoice_ids = Column(JSON)
+    errors = Column(JSON)
+    created_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+# Database setup. Nothing here connects or even builds an engine at import time:
+# engines are created on first use and the schema is managed by models/migrations.py.
+def database_url() -> str:
+    url = os.getenv("DB_URL")
+    if not url:
+        raise RuntimeError("Missing DB_URL environment variable")
+    return url + "?sslmode=require&gssencmode=disable"
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(database_url(), **engine_options())
+    return _engine
+
+
+def __getattr__(name):
+    # `from models.models import engine` keeps working, building the engine on access
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+
+class LazyBoundSession(Session):
+    """Session that binds to the engine when it first needs a connection."""
+
+    def get_bind(self, mapper=None, **kw):
+        if self.bind is None:
+            self.bind = get_engine()
+        return super().get_bind(mapper, **kw)
+
+
+SessionLocal = sessionmaker(class_=LazyBoundSession, autocommit=False, autoflush=False)
 
 def get_db():
     db = SessionLocal()
@@ -148,3 +221,41 @@ def get_db():
     finally:
         db.close()
 
+
+def async_database_url(url: str):
+    """
+    Translate DB_URL for the asyncio engine: postgresql:// uses asyncpg, and the
+    libpq-only query options are replaced with asyncpg connect arguments.
+    """
+    url = make_url(url)
+    connect_args = {}
+    if url.get_backend_name() == "postgresql":
+        if url.query.get("sslmode") not in (None, "disable"):
+            connect_args["ssl"] = "require"
+        url = url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode", "gssencmode"])
+        if DB_PGBOUNCER:
+            # PgBouncer in transaction mode cannot route server-side prepared statements
+            connect_args["statement_cache_size"] = 0
+            url = url.update_query_dict({"prepared_statement_cache_size": "0"})
+    elif url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite").difference_update_query(["sslmode", "gssencmode"])
+    return url, connect_args
+
+
+# Asyncio engine for non-blocking handlers, created on first use
+_async_engine = None
+AsyncSessionLocal = async_sessionmaker(expire_on_commit=False)
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        url, connect_args = async_database_url(database_url())
+        _async_engine = create_async_engine(url, connect_args=connect_args, **async_engine_options())
+    return _async_engine
+
+
+async def get_async_db():
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        yield db
+
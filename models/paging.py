@@ -0,0 +1,106 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import DateTime, and_, false, or_, tuple_
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+# Rows fetched per round trip when streaming a table
+STREAM_BATCH_SIZE = 500
+
+
+def row_dict(record) -> dict:
+    """Return the loaded column values of an ORM object (deferred columns are skipped)."""
+    return {
+        key: value
+        for key, value in record.__dict__.items()
+        if not key.startswith('_')
+    }
+
+
+def apply_filters(query, model, filters: dict):
+    """Add an equality filter for every filter value that was supplied."""
+    for column, value in filters.items():
+        if value is not None:
+            query = query.filter(getattr(model, column) == value)
+    return query
+
+
+def encode_cursor(record, keys) -> str:
+    values = [getattr(record, key.key) for key in keys]
+    raw = json.dumps(jsonable_encoder(values)).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: str, keys) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if len(values) != len(keys):
+            raise ValueError("cursor does not match the sort keys")
+        return [
+            datetime.fromisoformat(value) if isinstance(key.type, DateTime) and value is not None else value
+            for key, value in zip(keys, values)
+        ]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {str(e)}")
+
+
+def nullable(key) -> bool:
+    return bool(getattr(key.expression, "nullable", False))
+
+
+def order_by_keys(query, keys, descending: bool = False):
+    # Nullable keys sort NULLs last in both directions, on every dialect, so the cursor can skip past them
+    terms = [key.desc() if descending else key.asc() for key in keys]
+    return query.order_by(*[term.nulls_last() if nullable(key) else term for key, term in zip(keys, terms)])
+
+
+def after_cursor(keys, after: list, descending: bool = False):
+    """Filter for the rows that sort strictly after the key values `after` in order_by_keys order."""
+    if not any(nullable(key) for key in keys):
+        boundary = tuple_(*keys) if len(keys) > 1 else keys[0]
+        bound = tuple_(*after) if len(keys) > 1 else after[0]
+        return boundary < bound if descending else boundary > bound
+
+    # A NULL never compares equal, less or greater, so expand the row comparison
+    # key by key, from the last key back: past `value` on this key, or tied on
+    # it and past the cursor on the keys after it. NULLs come after every value.
+    condition = None
+    for key, value in reversed(list(zip(keys, after))):
+        if value is None:
+            condition = and_(key.is_(None), condition if condition is not None else false())
+            continue
+        past = key < value if descending else key > value
+        condition = past if condition is None else or_(past, and_(key == value, condition))
+        if nullable(key):
+            condition = or_(condition, key.is_(None))
+    return condition
+
+
+def keyset_page(query, keys, cursor: str = None, limit: int = 100, descending: bool = False) -> dict:
+    """
+    Fetch one page of rows ordered by `keys`, starting after `cursor`.
+
+    The cursor encodes the sort key values of the last row returned, so a page
+    starts from there instead of an OFFSET over everything before it. Keys that
+    cannot be NULL filter with one row comparison, a range scan on an index over
+    the keys. Nullable keys expand into ORs that no single range covers; they
+    rely on an index matching the sort order (NULLS LAST included) being walked
+    until `limit` rows pass the filter, as migration 0006 adds for client invoices.
+    """
+    if cursor:
+        query = query.filter(after_cursor(keys, decode_cursor(cursor, keys), descending))
+
+    # Fetch one extra row to learn whether another page exists
+    records = order_by_keys(query, keys, descending).limit(limit + 1).all()
+    next_cursor = encode_cursor(records[limit - 1], keys) if len(records) > limit else None
+    return {
+        "items": [row_dict(record) for record in records[:limit]],
+        "next_cursor": next_cursor
+    }
+
+
+def iter_ndjson(query, keys, descending: bool = False, batch_size: int = STREAM_BATCH_SIZE):
+    """Yield every row of `query` as a line of JSON, holding only one batch in memory."""
+    for record in order_by_keys(query, keys, descending).yield_per(batch_size):
+        yield json.dumps(jsonable_encoder(row_dict(record))) + "\n"
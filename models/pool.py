@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from sqlalchemy.pool import NullPool, QueuePool, AsyncAdaptedQueuePool
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Connection pool settings, overridable per dyno through the environment
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", True)
+
+# Behind PgBouncer in transaction mode the bouncer owns pooling: open a fresh
+# client connection per checkout and never rely on server-side prepared statements
+DB_PGBOUNCER = _env_flag("DB_PGBOUNCER", False)
+
+
+class CheckoutStats:
+    """Running totals of how long callers waited to check a connection out of the pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_seconds_total": round(self.total_wait, 6),
+                "wait_seconds_avg": round(self.total_wait / self.checkouts, 6) if self.checkouts else 0.0,
+                "wait_seconds_max": round(self.max_wait, 6)
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records the time spent waiting for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.checkout_stats.record(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+
+class TimedNullPool(NullPool):
+    """NullPool that records the time spent opening each connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.checkout_stats.record(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+
+def engine_options() -> dict:
+    """Keyword arguments for create_engine() built from the DB_POOL_* settings."""
+    if DB_PGBOUNCER:
+        return {"poolclass": TimedNullPool, "pool_pre_ping": False}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+
+
+def pool_metrics(engine) -> dict:
+    """Snapshot of the engine's pool: connection counts and checkout wait times."""
+    pool = engine.pool
+    metrics = {"pool_class": type(pool).__name__, "pgbouncer_mode": DB_PGBOUNCER}
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            "pool_size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0)
+        })
+    stats = getattr(pool, "checkout_stats", None)
+    if stats:
+        metrics.update(stats.to_dict())
+    return metrics
+
+
+def async_engine_options() -> dict:
+    """
+    Keyword arguments for create_async_engine(). The async engine uses
+    SQLAlchemy's asyncio-aware queue pool, so only the sizing is shared.
+    """
+    if DB_PGBOUNCER:
+        return {"poolclass": NullPool, "pool_pre_ping": False}
+    return {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
@@ -0,0 +1,125 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import Table, bindparam, select, update
+from sqlalchemy.orm import Session
+from models.models import Base, SessionLocal
+
+
+class Repository:
+    """
+    Generic record lookups by table name for the tables declared on
+    Base.metadata. Tables are resolved once, when the repository is created,
+    and each statement is built once per (table, column) and reused, so the
+    engine's compiled cache serves every later call and a lookup costs the
+    one query it runs.
+
+    Methods take an optional Session to join the caller's transaction;
+    without one they open and close their own.
+    """
+
+    def __init__(self, metadata=Base.metadata, session_factory=SessionLocal):
+        self.tables: Dict[str, Table] = dict(metadata.tables)
+        self.session_factory = session_factory
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def table(self, table_name: str) -> Table:
+        try:
+            return self.tables[table_name]
+        except KeyError:
+            raise ValueError(f"Unknown table {table_name}")
+
+    def _column(self, table: Table, column_name: str):
+        if column_name not in table.c:
+            raise ValueError(f"Table {table.name} has no column {column_name}")
+        return table.c[column_name]
+
+    def _statement(self, kind: str, table_name: str, column_name: Optional[str] = None):
+        key = (kind, table_name, column_name)
+        statement = self._statements.get(key)
+        if statement is None:
+            table = self.table(table_name)
+            if kind == "all":
+                statement = select(table)
+            elif kind == "eq":
+                statement = select(table).where(self._column(table, column_name) == bindparam("value"))
+            elif kind == "in":
+                statement = select(table).where(self._column(table, column_name).in_(bindparam("values", expanding=True)))
+            elif kind == "update":
+                # SET columns come from the parameter keys; "_id" avoids clashing with the id column
+                statement = update(table).where(self._column(table, column_name) == bindparam("_id"))
+            with self._lock:
+                statement = self._statements.setdefault(key, statement)
+        return statement
+
+    @contextmanager
+    def _session(self, db: Optional[Session], commit: bool = False):
+        if db is not None:
+            yield db
+            return
+        session = self.session_factory()
+        try:
+            yield session
+            if commit:
+                session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def all(self, table_name: str, db: Optional[Session] = None) -> list:
+        with self._session(db) as session:
+            return session.execute(self._statement("all", table_name)).fetchall()
+
+    def find_by_field(self, table_name: str, field_name: str, value, db: Optional[Session] = None) -> list:
+        with self._session(db) as session:
+            return session.execute(self._statement("eq", table_name, field_name), {"value": value}).fetchall()
+
+    def find_by_id(self, table_name: str, record_id, db: Optional[Session] = None):
+        with self._session(db) as session:
+            return session.execute(self._statement("eq", table_name, "id"), {"value": record_id}).first()
+
+    def find_by_name(self, table_name: str, name: str, db: Optional[Session] = None):
+        with self._session(db) as session:
+            return session.execute(self._statement("eq", table_name, "name"), {"value": name}).first()
+
+    def find_many_by_ids(self, table_name: str, record_ids: Iterable, db: Optional[Session] = None) -> dict:
+        """Rows for whichever of `record_ids` exist, keyed by id, in one IN query."""
+        record_ids = list(dict.fromkeys(record_ids))
+        if not record_ids:
+            return {}
+        with self._session(db) as session:
+            rows = session.execute(self._statement("in", table_name, "id"), {"values": record_ids}).fetchall()
+        return {row.id: row for row in rows}
+
+    def update(self, table_name: str, record_id, data: dict, db: Optional[Session] = None) -> int:
+        return self.update_many(table_name, [{"id": record_id, **data}], db)
+
+    def update_many(self, table_name: str, records: List[dict], db: Optional[Session] = None) -> int:
+        """
+        Update rows from dicts holding "id" plus the columns to set. Records
+        setting the same columns go out as one executemany batch. Returns the
+        rows matched, as far as the driver reports executemany row counts.
+        """
+        table = self.table(table_name)
+        batches = {}
+        for record in records:
+            values = {key: value for key, value in record.items() if key != "id"}
+            for key in values:
+                self._column(table, key)
+            if values:
+                batches.setdefault(tuple(sorted(values)), []).append({"_id": record["id"], **values})
+        if not batches:
+            return 0
+        statement = self._statement("update", table_name, "id")
+        updated = 0
+        with self._session(db, commit=True) as session:
+            connection = session.connection()
+            for params in batches.values():
+                updated += connection.execute(statement, params).rowcount
+        return updated
+
+
+repository = Repository()
@@ -0,0 +1,87 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+# scrypt cost: N (CPU/memory, a power of two), r (block size) and p (parallelism).
+# Memory per hash is about 128 * N * r bytes; size N with benchmarks/bench_kdf.py.
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", 2 ** 14))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", 8))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", 1))
+# Hashes run in their own small pool so a burst of logins cannot starve the default threadpool
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _executor
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # hashlib.scrypt releases the GIL, so hashes in the pool run in parallel
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def hash_password_sync(password: str, n: int = PASSWORD_SCRYPT_N, r: int = PASSWORD_SCRYPT_R, p: int = PASSWORD_SCRYPT_P) -> str:
+    """A salted scrypt hash in the form scrypt$N$r$p$salt$key."""
+    salt = os.urandom(SALT_BYTES)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password_sync(password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+    """
+    (matches, needs_rehash) for a password against a stored hash. Legacy
+    unsalted SHA-256 hex digests still verify but always need a rehash, as do
+    scrypt hashes made with other cost parameters than the current ones.
+    """
+    if not stored or password is None:
+        return False, False
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, key = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            matches = hmac.compare_digest(_scrypt(password, _unb64(salt), n, r, p), _unb64(key))
+        except ValueError:
+            print("Malformed scrypt password hash")
+            return False, False
+        return matches, matches and (n, r, p) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    # Compare bytes: compare_digest rejects str arguments with non-ASCII characters, which
+    # a plaintext password saved through /new_user or update_user can contain
+    legacy = hashlib.sha256(password.encode("utf-8")).hexdigest()
+    matches = hmac.compare_digest(legacy.encode("ascii"), stored.encode("utf-8", "surrogatepass"))
+    return matches, matches
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), hash_password_sync, password)
+
+
+async def verify_password(password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), verify_password_sync, password, stored)
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
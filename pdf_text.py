@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Union
+
+from caching import BoundedLRUCache
+
+# Limits on uploaded PDFs; CVs and job descriptions are a few pages
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", 10 * 1024 * 1024))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 50))
+
+# Extraction runs in worker processes, PDF_PAGES_PER_TASK pages per task
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+
+# Extracted text by SHA-256 of the file bytes, so re-uploads skip extraction
+pdf_text_cache = BoundedLRUCache(max_entries=None, max_bytes=int(os.getenv("PDF_CACHE_MAX_BYTES", 16 * 1024 * 1024)))
+
+
+class PDFLimitError(ValueError):
+    """The PDF is larger than PDF_MAX_BYTES or has more than PDF_MAX_PAGES pages."""
+
+
+def _extract_pages(source: Union[bytes, str], start: int, stop: int) -> Tuple[int, List[str]]:
+    """Worker: the document's page count and the text of pages [start, stop) of PDF bytes or a PDF file path."""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    total = len(reader.pages)
+    if total > PDF_MAX_PAGES:
+        return total, []
+    return total, [reader.pages[number].extract_text() or "" for number in range(start, min(stop, total))]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the server process holds threads and open DB connections
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def extract_pdf_text(content: bytes) -> str:
+    """Extract the text of PDF bytes off the event loop; results are cached by content hash."""
+    if len(content) > PDF_MAX_BYTES:
+        raise PDFLimitError(f"PDF is larger than {PDF_MAX_BYTES // (1024 * 1024)} MB")
+    return await _extract(content, hashlib.sha256(content).hexdigest())
+
+
+async def extract_pdf_file(path: str, sha256: str) -> str:
+    """
+    Extract the text of a PDF on disk, e.g. a spooled upload whose hash was
+    computed while it was written. Workers open the file themselves, so the
+    document is never held in the server process.
+    """
+    if os.path.getsize(path) > PDF_MAX_BYTES:
+        raise PDFLimitError(f"PDF is larger than {PDF_MAX_BYTES // (1024 * 1024)} MB")
+    return await _extract(path, sha256)
+
+
+async def _extract(source: Union[bytes, str], key: str) -> str:
+    """
+    The first task reads the page count along with the first pages; any
+    remaining pages are split into ranges extracted in parallel.
+    """
+    cached = pdf_text_cache.get(key)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    total, pages = await loop.run_in_executor(pool, _extract_pages, source, 0, PDF_PAGES_PER_TASK)
+    if total > PDF_MAX_PAGES:
+        raise PDFLimitError(f"PDF has {total} pages; the limit is {PDF_MAX_PAGES}")
+    if total > PDF_PAGES_PER_TASK:
+        rest = await asyncio.gather(*[
+            loop.run_in_executor(pool, _extract_pages, source, start, start + PDF_PAGES_PER_TASK)
+            for start in range(PDF_PAGES_PER_TASK, total, PDF_PAGES_PER_TASK)
+        ])
+        for _, more in rest:
+            pages.extend(more)
+
+    text = "".join(page + "\n" for page in pages)
+    pdf_text_cache.set(key, text)
+    return text
+
+
+async def document_text(content: bytes) -> str:
+    """Decode an uploaded CV or job description as UTF-8, falling back to PDF extraction."""
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return await extract_pdf_text(content)
+
+
+async def document_file_text(path: str, sha256: str) -> str:
+    """document_text for a file on disk; PDFs go to the workers without being read here."""
+    with open(path, "rb") as f:
+        if f.read(5) != b"%PDF-":
+            f.seek(0)
+            try:
+                return (await asyncio.to_thread(f.read)).decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+    return await extract_pdf_file(path, sha256)
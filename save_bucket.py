@@ -1,7 +1,10 @@
+import asyncio
 import os
-import io
+import random
+from pathlib import Path
+from typing import AsyncIterable, Callable, Union, TYPE_CHECKING
+import anyio
 from dotenv import load_dotenv
-import requests
 # Load environment variables from .env file (optional, remove if not using .env)
 load_dotenv()
 
@@ -10,47 +13,177 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SECRET_KEY")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 
+# "supabase", or "local" to keep files in STORAGE_LOCAL_DIR for offline testing
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "bucket")
+# Shared connection pool, per-request timeouts and retries with exponential backoff
+STORAGE_MAX_CONNECTIONS = int(os.getenv("STORAGE_MAX_CONNECTIONS", 20))
+STORAGE_TIMEOUT = float(os.getenv("STORAGE_TIMEOUT", 30))
+STORAGE_CONNECT_TIMEOUT = float(os.getenv("STORAGE_CONNECT_TIMEOUT", 5))
+STORAGE_RETRIES = int(os.getenv("STORAGE_RETRIES", 3))
+STORAGE_BACKOFF = float(os.getenv("STORAGE_BACKOFF", 0.5))
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# httpx (and its certificate bundle) is imported when the first request is made, not at app startup
+if TYPE_CHECKING:
+    import httpx
+
 
 # Validate environment variables
-if not SUPABASE_URL or not SUPABASE_KEY:
+if STORAGE_BACKEND != "local" and (not SUPABASE_URL or not SUPABASE_KEY):
     raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY environment variables")
 
 
-def upload_file(blob, filename, content_type="application/pdf"):
-    try:
-        # Construct the upload URL
-        project_id = SUPABASE_URL.split('//')[1].split('.')[0]
-        upload_url = f"https://{project_id}.supabase.co/storage/v1/object/{BUCKET_NAME}/{filename}"
+class StorageClient:
+    """
+    Supabase storage bucket client. Every call goes through one
+    httpx.AsyncClient, so connections (and their TLS sessions) are kept alive
+    and reused. Connection errors and 408/429/5xx responses are retried with
+    exponential backoff and jitter. A streamed body is retried only when it is
+    given as a callable that re-creates the chunk iterator.
+    """
+
+    def __init__(self, base_url: str, key: str, bucket: str, retries: int = STORAGE_RETRIES, backoff: float = STORAGE_BACKOFF):
+        self.base_url = base_url.rstrip("/")
+        self.key = key
+        self.bucket = bucket
+        self.retries = retries
+        self.backoff = backoff
+        self._client = None
+
+    def _http(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.base_url}/storage/v1/object",
+                headers={"apikey": self.key, "Authorization": f"Bearer {self.key}"},
+                timeout=httpx.Timeout(STORAGE_TIMEOUT, connect=STORAGE_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=STORAGE_MAX_CONNECTIONS, max_keepalive_connections=STORAGE_MAX_CONNECTIONS),
+            )
+        return self._client
+
+    async def _request(self, method: str, path: str, content=None, **kwargs) -> "httpx.Response":
+        import httpx
+        # A one-shot async iterator cannot be sent twice
+        attempts = 1 if hasattr(content, "__aiter__") else self.retries + 1
+        for attempt in range(attempts):
+            try:
+                body = content() if callable(content) else content
+                response = await self._http().request(method, path, content=body, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                    return response
+                print(f"Storage {method} {path} returned {response.status_code}, retrying")
+            except httpx.TransportError as e:
+                if attempt == attempts - 1:
+                    raise
+                print(f"Storage {method} {path} failed: {str(e)}, retrying")
+            await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    def public_url(self, filename: str) -> str:
+        """The public URL of a file in the bucket, without checking that it exists."""
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{filename}"
 
-        # Prepare headers
+    async def upload(self, data: Union[bytes, str, AsyncIterable[bytes], Callable[[], AsyncIterable[bytes]]],
+                     filename: str, content_type: str = "application/pdf") -> str:
+        """
+        Upload (overwriting) a file and return its public URL. An async
+        iterator body, or a callable returning one, is sent with chunked
+        transfer encoding.
+        """
+        import httpx
         headers = {
-            "Authorization": f"Bearer {SUPABASE_KEY}",
             "Content-Type": content_type,
             "x-upsert": "true",  # Overwrite if file exists
             "Cache-Control": "max-age=3600",  # Cache for 1 hour
         }
+        try:
+            response = await self._request("PUT", f"/{self.bucket}/{filename}", content=data, headers=headers)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            print(f"Error uploading blob: {str(e)}")
+            print(f"Response: {e.response.text}")
+            raise
+        except Exception as e:
+            print(f"Unexpected error: {str(e)}")
+            raise
+        return self.public_url(filename)
 
-        # Upload the blob
-        response = requests.put(upload_url, data=blob, headers=headers)
+    async def exists(self, filename: str) -> bool:
+        response = await self._request("HEAD", f"/public/{self.bucket}/{filename}")
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
 
-        # Check response
-        response.raise_for_status()  # Raise an exception for 4xx/5xx errors
+    async def download(self, filename: str) -> bytes:
+        response = await self._request("GET", f"/public/{self.bucket}/{filename}")
+        response.raise_for_status()
+        return response.content
 
-        # Construct the public URL
-        public_url = f"https://{project_id}.supabase.co/storage/v1/object/public/{BUCKET_NAME}/{filename}"
-        
-        # print(f"Blob {filename} uploaded successfully to {BUCKET_NAME}")
-        # print(f"Public URL: {public_url}")
-        return public_url  # Return the public URL
-    except requests.exceptions.RequestException as e:
-        print(f"Error uploading blob: {str(e)}")
-        print(f"Response: {e.response.text if e.response else 'No response'}")
-        raise
-    except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        raise
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class LocalStorageClient:
+    """StorageClient stand-in keeping bucket files under a local directory."""
+
+    def __init__(self, directory: str = STORAGE_LOCAL_DIR):
+        self.directory = Path(directory)
+
+    def _path(self, filename: str) -> Path:
+        path = (self.directory / filename).resolve()
+        if self.directory.resolve() not in path.parents:
+            raise ValueError(f"Invalid filename {filename}")
+        return path
+
+    def public_url(self, filename: str) -> str:
+        return self._path(filename).as_uri()
+
+    async def upload(self, data: Union[bytes, str, AsyncIterable[bytes], Callable[[], AsyncIterable[bytes]]],
+                     filename: str, content_type: str = "application/pdf") -> str:
+        path = self._path(filename)
+        data = data() if callable(data) else data
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".part")
+        with open(tmp, "wb") as f:
+            if isinstance(data, (bytes, str)):
+                f.write(data.encode("utf-8") if isinstance(data, str) else data)
+            else:
+                async for chunk in data:
+                    f.write(chunk)
+        os.replace(tmp, path)
+        return self.public_url(filename)
 
-def get_file(filename):
+    async def exists(self, filename: str) -> bool:
+        return self._path(filename).is_file()
+
+    async def download(self, filename: str) -> bytes:
+        return await asyncio.to_thread(self._path(filename).read_bytes)
+
+    async def aclose(self) -> None:
+        pass
+
+
+storage = LocalStorageClient() if STORAGE_BACKEND == "local" else StorageClient(SUPABASE_URL, SUPABASE_KEY, BUCKET_NAME)
+
+
+def upload_file(blob, filename, content_type="application/pdf"):
+    """
+    Upload from synchronous code running in a FastAPI worker thread (sync
+    endpoints); the upload runs on the event loop with the pooled client.
+    """
+    return anyio.from_thread.run(storage.upload, blob, filename, content_type)
+
+async def upload_stream(chunks, filename, content_type="application/octet-stream"):
+    """
+    Upload from an async iterator of byte chunks without holding the whole
+    file; pass a callable returning the iterator to allow retries.
+    """
+    return await storage.upload(chunks, filename, content_type)
+
+async def get_file(filename):
     """
     Get the public URL for a file in the storage bucket.
     
@@ -58,24 +191,13 @@ def get_file(filename):
         filename (str): The name of the file in the bucket
         
     Returns:
-        str: The public URL of the file
+        str: The public URL of the file, or None if it does not exist
     """
     try:
-        # Construct the public URL for the file
-        file_url = f"{SUPABASE_URL}/storage/v1/object/public/{BUCKET_NAME}/{filename}"
-        
-        # Verify the file exists by making a HEAD request
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        response = requests.head(file_url, headers=headers)
-        
-        if response.status_code == 404:
+        if not await storage.exists(filename):
             print(f"File {filename} not found in bucket {BUCKET_NAME}")
             return None
-            
-        return file_url
+        return storage.public_url(filename)
     except Exception as e:
         print(f"Error getting file URL: {str(e)}")
         return None
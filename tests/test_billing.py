@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.models import Base, Candidate, Client, ClientInvoice, Invoice, Transaction
+from billing import BillingJob, _client_invoice_rows, generate_invoices
+
+
+def make_session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Client.__table__, Candidate.__table__, Transaction.__table__,
+                                             Invoice.__table__, ClientInvoice.__table__])
+    return sessionmaker(bind=engine)()
+
+
+def drifting_periods(start: date, months: int):
+    """Periods as the old generator wrote them: start moved 32 days a month, ending on its month's last day."""
+    periods = []
+    for _ in range(months):
+        month_end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        periods.append((start.strftime('%Y-%m-%d'), month_end.strftime('%Y-%m-%d')))
+        start += timedelta(days=32)
+    return periods
+
+
+def test_rerun_skips_months_invoiced_by_the_drifting_generator():
+    db = make_session()
+    db.add(Transaction(id=1, candidate_id=1, client_id=1, client_price=50.0,
+                       start_date=datetime(2024, 1, 15), end_date=datetime(2024, 6, 30)))
+    # The old generator invoiced the first four periods: Jan 15-31, Feb 16-29, Mar 19-31, Apr 20-30
+    db.add_all([Invoice(txn_id=1, period_start=start, period_end=end, inv_status="PRE")
+                for start, end in drifting_periods(date(2024, 1, 15), 4)])
+    db.commit()
+
+    assert generate_invoices(db, [1])["invoices_written"] == 2
+    new_periods = sorted(start for start, in db.query(Invoice.period_start).filter(Invoice.period_start.like("%-01")))
+    assert new_periods == ["2024-05-01", "2024-06-01"]
+
+    assert generate_invoices(db, [1])["invoices_written"] == 0
+    assert db.query(Invoice).count() == 6
+
+
+def test_month_end_rows_escape_names_and_count_skipped_clients():
+    db = make_session()
+    db.add_all([Client(id=1, name="Acme"), Client(id=2, name="Globex"), Client(id=3, name="Idle")])
+    db.add_all([Candidate(id=1, name="<script>alert(1)</script>"), Candidate(id=2, name="Bob")])
+    db.add_all([Transaction(id=1, candidate_id=1, client_id=1, client_price=50.0, start_date=datetime(2024, 1, 1)),
+                Transaction(id=2, candidate_id=2, client_id=2, client_price=60.0, start_date=datetime(2024, 1, 1))])
+    # Globex is already invoiced for the period; Idle has no transactions and is not counted as skipped
+    db.add_all([ClientInvoice(client_id=2, period_start="2024-05-01", period_end="2024-05-31", inv_hash="h2"),
+                ClientInvoice(client_id=3, period_start="2024-05-01", period_end="2024-05-31", inv_hash="h3")])
+    db.commit()
+
+    job = BillingJob("2024-05-01", "2024-05-31", "2024-05-31", "2024-06-30")
+    rows = _client_invoice_rows(db, job)
+    assert [row["client_id"] for row in rows] == [1]
+    assert "&lt;script&gt;" in rows[0]["explain_str"] and "<script>" not in rows[0]["explain_str"]
+    assert job.skipped_clients == 1
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import time
+from datetime import datetime
+
+# Point the app at a throwaway SQLite database before main builds its engine
+DB_PATH = os.path.join(tempfile.mkdtemp(), "month_end_billing.db")
+os.environ["DB_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ.setdefault("RAYZE_KEY", "test")
+
+from fastapi.testclient import TestClient
+import billing
+import main
+from models.migrations import migrate
+from models.models import Candidate, Client, SessionLocal, Transaction
+
+CLIENT_NAME = "MonthEndCo"
+
+
+def test_job_status_is_read_back_from_the_table_once_finished():
+    migrate()
+    db = SessionLocal()
+    db.add(Client(id=501, name=CLIENT_NAME))
+    db.add(Candidate(id=501, name="Dana"))
+    db.add(Transaction(id=501, candidate_id=501, client_id=501, client_price=80.0, start_date=datetime(2024, 1, 1)))
+    db.commit()
+    db.close()
+    try:
+        with TestClient(main.app) as client:
+            client.post("/register", data={"username": "monthend", "password": "pw"})
+            token = client.post("/generate_token", data={"username": "monthend", "password": "pw"}).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            bad = client.post("/month_end_billing", headers=headers, json={
+                "period_start": "2024-05-01", "period_end": "2024-05-31", "inv_date": "31/05/2024", "due_date": "2024-06-30"
+            })
+            assert bad.status_code == 400
+
+            job_id = client.post("/month_end_billing", headers=headers, json={
+                "period_start": "2024-05-01", "period_end": "2024-05-31", "due_date": "2024-06-30"
+            }).json()["job_id"]
+            for _ in range(100):
+                status = client.get(f"/month_end_billing/{job_id}", headers=headers).json()
+                if status["finished_at"]:
+                    break
+                time.sleep(0.05)
+
+            # Finished jobs are no longer held in memory; another worker would read the same row
+            assert job_id not in billing._running
+            status = client.get(f"/month_end_billing/{job_id}", headers=headers).json()
+            assert status["status"] == "completed"
+            assert status["total_clients"] == status["completed_clients"] >= 1
+            assert len(status["invoice_ids"]) == status["total_clients"]
+            assert client.get("/month_end_billing/unknown", headers=headers).status_code == 404
+    finally:
+        for path in main.PATH_TO_CONTENT.glob(f"Inv_{CLIENT_NAME}_*"):
+            path.unlink()
@@ -0,0 +1,41 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.models import Base, ClientInvoice
+from models.paging import keyset_page, order_by_keys
+
+KEYS = [ClientInvoice.inv_date, ClientInvoice.id]
+DATES = ["2024-01-31", None, "2024-02-29", None, "2024-01-31", "2024-03-31", None]
+
+
+def make_session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[ClientInvoice.__table__])
+    db = sessionmaker(bind=engine)()
+    db.add_all([ClientInvoice(inv_date=inv_date, client_id=1) for inv_date in DATES])
+    db.commit()
+    return db
+
+
+def page_through(db, limit, descending):
+    ids, cursor = [], None
+    while True:
+        page = keyset_page(db.query(ClientInvoice), KEYS, cursor, limit, descending)
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_pages_include_rows_with_null_sort_keys():
+    db = make_session()
+    for descending in (True, False):
+        expected = [invoice.id for invoice in order_by_keys(db.query(ClientInvoice), KEYS, descending).all()]
+        assert sorted(expected) == list(range(1, len(DATES) + 1))
+        for limit in (1, 2, 3, len(DATES)):
+            assert page_through(db, limit, descending) == expected
+
+
+def test_null_sort_keys_come_last():
+    db = make_session()
+    expected = [6, 3, 5, 1, 7, 4, 2]
+    assert page_through(db, 2, descending=True) == expected
@@ -0,0 +1,20 @@
+import hashlib
+from passwords import hash_password_sync, verify_password_sync
+
+
+def test_scrypt_hash_round_trip():
+    stored = hash_password_sync("s3cret", n=2 ** 10)
+    assert verify_password_sync("s3cret", stored)[0]
+    assert verify_password_sync("wrong", stored) == (False, False)
+
+
+def test_legacy_sha256_hash_verifies_and_needs_rehash():
+    stored = hashlib.sha256("s3cret".encode("utf-8")).hexdigest()
+    assert verify_password_sync("s3cret", stored) == (True, True)
+    assert verify_password_sync("wrong", stored) == (False, False)
+
+
+def test_non_ascii_stored_value_is_a_mismatch():
+    assert verify_password_sync("x", "pässword") == (False, False)
+    assert verify_password_sync("pässword", "pässword") == (False, False)
+    assert verify_password_sync("x", "scrypt$16384$8$1$sält$kéy") == (False, False)
@@ -0,0 +1,61 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Point the app at a throwaway SQLite database before main builds its engine
+DB_PATH = os.path.join(tempfile.mkdtemp(), "submit_client_invoice.db")
+os.environ["DB_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ.setdefault("RAYZE_KEY", "test")
+
+from fastapi.testclient import TestClient
+import main
+from models.migrations import migrate
+from models.models import Cashflow, ClientInvoice, SessionLocal
+
+SUBMISSIONS = 8
+CLIENT_NAME = "ParallelSubmitCo"
+
+
+def invoice_payload():
+    return {
+        "inv_date": "2024-05-31", "due_date": "2024-06-30",
+        "period_start": "2024-05-01", "period_end": "2024-05-31",
+        "client_id": 42, "client_name": CLIENT_NAME, "client_contact": "Ann",
+        "client_email": "ann@example.com", "client_addr": "1 Main St", "client_phone": "555-0100",
+        "explain_str": "<tr><td>Dev</td></tr>", "inv_html": "", "inv_hash": "",
+        "inv_value": 1000.0, "inv_status": "PRE"
+    }
+
+
+def test_parallel_submissions_create_one_invoice():
+    migrate()
+    try:
+        with TestClient(main.app) as client:
+            client.post("/register", data={"username": "biller", "password": "pw"})
+            token = client.post("/generate_token", data={"username": "biller", "password": "pw"}).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            with ThreadPoolExecutor(max_workers=SUBMISSIONS) as pool:
+                responses = list(pool.map(
+                    lambda _: client.post("/submit_client_invoice", json=invoice_payload(), headers=headers),
+                    range(SUBMISSIONS)
+                ))
+
+        statuses = sorted(response.status_code for response in responses)
+        assert statuses == [200] + [409] * (SUBMISSIONS - 1)
+        assert all("already invoiced" in response.json()["detail"] for response in responses if response.status_code == 409)
+
+        db = SessionLocal()
+        try:
+            invoices = db.query(ClientInvoice).filter(ClientInvoice.client_id == 42).all()
+            assert len(invoices) == 1
+            assert invoices[0].inv_html and invoices[0].inv_hash
+            assert f">{invoices[0].id}<" in invoices[0].inv_html
+            # Submitting an invoice never books cashflows, so a rejected submission cannot leave any behind
+            assert db.query(Cashflow).count() == 0
+        finally:
+            db.close()
+    finally:
+        for path in main.PATH_TO_CONTENT.glob(f"Inv_{CLIENT_NAME}_*"):
+            path.unlink()
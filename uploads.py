@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from fastapi import UploadFile
+
+# Uploads are read, hashed and forwarded this many bytes at a time
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 256 * 1024))
+
+
+class UploadTooLarge(ValueError):
+    """The upload is larger than the endpoint's byte limit."""
+
+
+@dataclass
+class UploadDigest:
+    """Running SHA-256 and size of an upload, final once its chunks are exhausted."""
+    sha256: str = ""
+    size: int = 0
+
+
+async def upload_chunks(upload: UploadFile, digest: Optional[UploadDigest] = None,
+                        max_bytes: Optional[int] = None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Yield an upload chunk by chunk, hashing as it goes, so only one chunk is
+    held in memory. Raises UploadTooLarge as soon as `max_bytes` is passed.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise UploadTooLarge(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+        hasher.update(chunk)
+        if digest is not None:
+            digest.size = size
+        yield chunk
+    if digest is not None:
+        digest.sha256 = hasher.hexdigest()
+        digest.size = size
+
+
+@dataclass
+class SpooledUpload:
+    """An upload copied to a named temporary file that worker processes can open."""
+    path: str
+    filename: Optional[str]
+    sha256: str
+    size: int
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(upload: UploadFile, max_bytes: Optional[int] = None) -> SpooledUpload:
+    """Copy an upload to a temporary file in chunks; the caller removes it."""
+    if max_bytes is not None and upload.size and upload.size > max_bytes:
+        raise UploadTooLarge(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+    digest = UploadDigest()
+    fd, path = tempfile.mkstemp(prefix="upload-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in upload_chunks(upload, digest, max_bytes):
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path, upload.filename, digest.sha256, digest.size)
+
+
+@asynccontextmanager
+async def spooled(upload: UploadFile, max_bytes: Optional[int] = None) -> AsyncIterator[SpooledUpload]:
+    spooled_file = await spool_upload(upload, max_bytes)
+    try:
+        yield spooled_file
+    finally:
+        spooled_file.remove()